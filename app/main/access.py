@@ -0,0 +1,43 @@
+"""
+Who can see whose cook books.
+
+Users can read each other's collections when they share a meal plan. When the
+default cache is shared by every worker (redis), each user's co-members are cached
+as a set of user ids, so access checks are a set lookup instead of an aggregate
+query, and membership signals invalidate the sets of everyone in the affected plan.
+A per-process cache couldn't be invalidated on the other workers, so without one
+the set is read from the database on every check.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .caches import is_shared
+from .models import Membership
+
+def co_member_cache_key(user_id):
+    return f"co_members:{user_id}"
+
+def co_member_ids(user):
+    """IDs of the other users who share at least one meal plan with user"""
+    shared = is_shared()
+    key = co_member_cache_key(user.id)
+    ids = cache.get(key) if shared else None
+    if ids is None:
+        ids = list(Membership.objects.filter(
+            meal_plan__memberships__user=user
+        ).exclude(user=user).values_list('user_id', flat=True).distinct())
+        if shared:
+            cache.set(key, ids, settings.CO_MEMBER_CACHE_TTL)
+    return frozenset(ids)
+
+def can_access_user(user, owner_id):
+    """Whether user may see content owned by owner_id: their own, or a co-member's"""
+    return owner_id == user.id or owner_id in co_member_ids(user)
+
+def invalidate_co_members(meal_plan_id, *user_ids):
+    """Drop the cached co-member sets of everyone in a meal plan, plus any extra users"""
+    member_ids = set(Membership.objects.filter(meal_plan_id=meal_plan_id).values_list('user_id', flat=True))
+    keys = [co_member_cache_key(user_id) for user_id in member_ids | set(user_ids)]
+    cache.delete_many(keys)
+    # A concurrent request may refill a set from pre-commit data, so drop them again once committed
+    transaction.on_commit(lambda: cache.delete_many(keys))
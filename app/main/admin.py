@@ -6,7 +6,10 @@ from .models import (
     Ingredient,
     MethodStep,
     MealPlan,
-    Membership
+    Membership,
+    RecipeImportJob,
+    RecipeParseCacheEntry,
+    CacheCounter
 )
 
 class IngredientInline(admin.TabularInline):
@@ -48,4 +51,22 @@ class MealPlanAdmin(admin.ModelAdmin):
 class MembershipAdmin(admin.ModelAdmin):
     list_display = ('user', 'meal_plan', 'joined_at')
     search_fields = ('user__username', 'meal_plan__name')
-    list_filter = ('meal_plan', 'joined_at') 
\ No newline at end of file
+    list_filter = ('meal_plan', 'joined_at') 
+
+@admin.register(RecipeImportJob)
+class RecipeImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'collection', 'status', 'created_at')
+    search_fields = ('user__username', 'collection__title')
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('id', 'created_at', 'updated_at')
+
+@admin.register(RecipeParseCacheEntry)
+class RecipeParseCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'hits', 'created_at', 'last_used_at')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'created_at', 'last_used_at', 'hits')
+
+@admin.register(CacheCounter)
+class CacheCounterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'hits', 'misses', 'hit_ratio')
+    readonly_fields = ('name', 'hits', 'misses')
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Caches for AI results.
+
+Recipe parses are cached in the database. Entries are keyed on a sha256 of the normalized recipe text, digests of the photos
+and a version string for the prompt and model, so changing the prompt naturally
+invalidates old results. Entries expire after AI_PARSE_CACHE_TTL seconds and the
+least recently used are evicted beyond AI_PARSE_CACHE_MAX_ENTRIES.
+
+Grocery lists are memoized in the AI results cache, keyed on the plan's ingredients and
+the instruction, with single-flight locking so members generating the same list
+at once share one AI call.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from .models import RecipeParseCacheEntry
+from .caches import AI_RESULTS, record_lookups
+from .images import media_storage_name
+
+logger = logging.getLogger(__name__)
+
+RECIPE_PARSE_COUNTER = 'recipe_parse'
+GROCERY_LIST_COUNTER = 'grocery_list'
+SINGLE_FLIGHT_POLL_INTERVAL = 0.1  # seconds between checks while another request computes
+
+def normalize_text(text):
+    """Collapse whitespace so reformatting the same text maps to the same key"""
+    return ' '.join((text or '').split())
+
+def photo_digest(photo):
+    """
+    Digest a photo by content where we can read it cheaply.
+
+    Data URLs and local media files are hashed by their bytes. Photos in our S3 bucket
+    are hashed by storage name, since their signed URLs differ on every call, which is
+    stable because uploads are stored under unique names. Other URLs are hashed as is.
+    """
+    if photo.startswith('data:'):
+        _, _, data = photo.partition(',')
+        return hashlib.sha256(base64.b64decode(data)).hexdigest()
+
+    if photo.startswith('/'):
+        name = photo.lstrip('/').removeprefix(settings.MEDIA_URL.strip('/') + '/')
+        file_path = os.path.join(settings.MEDIA_ROOT, name)
+        try:
+            with open(file_path, 'rb') as image_file:
+                return hashlib.file_digest(image_file, 'sha256').hexdigest()
+        except OSError:
+            pass
+
+    name = media_storage_name(photo)
+    if name is not None:
+        return hashlib.sha256(f"media:{name}".encode('utf-8')).hexdigest()
+
+    return hashlib.sha256(photo.encode('utf-8')).hexdigest()
+
+def recipe_parse_cache_key(raw_text, photos, version):
+    """Build the content-addressed key for a parse request"""
+    payload = json.dumps({
+        'text': normalize_text(raw_text),
+        'photos': [photo_digest(photo) for photo in photos or []],
+        'version': version,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def record_hit(name):
+    record_lookups(name, 1, 0)
+
+def record_miss(name):
+    record_lookups(name, 0, 1)
+
+def get_cached_parse(key):
+    """Return the cached parse result for a key, or None on a miss"""
+    expires_before = timezone.now() - timedelta(seconds=settings.AI_PARSE_CACHE_TTL)
+    entry = RecipeParseCacheEntry.objects.filter(key=key, created_at__gte=expires_before).first()
+    if entry is None:
+        record_miss(RECIPE_PARSE_COUNTER)
+        return None
+
+    RecipeParseCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=timezone.now(), hits=F('hits') + 1)
+    record_hit(RECIPE_PARSE_COUNTER)
+    return entry.result
+
+def store_parse(key, result):
+    """Store a parse result and evict expired and least recently used entries"""
+    RecipeParseCacheEntry.objects.update_or_create(
+        key=key,
+        defaults={'result': result, 'created_at': timezone.now(), 'last_used_at': timezone.now()},
+    )
+    evict_parse_cache()
+
+def evict_parse_cache():
+    expires_before = timezone.now() - timedelta(seconds=settings.AI_PARSE_CACHE_TTL)
+    RecipeParseCacheEntry.objects.filter(created_at__lt=expires_before).delete()
+
+    stale = RecipeParseCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[settings.AI_PARSE_CACHE_MAX_ENTRIES:]
+    stale_ids = list(stale)
+    if stale_ids:
+        RecipeParseCacheEntry.objects.filter(pk__in=stale_ids).delete()
+        logger.info(f"Evicted {len(stale_ids)} recipe parse cache entries")
+
+def grocery_list_cache_key(rows, instruction, version):
+    """Fingerprint a grocery list request by its meals, their ingredient rows and the instruction"""
+    payload = json.dumps({
+        'meals': sorted({row.recipe__meal_id for row in rows}),
+        'ingredients': sorted([row.recipe__meal_id, row.name, row.amount or '', row.unit or '', row.recipe_title, row.meal_title] for row in rows),
+        'instruction': normalize_text(instruction),
+        'version': version,
+    }, sort_keys=True)
+    return f"grocery_list:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+def single_flight(key, compute, counter, timeout, lock_timeout):
+    """
+    Return the cached value for key, computing and caching it for timeout seconds on a miss.
+
+    Only one caller computes a given key at a time; others wait for its result for
+    up to lock_timeout seconds and compute it themselves if it never arrives, e.g.
+    because the first caller failed.
+    """
+    cache = caches[AI_RESULTS]
+    missing = object()
+
+    value = cache.get(key, missing)
+    if value is not missing:
+        record_hit(counter)
+        return value
+
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + lock_timeout
+    while not cache.add(lock_key, 1, lock_timeout):
+        if time.monotonic() > deadline:
+            logger.warning(f"Timed out waiting for {key}, computing it again")
+            break
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        value = cache.get(key, missing)
+        if value is not missing:
+            record_hit(counter)
+            return value
+    else:
+        # The lock holder may have finished between our last look and taking the lock
+        value = cache.get(key, missing)
+        if value is not missing:
+            cache.delete(lock_key)
+            record_hit(counter)
+            return value
+
+    record_miss(counter)
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
@@ -0,0 +1,139 @@
+"""
+Process-wide client for the AI backend.
+
+Creating an OpenAI client per call throws away its connection pool, so every
+request paid for a new TLS handshake. get_openai_client builds one client per
+process with keep-alive pooling, a timeout and the SDK's retries with exponential
+backoff. Setting AI_BACKEND = 'fake' swaps in FakeOpenAI, which answers locally so
+tests and benchmarks can run the whole import and grocery list path offline.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Return the shared client for the configured AI backend, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+def _create_client():
+    if settings.AI_BACKEND == 'fake':
+        return FakeOpenAI(latency=settings.AI_FAKE_LATENCY)
+
+    import httpx
+    from openai import OpenAI, DefaultHttpxClient
+
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY or None,
+        timeout=settings.AI_TIMEOUT,
+        max_retries=settings.AI_MAX_RETRIES,
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+        ),
+    )
+
+def reset_openai_client():
+    """Drop the shared client so the next call picks up new settings"""
+    global _client
+    with _client_lock:
+        if _client is not None and hasattr(_client, 'close'):
+            _client.close()
+        _client = None
+
+@receiver(setting_changed)
+def _reset_on_setting_change(sender, setting, **kwargs):
+    if setting.startswith('AI_') or setting == 'OPENAI_API_KEY':
+        reset_openai_client()
+
+
+class FakeOpenAI:
+    """
+    Offline stand-in for the OpenAI client.
+
+    Implements chat.completions.create for the two prompts we send. Recipe parsing
+    (system prompt asking for structured JSON) gets a recipe read from the text's
+    ingredient and method lines; anything else, i.e. the grocery list, gets the
+    ingredient CSV back as a bulleted list. Supports stream=True.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def close(self):
+        pass
+
+    def create(self, model, messages, stream=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+
+        system = _message_text(messages[0])
+        user = _message_text(messages[-1])
+        if 'structured JSON' in system:
+            content = f"```json\n{json.dumps(fake_recipe(user))}\n```"
+        else:
+            content = fake_grocery_list(user)
+
+        if stream:
+            return _stream(content)
+        message = SimpleNamespace(role='assistant', content=content)
+        return SimpleNamespace(
+            id=f"fake-{uuid.uuid4()}",
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason='stop')],
+        )
+
+def _message_text(message):
+    content = message['content']
+    if isinstance(content, str):
+        return content
+    return '\n'.join(part['text'] for part in content if part.get('type') == 'text')
+
+def _stream(content, size=16):
+    for i in range(0, len(content), size):
+        delta = SimpleNamespace(content=content[i:i + size])
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+
+LIST_ITEM = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+(.*\S)')
+
+def fake_recipe(text):
+    """Read a recipe from plain text: first line is the title, bullets are ingredients, numbered lines are steps"""
+    from .structured_recipes import parse_ingredient_line
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    # Skip the instruction line we prepend to every request
+    lines = [line for line in lines if not line.startswith('Please analyze')]
+    title = lines[0].strip().lstrip('#').strip() if lines else 'Imported Recipe'
+
+    ingredients, method = [], []
+    for line in lines[1:]:
+        match = LIST_ITEM.match(line)
+        if not match:
+            continue
+        if re.match(r'^\s*\d+[.)]', line):
+            method.append(match.group(1))
+        else:
+            ingredients.append(parse_ingredient_line(match.group(1)))
+
+    return {
+        'title': title,
+        'description': '',
+        'recipes': [{'title': title, 'description': '', 'ingredients': ingredients, 'method': method}],
+    }
+
+def fake_grocery_list(ingredient_csv):
+    rows = ingredient_csv.splitlines()[1:]
+    return '\n'.join(f"- {row.split(',')[0].strip()} ({row.split(',')[1].strip()})" for row in rows if row.strip())
@@ -1,16 +1,48 @@
 import os
 import json
 import base64
+import hashlib
 import requests
-from openai import OpenAI
 from django.conf import settings
 import re
+import time
 import logging
 import ipdb
 from bs4 import BeautifulSoup
+from .ai_cache import recipe_parse_cache_key, get_cached_parse, store_parse, grocery_list_cache_key, single_flight, GROCERY_LIST_COUNTER
+from .ai_client import get_openai_client
+from .images import encode_data_url, file_chunks, presigned_media_url, BASE64_CHUNK_SIZE
+from .utils import LRUCache
+from .grocery import consolidate_ingredients, format_grocery_list, refresh_meal_in_grocery_lists
 
 logger = logging.getLogger(__name__)
 
+RECIPE_PARSE_MODEL = "gpt-4o"
+RECIPE_PARSE_PROMPT = """
+Parse the following recipe information into structured JSON. 
+The meal JSON contains a title, a description, and an array of recipes. 
+The description should be drawn from the content and also list key tips from reviewer comments if available. 
+The meal contains an array of recipes. 
+Even though most recipe plans contain only one recipe, some have multiple recipes such as sauces, salads, sides or drinks. 
+Each recipe has a title, an optional description, an array of ingredients, and a method as an array of steps. 
+Each ingredient has a name, an amount, and a unit. 
+Units are standard like cups, tablespoons, teaspoons, grams, pounds, ounces, but using standard abbreviations. 
+Convert fractional amounts to decimals. Amounts should be quoted. 
+Example format: {"title": "Meal Title", "description": "Description of the meal", "recipes": [{"title": "Recipe Title", "description": "Description of the recipe", "ingredients": [{"name": "ingredient1", "amount": "1", "unit": "cup"}, {"name": "ingredient2", "amount": "2", "unit": "tbsp"}], "method": ["Step 1", "Step 2"]}]}"""
+
+PROGRESS_INTERVAL = 0.5  # seconds between streamed progress updates
+
+# Bump when the request sent to the model changes in a way the prompt text doesn't capture
+RECIPE_PARSE_VERSION = f"{RECIPE_PARSE_MODEL}:1:{hashlib.sha256(RECIPE_PARSE_PROMPT.encode('utf-8')).hexdigest()[:12]}"
+
+GROCERY_LIST_MODEL = "gpt-4o-mini"
+GROCERY_LIST_PROMPT = """Organize the following ingredients into a sensible shopping list grouped by supermarket sections. 
+The input is in CSV format with columns: Ingredient, Amount, Meals.
+The ingredients are sorted alphabetically and amounts for the same ingredient have already been added up.
+Please merge any remaining similar ingredients and their amounts when possible.
+{instruction}"""
+GROCERY_LIST_VERSION = f"{GROCERY_LIST_MODEL}:1:{hashlib.sha256(GROCERY_LIST_PROMPT.encode('utf-8')).hexdigest()[:12]}"
+
 def extract_json(response_text):
     """
     Extracts JSON data from the given response text.
@@ -62,25 +94,137 @@ def extract_json(response_text):
         logger.debug(f"Failed JSON string: {json_str}")
         raise ValueError(f"JSON decoding failed: {e}")
 
+def _json_closers(stack):
+    return ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+
+def parse_partial_json(response_text):
+    """
+    Best-effort parse of a JSON object that is still being streamed.
+
+    Closes any open string, objects and arrays and, if that isn't valid yet (say the
+    text ends mid-key), backs up to the last complete element. Returns None when
+    nothing usable has arrived.
+    """
+    start = response_text.find('{')
+    if start == -1:
+        return None
+    text = response_text[start:]
+
+    stack = []
+    cut_points = []  # (index, stack) where the text can be truncated and closed
+    in_string = escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+            cut_points.append((i + 1, list(stack)))
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                text = text[:i + 1]
+                break
+            cut_points.append((i + 1, list(stack)))
+        elif ch == ',':
+            cut_points.append((i, list(stack)))
+
+    tail = text.rstrip('\\') + '"' if in_string else text
+    candidates = [tail + _json_closers(stack)]
+    candidates += [text[:index] + _json_closers(open_stack) for index, open_stack in reversed(cut_points[-3:])]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def summarize_partial_recipe(data):
+    """Count what the model has produced so far for progress updates"""
+    if not isinstance(data, dict):
+        return {}
+    recipes = [r for r in data.get('recipes') or [] if isinstance(r, dict)]
+    return {
+        'title': data.get('title') if isinstance(data.get('title'), str) else '',
+        'recipes': len(recipes),
+        'ingredients': sum(len(r.get('ingredients') or []) for r in recipes),
+        'steps': sum(len(r.get('method') or []) for r in recipes),
+    }
+
+# Encoded data URLs of local and remote images, so retries and re-parses don't reread and re-encode them
+image_data_url_cache = LRUCache(settings.IMAGE_DATA_URL_CACHE_MAX_BYTES, sizeof=lambda entry: len(entry['data_url']))
+
 def get_image_as_base64(url):
-    """Convert an image URL to base64 if it's a local URL"""
+    """
+    Convert an image URL to a base64 data URL, streaming it through the encoder.
+
+    Results are cached against the file's modification time and size, or the remote
+    image's ETag or Last-Modified, which are revalidated with a conditional request.
+    """
     if url.startswith('data:'):
         # Already a data URL, just return it
         return url
         
     if url.startswith('/'):
         # Local URL, read the file from disk
-        file_path = os.path.join(settings.MEDIA_ROOT, url.lstrip('/media/'))
+        name = url.lstrip('/').removeprefix(settings.MEDIA_URL.strip('/') + '/')
+        file_path = os.path.join(settings.MEDIA_ROOT, name)
+        stat = os.stat(file_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = image_data_url_cache.get(file_path)
+        if cached and cached['version'] == version:
+            return cached['data_url']
+
         with open(file_path, 'rb') as image_file:
-            base64_data = base64.b64encode(image_file.read()).decode('utf-8')
-            return f"data:image/jpeg;base64,{base64_data}"
-    else:
-        # Remote URL, download and convert
-        response = requests.get(url)
-        base64_data = base64.b64encode(response.content).decode('utf-8')
-        return f"data:image/jpeg;base64,{base64_data}"
+            data_url = encode_data_url(file_chunks(image_file))
+        image_data_url_cache.set(file_path, {'version': version, 'data_url': data_url})
+        return data_url
+
+    # Remote URL, download and convert unless our copy is still current
+    cached = image_data_url_cache.get(url)
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    with requests.get(url, stream=True, timeout=settings.AI_IMAGE_FETCH_TIMEOUT, headers=headers) as response:
+        if response.status_code == 304 and cached:
+            return cached['data_url']
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0]
+        mime_type = content_type if content_type.startswith('image/') else 'image/jpeg'
+        data_url = encode_data_url(response.iter_content(BASE64_CHUNK_SIZE), mime_type)
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    # Without a validator we couldn't tell if the image changed, so don't keep it
+    if etag or last_modified:
+        image_data_url_cache.set(url, {'etag': etag, 'last_modified': last_modified, 'data_url': data_url})
+    return data_url
+
+def image_url_for_ai(photo):
+    """
+    How to hand a photo to the model.
+
+    With AI_IMAGE_DELIVERY = 'presigned', photos in our S3 bucket are sent as freshly
+    signed URLs so the model fetches them itself and we never hold the bytes; other
+    remote URLs are sent as they are. Local media can't be reached by the model, and
+    with 'data_url' (development) everything is inlined as a base64 data URL.
+    """
+    if photo.startswith('data:'):
+        return photo
+    if settings.AI_IMAGE_DELIVERY == 'presigned' and not photo.startswith('/'):
+        return presigned_media_url(photo, settings.AI_IMAGE_URL_EXPIRY) or photo
+    return get_image_as_base64(photo)
 
-def parse_recipe_with_genai(raw_text=None, photos=None):
+def parse_recipe_with_genai(raw_text=None, photos=None, on_progress=None):
     """
     Parse recipe information from text and/or photos using GPT-4.
     At least one of raw_text or photos must be provided.
@@ -88,6 +232,8 @@ def parse_recipe_with_genai(raw_text=None, photos=None):
     Args:
         raw_text (str, optional): Recipe text from URL or user input
         photos (list, optional): List of image URLs or data URLs
+        on_progress (callable, optional): When given, the completion is streamed and
+            this is called with summarize_partial_recipe output as the recipe fills in
         
     Returns:
         dict: Structured recipe data
@@ -95,9 +241,14 @@ def parse_recipe_with_genai(raw_text=None, photos=None):
     if not raw_text and not photos:
         raise ValueError("Must provide either text or photos to parse recipe")
 
-    client = OpenAI(
-        api_key=os.getenv('OPENAI_API_KEY')
-    )
+    # Identical text and photos give the same answer, skip the round trip
+    cache_key = recipe_parse_cache_key(raw_text, photos, RECIPE_PARSE_VERSION)
+    cached = get_cached_parse(cache_key)
+    if cached is not None:
+        logger.info(f"Recipe parse cache hit {cache_key[:12]}")
+        return cached
+
+    client = get_openai_client()
 
     # Build the messages array with system prompt
     messages = [
@@ -105,17 +256,7 @@ def parse_recipe_with_genai(raw_text=None, photos=None):
             "role": "system", 
             "content": [{
                 "type": "text",
-                "text": """
-Parse the following recipe information into structured JSON. 
-The meal JSON contains a title, a description, and an array of recipes. 
-The description should be drawn from the content and also list key tips from reviewer comments if available. 
-The meal contains an array of recipes. 
-Even though most recipe plans contain only one recipe, some have multiple recipes such as sauces, salads, sides or drinks. 
-Each recipe has a title, an optional description, an array of ingredients, and a method as an array of steps. 
-Each ingredient has a name, an amount, and a unit. 
-Units are standard like cups, tablespoons, teaspoons, grams, pounds, ounces, but using standard abbreviations. 
-Convert fractional amounts to decimals. Amounts should be quoted. 
-Example format: {"title": "Meal Title", "description": "Description of the meal", "recipes": [{"title": "Recipe Title", "description": "Description of the recipe", "ingredients": [{"name": "ingredient1", "amount": "1", "unit": "cup"}, {"name": "ingredient2", "amount": "2", "unit": "tbsp"}], "method": ["Step 1", "Step 2"]}]}"""
+                "text": RECIPE_PARSE_PROMPT
             }]
         }   
     ]
@@ -137,11 +278,7 @@ Example format: {"title": "Meal Title", "description": "Description of the meal"
     # Add photos if provided
     if photos:
         for photo in photos:
-            # In development or if URL is local, convert to base64
-            if (settings.DEBUG or (isinstance(photo, str) and photo.startswith('/'))):
-                photo_url = get_image_as_base64(photo)
-            else:
-                photo_url = photo
+            photo_url = image_url_for_ai(photo)
             
             content.append({
                 "type": "text",
@@ -163,21 +300,59 @@ Example format: {"title": "Meal Title", "description": "Description of the meal"
 
     # Call GPT-4 with appropriate parameters
     response = client.chat.completions.create(
-        model="gpt-4o",
+        model=RECIPE_PARSE_MODEL,
         messages=messages,
         max_tokens=4096,
         temperature=0.8,  # Balance between creativity and consistency
         presence_penalty=0.0,  # No need to encourage topic changes
-        frequency_penalty=0.0  # No need to discourage repetition
+        frequency_penalty=0.0,  # No need to discourage repetition
+        stream=bool(on_progress)
     )
-    
+
+    if on_progress:
+        response_text = consume_stream(response, on_progress)
+    else:
+        response_text = response.choices[0].message.content
+
     # Extract and parse the JSON response
-    result = extract_json(response.choices[0].message.content)
+    result = extract_json(response_text)
     if not result:
         raise ValueError("Failed to parse recipe information")
-        
+
+    store_parse(cache_key, result)
     return result
 
+def consume_stream(stream, on_progress):
+    """
+    Collect a streamed completion, reporting partial recipe progress as it arrives.
+
+    Progress is reported at most every PROGRESS_INTERVAL seconds and only when it changes.
+    """
+    parts = []
+    last_progress = None
+    last_reported_at = 0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+
+        now = time.monotonic()
+        if now - last_reported_at < PROGRESS_INTERVAL:
+            continue
+        progress = summarize_partial_recipe(parse_partial_json(''.join(parts)))
+        if progress and progress != last_progress:
+            on_progress(progress)
+            last_progress, last_reported_at = progress, now
+
+    response_text = ''.join(parts)
+    progress = summarize_partial_recipe(parse_partial_json(response_text))
+    if progress and progress != last_progress:
+        on_progress(progress)
+    return response_text
+
 def format_meal_as_markdown(meal):
     """
     Convert a meal object to a markdown-formatted text representation.
@@ -209,12 +384,124 @@ def format_meal_as_markdown(meal):
     
     return meal_text
 
+RECIPE_FIELDS = ['title', 'description']
+INGREDIENT_FIELDS = ['name', 'amount', 'unit']
+METHOD_STEP_FIELDS = ['description']
+
+def _new_recipe(meal, recipe):
+    from .models import Recipe
+    return Recipe(meal=meal, title=recipe.get('title', ''), description=recipe.get('description', ''))
+
+def _new_recipe_children(recipe_obj, recipe):
+    """Build the unsaved ingredients and method steps for a recipe"""
+    from .models import Ingredient, MethodStep
+    ingredients = [
+        Ingredient(
+            recipe=recipe_obj,
+            name=ing_data.get('name', ''),
+            amount=ing_data.get('amount', None),
+            unit=ing_data.get('unit', '')
+        )
+        for ing_data in recipe.get('ingredients', [])
+    ]
+    method_steps = [MethodStep(recipe=recipe_obj, description=step_data.strip()) for step_data in recipe.get('method', [])]
+    return ingredients, method_steps
+
+def _insert_recipes(recipes):
+    """Insert recipes, in one statement when the backend can hand back their PKs"""
+    from django.db import connection
+    from .models import Recipe
+    if connection.features.can_return_rows_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+    else:
+        for recipe_obj in recipes:
+            recipe_obj.save()
+
+def _diff_rows(existing, wanted, fields):
+    """
+    Match existing rows to wanted rows by position.
+
+    Changed values are copied onto the existing rows so they keep their PKs.
+    Returns (changed, added, removed): existing rows needing an UPDATE, wanted
+    rows beyond the existing ones to INSERT and existing rows beyond the wanted
+    ones to DELETE.
+    """
+    changed = []
+    for row, wanted_row in zip(existing, wanted):
+        values = {field: row._meta.get_field(field).to_python(getattr(wanted_row, field)) for field in fields}
+        if any(getattr(row, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(row, field, value)
+            changed.append(row)
+    return changed, wanted[len(existing):], existing[len(wanted):]
+
+def _apply_row_changes(model, changed, added, removed, fields):
+    """Write a diff with at most one UPDATE, INSERT and DELETE"""
+    if removed:
+        model.objects.filter(pk__in=[row.pk for row in removed]).delete()
+    if changed:
+        model.objects.bulk_update(changed, fields)
+    if added:
+        model.objects.bulk_create(added)
+
+def _create_meal_rows(meal, recipe_data):
+    """Create the recipes, then all their ingredients and steps in one INSERT each"""
+    from .models import Ingredient, MethodStep
+    recipes = recipe_data.get('recipes', [])
+    recipe_objs = [_new_recipe(meal, recipe) for recipe in recipes]
+    _insert_recipes(recipe_objs)
+
+    ingredients, method_steps = [], []
+    for recipe_obj, recipe in zip(recipe_objs, recipes):
+        recipe_ingredients, recipe_steps = _new_recipe_children(recipe_obj, recipe)
+        ingredients.extend(recipe_ingredients)
+        method_steps.extend(recipe_steps)
+    Ingredient.objects.bulk_create(ingredients)
+    MethodStep.objects.bulk_create(method_steps)
+
+def _update_meal_rows(meal, recipe_data):
+    """
+    Bring a meal's recipes, ingredients and steps in line with recipe_data.
+
+    Rows are matched by position and only those that differ are written, so fixing a
+    typo is a single UPDATE and untouched rows keep their PKs.
+    """
+    from django.db.models import Prefetch
+    from .models import Recipe, Ingredient, MethodStep
+
+    existing = list(meal.recipes.order_by('id').prefetch_related(
+        Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+        Prefetch('method_steps', queryset=MethodStep.objects.order_by('id')),
+    ))
+    recipes = recipe_data.get('recipes', [])
+    changed, added, removed = _diff_rows(existing, [_new_recipe(meal, recipe) for recipe in recipes], RECIPE_FIELDS)
+    if removed:
+        Recipe.objects.filter(pk__in=[recipe_obj.pk for recipe_obj in removed]).delete()
+    if changed:
+        Recipe.objects.bulk_update(changed, RECIPE_FIELDS)
+    _insert_recipes(added)
+
+    ingredient_diff, step_diff = ([], [], []), ([], [], [])
+    for index, (recipe_obj, recipe) in enumerate(zip(existing + added, recipes)):
+        ingredients, method_steps = _new_recipe_children(recipe_obj, recipe)
+        is_new = index >= len(existing)
+        for totals, rows, wanted, fields in (
+            (ingredient_diff, recipe_obj.ingredients.all(), ingredients, INGREDIENT_FIELDS),
+            (step_diff, recipe_obj.method_steps.all(), method_steps, METHOD_STEP_FIELDS),
+        ):
+            diff = ([], wanted, []) if is_new else _diff_rows(list(rows), wanted, fields)
+            for total, part in zip(totals, diff):
+                total.extend(part)
+
+    _apply_row_changes(Ingredient, *ingredient_diff, INGREDIENT_FIELDS)
+    _apply_row_changes(MethodStep, *step_diff, METHOD_STEP_FIELDS)
+
 def _create_or_update_meal_from_data(recipe_data, meal=None, collection=None):
     """
     Internal helper to create or update a meal from recipe data.
     This handles the common logic for both save_parsed_recipe and create_meal_from_recipe_data.
     """
-    from .models import Meal, Recipe, Ingredient, MethodStep
+    from .models import Meal
     
     if not meal:
         meal = Meal.objects.create(
@@ -223,36 +510,13 @@ def _create_or_update_meal_from_data(recipe_data, meal=None, collection=None):
             description=recipe_data.get('description', ''),
             url=recipe_data.get('url', '')
         )
+        _create_meal_rows(meal, recipe_data)
     else:
         meal.title = recipe_data.get('title', 'New Meal')
         meal.description = recipe_data.get('description', '')
         meal.url = recipe_data.get('url', meal.url)  # Preserve existing URL if not provided
         meal.save()
-        meal.recipes.all().delete()  # Clear existing recipes if updating
-    
-    # Create new recipes
-    for recipe in recipe_data.get('recipes', []):
-        recipe_obj = Recipe.objects.create(
-            meal=meal,
-            title=recipe.get('title', ''),
-            description=recipe.get('description', ''),
-        )
-        
-        # Create ingredients
-        for ing_data in recipe.get('ingredients', []):
-            Ingredient.objects.create(
-                recipe=recipe_obj,
-                name=ing_data.get('name', ''),
-                amount=ing_data.get('amount', None),
-                unit=ing_data.get('unit', '')
-            )
-        
-        # Create method steps
-        for step_data in recipe.get('method', []):
-            MethodStep.objects.create(
-                recipe=recipe_obj,
-                description=step_data.strip()
-            )
+        _update_meal_rows(meal, recipe_data)
     
     return meal
 
@@ -279,44 +543,47 @@ def save_parsed_recipe(recipe_data, meal=None, collection=None):
     with transaction.atomic():
         created = not bool(meal)
         meal = _create_or_update_meal_from_data(recipe_data, meal=meal, collection=collection)
+        if not created:
+            # Keep grocery lists of plans holding this meal in step with its ingredients
+            refresh_meal_in_grocery_lists(meal)
     
     return meal, created
 
 def summarize_grocery_list_with_genai(ingredients, grocery_list_instruction):
-    # Create a structured list of ingredients with amounts and context
-    ingredient_details = []
-    for ingredient in ingredients:
-        recipe = ingredient.recipe
-        meal = recipe.meal
-        detail = {
-            'ingredient': ingredient.name,
-            'amount': f"{ingredient.amount or ''} {ingredient.unit}".strip(),
-            'recipe': recipe.title,
-            'meal': meal.title
-        }
-        ingredient_details.append(detail)
-    
-    # Sort ingredients alphabetically
-    ingredient_details.sort(key=lambda x: x['ingredient'].lower())
-    
+    """
+    Turn a meal plan's ingredient rows into a grocery list.
+
+    Ingredients are consolidated locally first, so the AI only sees one line per
+    ingredient. With GROCERY_LIST_USE_AI off the consolidated list is returned as is.
+    Results are memoized on the ingredients and instruction, and concurrent requests
+    for the same list share a single generation.
+    """
+    cache_key = grocery_list_cache_key(ingredients, grocery_list_instruction, f"{GROCERY_LIST_VERSION}:{settings.GROCERY_LIST_USE_AI}")
+    return single_flight(
+        cache_key,
+        lambda: _generate_grocery_list(ingredients, grocery_list_instruction),
+        counter=GROCERY_LIST_COUNTER,
+        timeout=settings.GROCERY_LIST_CACHE_TTL,
+        lock_timeout=settings.GROCERY_LIST_LOCK_TIMEOUT,
+    )
+
+def _generate_grocery_list(ingredients, grocery_list_instruction):
+    items = consolidate_ingredients(ingredients)
+    if not settings.GROCERY_LIST_USE_AI:
+        return format_grocery_list(items)
+
     # Convert to CSV-style string for better readability
-    formatted_ingredients = "Ingredient, Amount, Recipe, Meal\n"
+    formatted_ingredients = "Ingredient, Amount, Meals\n"
     formatted_ingredients += "\n".join(
-        f"{detail['ingredient']}, {detail['amount']}, {detail['recipe']}, {detail['meal']}"
-        for detail in ingredient_details
+        f"{item['name']}, {' + '.join(filter(None, [item['amount'], *item['notes']]))}, {'; '.join(item['meals'])}"
+        for item in items
     )
 
-    client = OpenAI(
-        api_key=os.getenv('OPENAI_API_KEY')
-    )
+    client = get_openai_client()
     response = client.chat.completions.create(
-        model="gpt-4o-mini",
+        model=GROCERY_LIST_MODEL,
         messages=[
-            {"role": "system", "content": f"""Organize the following ingredients into a sensible shopping list grouped by supermarket sections. 
-The input is in CSV format with columns: Ingredient, Amount, Recipe, Meal.
-The ingredients are pre-sorted alphabetically to help identify similar items.
-Please consolidate similar ingredients and their amounts when possible.
-{grocery_list_instruction}"""},
+            {"role": "system", "content": GROCERY_LIST_PROMPT.format(instruction=grocery_list_instruction)},
             {"role": "user", "content": formatted_ingredients}
         ]
     )
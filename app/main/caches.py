@@ -0,0 +1,112 @@
+"""
+The shared cache layer.
+
+settings.CACHES points every alias at redis when REDIS_HOST is set, so cached
+values are shared by all web workers, and at local memory otherwise (tests and
+local dev). Features pick the alias that suits their data:
+
+- SESSIONS: session data in front of the database (redis only)
+- FRAGMENTS: rendered HTML such as meal cards
+- AI_RESULTS: memoized AI output such as grocery lists
+- default: small lookups such as co-member sets
+
+Local memory is per process, so anything other workers must see, or that must be
+invalidated everywhere at once, checks is_shared() before relying on the cache.
+
+The backends count hits and misses per alias and add them to CacheCounter rows
+named "cache:<alias>" in batches (record_lookups, also used for the AI caches' own counters), so hit ratios show up in the admin without a
+database write per lookup.
+"""
+import logging
+import threading
+from collections import Counter
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = 'sessions'
+FRAGMENTS = 'fragments'
+AI_RESULTS = 'ai'
+
+_stats_lock = threading.Lock()
+_pending_stats = Counter()
+_local = threading.local()
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """Whether every worker process sees the same cache, rather than its own copy in memory"""
+    return not isinstance(caches[alias], LocMemCache)
+
+def record_lookups(name, hits, misses):
+    """Tally lookups for the CacheCounter called name, writing them out once enough have built up"""
+    with _stats_lock:
+        _pending_stats[(name, 'hits')] += hits
+        _pending_stats[(name, 'misses')] += misses
+        pending = sum(_pending_stats.values())
+    if pending >= settings.CACHE_STATS_FLUSH_EVERY:
+        flush_cache_stats()
+
+def flush_cache_stats():
+    """Add the tallied hits and misses to their CacheCounter rows"""
+    from .models import CacheCounter
+
+    with _stats_lock:
+        stats = dict(_pending_stats)
+        _pending_stats.clear()
+
+    names = {name for name, _ in stats}
+    try:
+        for name in names:
+            counter, _ = CacheCounter.objects.get_or_create(name=name)
+            CacheCounter.objects.filter(pk=counter.pk).update(
+                hits=F('hits') + stats.get((name, 'hits'), 0),
+                misses=F('misses') + stats.get((name, 'misses'), 0),
+            )
+    except Exception as e:
+        # Statistics are best effort and must never break the request that triggered them
+        logger.warning(f"Could not save cache statistics: {str(e)}")
+
+def clear_cache_stats():
+    """Forget tallied lookups that haven't been saved yet"""
+    with _stats_lock:
+        _pending_stats.clear()
+
+class CacheStatsMixin:
+    """Count hits and misses of get and get_many under the alias's STATS_NAME"""
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self.stats_name = params.get('STATS_NAME', 'default')
+
+    def _counting(self):
+        # Base get_many calls get for each key, so only count the outermost lookup
+        return not getattr(_local, 'nested', False)
+
+    def get(self, key, default=None, version=None):
+        missing = object()
+        value = super().get(key, missing, version=version)
+        if self._counting():
+            hit = value is not missing
+            record_lookups(f"cache:{self.stats_name}", int(hit), int(not hit))
+        return default if value is missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        counting = self._counting()
+        _local.nested = True
+        try:
+            values = super().get_many(keys, version=version)
+        finally:
+            _local.nested = not counting
+        if counting:
+            record_lookups(f"cache:{self.stats_name}", len(values), len(keys) - len(values))
+        return values
+
+class InstrumentedRedisCache(CacheStatsMixin, RedisCache):
+    pass
+
+class InstrumentedLocMemCache(CacheStatsMixin, LocMemCache):
+    pass
@@ -1,8 +1,5 @@
-from .models import MealPlan, Membership
+from .middleware import get_latest_meal_plan
 
 def latest_meal_plan(request):
-    if request.user.is_authenticated:
-        membership = request.user.memberships.order_by('-joined_at').first()
-        if membership:
-            return {'latest_meal_plan': membership.meal_plan}
-    return {} 
\ No newline at end of file
+    # Lazy, so the query only runs if the template shows the plan
+    return {'latest_meal_plan': get_latest_meal_plan(request)}
@@ -0,0 +1,301 @@
+"""
+Grocery list building for meal plans.
+
+Ingredients are consolidated locally, merging the same ingredient across meals and
+summing amounts through a shared unit, so the AI only has to arrange an already
+merged list into supermarket sections.
+
+Each meal plan also keeps its consolidated totals, and each meal's contribution to
+them, so adding or removing a meal updates the grocery list without regathering
+the plan or calling the AI. The locally rendered list is kept in
+rendered_grocery_list and only carried into grocery_list while that still holds our
+last rendering, so a list grouped by the AI or edited by hand is never replaced;
+such a list is flagged grocery_list_outdated instead, and the meal plan page offers
+to swap in the local rendering.
+"""
+import re
+from decimal import InvalidOperation
+from functools import lru_cache
+from django.db import transaction
+from django.db.models import F
+from .models import Ingredient, MealPlan
+from .structured_recipes import to_decimal_string
+from .utils import normalize_unit, to_base_unit
+
+def _ingredient_rows(**filters):
+    return list(
+        Ingredient.objects
+        .filter(**filters)
+        .annotate(recipe_title=F('recipe__title'), meal_title=F('recipe__meal__title'))
+        .order_by('recipe__meal_id', 'recipe_id', 'id')
+        .values_list('name', 'amount', 'unit', 'recipe_title', 'meal_title', 'recipe__meal_id', named=True)
+    )
+
+def gather_ingredients(meal_plan):
+    """
+    Fetch every ingredient in a meal plan in one joined query.
+
+    Returns lightweight rows with name, amount, unit, recipe_title, meal_title and
+    recipe__meal_id rather than model instances.
+    """
+    return _ingredient_rows(recipe__meal__meal_plan=meal_plan)
+
+def gather_meal_ingredients(meal):
+    """Fetch one meal's ingredients as rows like gather_ingredients"""
+    return _ingredient_rows(recipe__meal=meal)
+
+# Names for the same ingredient mapped to the one we list it under
+INGREDIENT_SYNONYMS = {
+    'scallion': 'spring onion',
+    'green onion': 'spring onion',
+    'cilantro': 'coriander',
+    'bell pepper': 'capsicum',
+    'courgette': 'zucchini',
+    'aubergine': 'eggplant',
+    'garbanzo bean': 'chickpea',
+    'all-purpose flour': 'plain flour',
+    'all purpose flour': 'plain flour',
+    'caster sugar': 'superfine sugar',
+    'powdered sugar': 'icing sugar',
+    'confectioners sugar': 'icing sugar',
+    'heavy cream': 'thickened cream',
+    'double cream': 'thickened cream',
+    'minced beef': 'beef mince',
+    'ground beef': 'beef mince',
+}
+
+# Words that end in s without being plurals
+SINGULAR_ENDINGS = ('ss', 'us', 'is')
+UNCOUNTABLE = {'molasses', 'oats', 'chives', 'greens'}
+
+# Display units to scale up to once the smaller base unit gets large
+LARGER_UNITS = {'g': ('kg', 1000), 'ml': ('l', 1000)}
+
+def singularize(word):
+    if len(word) <= 3 or word in UNCOUNTABLE or word.endswith(SINGULAR_ENDINGS):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes') or word.endswith(('ches', 'shes', 'xes')):
+        return word[:-2]
+    if word.endswith('ves') and word not in ('olives', 'cloves'):
+        return word[:-3] + 'f'
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+@lru_cache(maxsize=4096)
+def normalize_ingredient_name(name):
+    """
+    Reduce an ingredient name to the key we consolidate on.
+
+    Drops preparation notes after a comma and anything in brackets, lowercases,
+    singularizes the last word and applies INGREDIENT_SYNONYMS, so 'Tomatoes,
+    diced' and 'tomato' end up together.
+    """
+    name = re.sub(r'\([^)]*\)', ' ', name.split(',')[0]).lower()
+    words = re.sub(r"[^\w\s'-]", ' ', name).split()
+    if not words:
+        return ''
+    words[-1] = singularize(words[-1])
+    name = ' '.join(words)
+    return INGREDIENT_SYNONYMS.get(name, name)
+
+def split_unit_from_name(name, unit):
+    """Move a unit written into the name, as in '3 garlic cloves', into the unit"""
+    head, _, last = name.rpartition(' ')
+    if head and not (unit or '').strip() and normalize_unit(last):
+        return head, last
+    return name, unit
+
+def parse_amount(amount):
+    """Read an amount like '2', '1 1/2' or '2-3' as a float, taking the top of a range"""
+    # Blank amounts are as missing as None, like 'salt' with 'to taste' in the unit
+    parts = [part for part in re.split(r'\s*(?:-|–|to)\s*', str(amount or '').strip()) if part]
+    if not parts:
+        return None
+    try:
+        return max(float(to_decimal_string(part)) for part in parts)
+    except (InvalidOperation, ZeroDivisionError, ValueError):
+        return None
+
+def format_amount(amount, unit):
+    """Format a summed amount, scaling grams and millilitres up to kg and litres"""
+    if unit in LARGER_UNITS and amount >= LARGER_UNITS[unit][1]:
+        unit, factor = LARGER_UNITS[unit]
+        amount /= factor
+    return f"{round(amount, 2):g} {unit}".strip()
+
+def _empty_total(name, unit):
+    return {'name': name, 'unit': unit, 'amounts': {}, 'base_amount': 0, 'notes': [], 'meals': []}
+
+def ingredient_totals(rows, region='US'):
+    """
+    Sum ingredient rows per ingredient, in a form that can be added and subtracted.
+
+    Rows are grouped on their normalized name and on whether the unit measures
+    weight, volume or a count. Each total keeps its amount per original unit and in
+    grams or millilitres, plus one note and meal title entry per row, so the totals
+    for a meal can later be taken back out with merge_totals. Rows without a
+    readable amount are kept under the bare name. Returns a JSON-serializable dict.
+    """
+    totals = {}
+    for row in rows:
+        name, unit = split_unit_from_name(normalize_ingredient_name(row.name), row.unit)
+        amount = parse_amount(row.amount)
+        if amount is None:
+            total = totals.setdefault(name, _empty_total(name, None))
+            note = f"{(row.amount or '').strip()} {row.unit or ''}".strip()
+            if note:
+                total['notes'].append(note)
+        else:
+            base_amount, base_unit = to_base_unit(amount, unit, region)
+            total = totals.setdefault(f"{name}|{base_unit}", _empty_total(name, base_unit))
+            unit = normalize_unit(unit) or base_unit
+            total['amounts'][unit] = total['amounts'].get(unit, 0) + amount
+            total['base_amount'] += base_amount
+        total['meals'].append(row.meal_title)
+    return totals
+
+def _remove_each(items, removed):
+    items = list(items)
+    for item in removed:
+        if item in items:
+            items.remove(item)
+    return items
+
+def merge_totals(totals, other, sign=1):
+    """Add other's ingredient totals into totals, or take them out with sign=-1, in place"""
+    for key, other_total in other.items():
+        total = totals.setdefault(key, _empty_total(other_total['name'], other_total['unit']))
+        for unit, amount in other_total['amounts'].items():
+            # Rounded so adding then removing a meal comes back to exactly zero
+            value = round(total['amounts'].get(unit, 0) + sign * amount, 6)
+            if value:
+                total['amounts'][unit] = value
+            else:
+                total['amounts'].pop(unit, None)
+        total['base_amount'] = round(total['base_amount'] + sign * other_total['base_amount'], 6)
+        if sign > 0:
+            total['notes'] += other_total['notes']
+            total['meals'] += other_total['meals']
+        else:
+            total['notes'] = _remove_each(total['notes'], other_total['notes'])
+            total['meals'] = _remove_each(total['meals'], other_total['meals'])
+        if not total['meals']:
+            del totals[key]
+    return totals
+
+def consolidated_items(totals):
+    """
+    Turn ingredient totals into one grocery line per ingredient.
+
+    Returns dicts with name, amount (formatted, or '' when nothing could be summed),
+    notes and meals, sorted by name. Unmeasured rows like 'salt to taste' are added
+    to the ingredient's line as notes.
+    """
+    items = []
+    by_name = {}
+    # Measured totals first, so unmeasured ones can join the line for the same name
+    for total in sorted(totals.values(), key=lambda total: total['unit'] is None):
+        item = by_name.get(total['name']) if total['unit'] is None else None
+        if item is None:
+            if len(total['amounts']) == 1:
+                # Everything was in the same unit, so keep it rather than converting
+                unit, amount = next(iter(total['amounts'].items()))
+                amount = format_amount(amount, unit)
+            elif total['amounts']:
+                amount = format_amount(total['base_amount'], total['unit'])
+            else:
+                amount = ''
+            item = {'name': total['name'], 'amount': amount, 'notes': [], 'meals': []}
+            items.append(item)
+            by_name.setdefault(total['name'], item)
+        item['notes'] = list(dict.fromkeys(item['notes'] + total['notes']))
+        item['meals'] = list(dict.fromkeys(item['meals'] + total['meals']))
+    return sorted(items, key=lambda item: (item['name'], item['amount']))
+
+def consolidate_ingredients(rows, region='US'):
+    """Merge a plan's ingredient rows into one grocery line per ingredient"""
+    return consolidated_items(ingredient_totals(rows, region))
+
+def format_grocery_list(items):
+    """Render consolidated ingredients as a Markdown list"""
+    lines = []
+    for item in items:
+        quantity = ', '.join(filter(None, [item['amount'], *item['notes']]))
+        lines.append(f"- {item['name']}{f' ({quantity})' if quantity else ''}")
+    return '\n'.join(lines)
+
+GROCERY_LIST_FIELDS = ['grocery_totals', 'grocery_contributions', 'grocery_list', 'rendered_grocery_list', 'grocery_list_outdated']
+
+def grocery_list_is_rendered(meal_plan):
+    """Whether the plan's grocery list is still the one we rendered locally, or empty"""
+    return not meal_plan.grocery_list or meal_plan.grocery_list == meal_plan.rendered_grocery_list
+
+def render_grocery_list(meal_plan):
+    """
+    Render the plan's totals, replacing its grocery list only if that is still our last rendering.
+
+    An AI or hand edited list is kept, and flagged as outdated if the rendering changed.
+    """
+    rendered = format_grocery_list(consolidated_items(meal_plan.grocery_totals or {}))
+    if grocery_list_is_rendered(meal_plan):
+        meal_plan.grocery_list = rendered
+        meal_plan.grocery_list_outdated = False
+    elif rendered != meal_plan.rendered_grocery_list:
+        meal_plan.grocery_list_outdated = True
+    meal_plan.rendered_grocery_list = rendered
+    return meal_plan
+
+def rebuild_grocery_totals(meal_plan, rows=None):
+    """Recompute a plan's stored totals and per meal contributions from its ingredient rows"""
+    rows = gather_ingredients(meal_plan) if rows is None else rows
+    rows_by_meal = {}
+    for row in rows:
+        rows_by_meal.setdefault(str(row.recipe__meal_id), []).append(row)
+
+    meal_plan.grocery_contributions = {meal_id: ingredient_totals(meal_rows) for meal_id, meal_rows in rows_by_meal.items()}
+    meal_plan.grocery_totals = {}
+    for contribution in meal_plan.grocery_contributions.values():
+        merge_totals(meal_plan.grocery_totals, contribution)
+    return meal_plan
+
+def apply_meal_toggle(meal_plan, meal, added):
+    """
+    Update a plan's grocery list after a meal was added to or removed from it.
+
+    Only the toggled meal's ingredients are read. The plan row is locked while its
+    totals are updated so concurrent toggles don't lose each other's changes.
+    Returns the updated meal plan.
+    """
+    with transaction.atomic():
+        meal_plan = MealPlan.objects.select_for_update().get(pk=meal_plan.pk)
+        if meal_plan.grocery_totals is None:
+            rebuild_grocery_totals(meal_plan)
+        elif added:
+            contribution = ingredient_totals(gather_meal_ingredients(meal))
+            meal_plan.grocery_contributions[str(meal.id)] = contribution
+            merge_totals(meal_plan.grocery_totals, contribution)
+        else:
+            contribution = meal_plan.grocery_contributions.pop(str(meal.id), {})
+            merge_totals(meal_plan.grocery_totals, contribution, sign=-1)
+        render_grocery_list(meal_plan)
+        meal_plan.save(update_fields=GROCERY_LIST_FIELDS)
+    return meal_plan
+
+def refresh_meal_in_grocery_lists(meal, removed=False):
+    """Swap a meal's old contribution for its current ingredients in every plan tracking it"""
+    with transaction.atomic():
+        meal_plans = list(meal.meal_plan.filter(grocery_totals__isnull=False).select_for_update())
+        if not meal_plans:
+            return
+        contribution = {} if removed else ingredient_totals(gather_meal_ingredients(meal))
+        for meal_plan in meal_plans:
+            key = str(meal.id)
+            merge_totals(meal_plan.grocery_totals, meal_plan.grocery_contributions.pop(key, {}), sign=-1)
+            if not removed:
+                meal_plan.grocery_contributions[key] = contribution
+                merge_totals(meal_plan.grocery_totals, contribution)
+            render_grocery_list(meal_plan)
+            meal_plan.save(update_fields=GROCERY_LIST_FIELDS)
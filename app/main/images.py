@@ -0,0 +1,369 @@
+"""
+Uploaded photo processing.
+
+`upload_photos` only writes each raw upload to a local spool directory and hands it
+to a thread pool, which converts it to JPEG, caps its size and saves it to
+default_storage (S3 in production), several files at a time. Until then the photo
+is known by a placeholder URL that redirects to the stored image once it's ready.
+Progress is kept where every worker process can see it: the default cache when
+that is shared (redis), otherwise a small status file in the spool directory.
+Status files older than PHOTO_STATUS_TTL are swept away whenever a new upload is
+queued, so photos nobody polls don't leave theirs behind.
+
+Alongside each photo a smaller derivative is stored for the vision model, sized to
+what it actually looks at and recompressed (see VISION_IMAGE_* settings), so
+imports upload, encode and send a fraction of the bytes.
+
+Uploads are moved rather than copied into the spool where possible, JPEGs that are
+already fit to serve are stored as they are, encoded buffers are streamed to
+storage without another copy, and data URLs are base64 encoded in chunks, so a
+batch of large photos doesn't balloon a worker's memory.
+"""
+import base64
+import json
+import logging
+import shutil
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import unquote, urlparse
+from django.conf import settings
+from django.core.cache import cache
+from .caches import is_shared
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.urls import Resolver404, resolve, reverse
+from PIL import Image, ImageEnhance, ImageOps
+import pillow_heif
+
+logger = logging.getLogger(__name__)
+
+PHOTO_PENDING = 'pending'
+PHOTO_READY = 'ready'
+PHOTO_FAILED = 'failed'
+PHOTO_POLL_INTERVAL = 0.2  # seconds between status checks while waiting for a photo
+BASE64_CHUNK_SIZE = 3 * 64 * 1024  # a multiple of 3 so chunks encode without padding
+EXIF_GPS_IFD = 0x8825
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_photo_executor():
+    """The process-wide pool photos are processed on"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PHOTO_PROCESSING_WORKERS,
+                thread_name_prefix='photo',
+            )
+        return _executor
+
+def open_image(image_file, content_type='', draft_size=None):
+    """
+    Decode any supported image, including HEIC, as RGB.
+
+    With draft_size, JPEGs are decoded at the smallest scale that is still at least
+    that big, which is much faster and lighter than decoding them in full.
+    """
+    try:
+        if content_type == 'image/heic':
+            # Handle HEIC format
+            heif_file = pillow_heif.read_heif(image_file)
+            img = Image.frombytes(
+                heif_file.mode,
+                heif_file.size,
+                heif_file.data,
+                "raw",
+                heif_file.mode,
+                heif_file.stride,
+            )
+        else:
+            # Handle other formats, decoding now so the file can be closed
+            img = Image.open(image_file)
+            if draft_size:
+                img.draft('RGB', draft_size)
+            img.load()
+
+        # Convert to RGB if necessary (handles PNG with alpha channel)
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            bg = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            bg.paste(img, mask=img.split()[-1])  # Use alpha channel as mask
+            img = bg
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img
+    except Exception as e:
+        logger.error(f"Error converting image: {str(e)}")
+        raise
+
+def encode_jpeg(img, quality):
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    output.seek(0)
+    return output
+
+def fitted_size(size, max_long_edge, max_short_edge=None):
+    """The size an image of the given size is scaled down to, never up, to fit the given edge lengths"""
+    width, height = size
+    scale = max_long_edge / max(size)
+    if max_short_edge:
+        scale = min(scale, max_short_edge / min(size))
+    if scale >= 1:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def scaled_to_fit(img, max_long_edge, max_short_edge=None):
+    """img scaled down, never up, to fit within the given edge lengths; img itself if it already fits"""
+    size = fitted_size(img.size, max_long_edge, max_short_edge)
+    if size == img.size:
+        return img
+    return img.resize(size, Image.LANCZOS)
+
+def convert_to_jpeg(image_file, content_type=''):
+    """Convert any image to an RGB JPEG no larger than PHOTO_MAX_DIMENSION on either side"""
+    img = scaled_to_fit(open_image(image_file, content_type), settings.PHOTO_MAX_DIMENSION)
+    return encode_jpeg(img, settings.PHOTO_JPEG_QUALITY)
+
+def vision_size(size):
+    return fitted_size(size, settings.VISION_IMAGE_MAX_LONG_EDGE, settings.VISION_IMAGE_MAX_SHORT_EDGE)
+
+def is_servable_jpeg(image_file):
+    """
+    Whether an image can be stored exactly as uploaded: an RGB JPEG within
+    PHOTO_MAX_DIMENSION that doesn't reveal where it was taken. Only the header is read.
+    """
+    try:
+        with Image.open(image_file) as probe:
+            return (
+                probe.format == 'JPEG'
+                and probe.mode == 'RGB'
+                and max(probe.size) <= settings.PHOTO_MAX_DIMENSION
+                and EXIF_GPS_IFD not in probe.getexif()
+            )
+    except Exception:
+        return False
+    finally:
+        image_file.seek(0)
+
+def vision_derivative(img):
+    """
+    Prepare an image for the vision model.
+
+    High detail images are scaled by the model to fit 2048px and then to 768px on the
+    short side, so anything larger is wasted bytes. Printed recipe cards can also be
+    sent in grayscale with boosted contrast, which compresses better and reads just as well.
+    """
+    img = scaled_to_fit(img, settings.VISION_IMAGE_MAX_LONG_EDGE, settings.VISION_IMAGE_MAX_SHORT_EDGE)
+    if settings.VISION_IMAGE_GRAYSCALE:
+        img = ImageOps.grayscale(img)
+    if settings.VISION_IMAGE_CONTRAST != 1:
+        img = ImageEnhance.Contrast(img).enhance(settings.VISION_IMAGE_CONTRAST)
+    return encode_jpeg(img, settings.VISION_IMAGE_QUALITY)
+
+def file_chunks(file, chunk_size=BASE64_CHUNK_SIZE):
+    return iter(lambda: file.read(chunk_size), b'')
+
+def encode_data_url(chunks, mime_type='image/jpeg'):
+    """
+    Base64 encode an iterable of byte chunks into a data URL a chunk at a time,
+    so the raw image is never held in memory alongside its encoding.
+    """
+    output = BytesIO()
+    output.write(f"data:{mime_type};base64,".encode('ascii'))
+    carry = b''
+    for chunk in chunks:
+        if carry:
+            chunk = carry + chunk
+        usable = len(chunk) - len(chunk) % 3
+        output.write(base64.b64encode(memoryview(chunk)[:usable]))
+        carry = bytes(chunk[usable:])
+    output.write(base64.b64encode(carry))
+    with output.getbuffer() as encoded:
+        return str(encoded, 'ascii')
+
+def media_storage_name(url):
+    """
+    The default_storage name an S3 media URL points at, or None if it isn't one.
+
+    Handles virtual-hosted and path style bucket URLs and a custom domain.
+    """
+    bucket = getattr(default_storage, 'bucket_name', None)
+    if not bucket:
+        return None
+
+    parsed = urlparse(url)
+    path = unquote(parsed.path).lstrip('/')
+    custom_domain = getattr(default_storage, 'custom_domain', None)
+    if (custom_domain and parsed.netloc == custom_domain) or parsed.netloc.startswith(f"{bucket}."):
+        name = path
+    elif path.startswith(f"{bucket}/"):
+        name = path.removeprefix(f"{bucket}/")
+    else:
+        return None
+
+    location = (getattr(default_storage, 'location', '') or '').strip('/')
+    return name.removeprefix(f"{location}/") if location else name
+
+def presigned_media_url(url, expire):
+    """A freshly signed URL for an S3 media URL, valid for expire seconds, or None for other URLs"""
+    name = media_storage_name(url)
+    if name is None:
+        return None
+    return default_storage.url(name, expire=expire)
+
+def photo_status_key(photo_id):
+    return f"photo_upload:{photo_id}"
+
+def photo_status_dir():
+    return os.path.join(settings.PHOTO_SPOOL_DIR, 'status')
+
+def photo_status_path(photo_id):
+    return os.path.join(photo_status_dir(), f"{photo_id}.json")
+
+def get_photo_status(photo_id):
+    """The processing state of an uploaded photo, or None if it isn't known"""
+    if is_shared():
+        return cache.get(photo_status_key(photo_id))
+
+    path = photo_status_path(photo_id)
+    try:
+        if time.time() - os.path.getmtime(path) > settings.PHOTO_STATUS_TTL:
+            os.remove(path)
+            return None
+        with open(path) as status_file:
+            return json.load(status_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def remove_expired_photo_statuses():
+    """Delete status files, and any half written ones, older than PHOTO_STATUS_TTL"""
+    expires_before = time.time() - settings.PHOTO_STATUS_TTL
+    try:
+        entries = list(os.scandir(photo_status_dir()))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < expires_before:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Another worker got to it first
+            pass
+
+def set_photo_status(photo_id, status, **details):
+    if is_shared():
+        cache.set(photo_status_key(photo_id), {'status': status, **details}, settings.PHOTO_STATUS_TTL)
+        return
+
+    # Written aside and renamed into place, so readers never see half a file
+    path = photo_status_path(photo_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as status_file:
+        json.dump({'status': status, **details}, status_file)
+    os.replace(temp_path, path)
+
+def spool_upload(uploaded_file):
+    """
+    Put an upload in the local spool directory, returning its path.
+
+    Large uploads already sit in a temporary file, which is moved rather than copied
+    when it's on the same filesystem.
+    """
+    os.makedirs(settings.PHOTO_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.PHOTO_SPOOL_DIR, suffix='.upload')
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        os.close(fd)
+        try:
+            os.replace(uploaded_file.temporary_file_path(), path)
+            return path
+        except OSError:
+            shutil.copyfile(uploaded_file.temporary_file_path(), path)
+            return path
+
+    with os.fdopen(fd, 'wb') as spooled:
+        for chunk in uploaded_file.chunks():
+            spooled.write(chunk)
+    return path
+
+def process_photo(photo_id, path, content_type):
+    """Convert a spooled upload and store it and its vision derivative, recording the outcome"""
+    try:
+        with open(path, 'rb') as raw:
+            if is_servable_jpeg(raw):
+                # Stream the upload straight to storage and only decode what the model needs
+                saved_name = default_storage.save(f"recipe_photos/{photo_id}.jpg", File(raw))
+                raw.seek(0)
+                with Image.open(raw) as probe:
+                    draft_size = vision_size(probe.size)
+                raw.seek(0)
+                vision = vision_derivative(open_image(raw, content_type, draft_size=draft_size))
+            else:
+                img = open_image(raw, content_type)
+                photo = encode_jpeg(scaled_to_fit(img, settings.PHOTO_MAX_DIMENSION), settings.PHOTO_JPEG_QUALITY)
+                vision = vision_derivative(img)
+                del img
+                saved_name = default_storage.save(f"recipe_photos/{photo_id}.jpg", File(photo))
+        vision_name = default_storage.save(f"recipe_photos/{photo_id}.vision.jpg", File(vision))
+        set_photo_status(
+            photo_id, PHOTO_READY,
+            url=default_storage.url(saved_name),
+            vision_url=default_storage.url(vision_name),
+        )
+    except Exception as e:
+        logger.error(f"Error processing photo {photo_id}: {str(e)}", exc_info=True)
+        set_photo_status(photo_id, PHOTO_FAILED, error=str(e))
+    finally:
+        os.remove(path)
+
+def queue_photo(uploaded_file):
+    """Spool an upload, queue it for processing and return its placeholder URL"""
+    photo_id = uuid.uuid4()
+    path = spool_upload(uploaded_file)
+    set_photo_status(photo_id, PHOTO_PENDING)
+    if not is_shared():
+        remove_expired_photo_statuses()
+    get_photo_executor().submit(process_photo, photo_id, path, uploaded_file.content_type)
+    return reverse('main:uploaded_photo', kwargs={'photo_id': photo_id})
+
+def placeholder_photo_id(url):
+    """The photo id if url is a placeholder from queue_photo, else None"""
+    try:
+        match = resolve(urlparse(url).path)
+    except Resolver404:
+        return None
+    if match.view_name != 'main:uploaded_photo':
+        return None
+    return match.kwargs['photo_id']
+
+def resolve_photo_url(url, timeout=None, variant='url'):
+    """
+    Swap a placeholder URL for the stored photo's URL, waiting for it to be processed.
+
+    Pass variant='vision_url' for the derivative prepared for the vision model.
+    Other URLs are returned unchanged. Raises ValueError if the photo failed, is
+    unknown or isn't ready within timeout seconds (PHOTO_PROCESSING_TIMEOUT by default).
+    """
+    photo_id = placeholder_photo_id(url)
+    if photo_id is None:
+        return url
+
+    deadline = time.monotonic() + (settings.PHOTO_PROCESSING_TIMEOUT if timeout is None else timeout)
+    while True:
+        status = get_photo_status(photo_id)
+        if status is None:
+            raise ValueError("Uploaded photo has expired, please upload it again")
+        if status['status'] == PHOTO_READY:
+            return status[variant]
+        if status['status'] == PHOTO_FAILED:
+            raise ValueError(f"Uploaded photo could not be processed: {status['error']}")
+        if time.monotonic() > deadline:
+            raise ValueError("Uploaded photo is still being processed, please try again")
+        time.sleep(PHOTO_POLL_INTERVAL)
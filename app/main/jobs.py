@@ -0,0 +1,114 @@
+"""
+Background recipe import jobs.
+
+Scraping and AI parsing take tens of seconds, so `scrape_recipe` records a
+RecipeImportJob and hands it off here. With the redis backend the job id is pushed
+onto a list that `manage.py recipe_import_worker` pops from; with the inline backend
+(no REDIS_HOST, e.g. tests) the job runs straight away in the calling process.
+
+A running job touches updated_at whenever it reports progress. A job left RUNNING
+by a worker that crashed or restarted stops touching it, and once it has been
+quiet for RECIPE_IMPORT_STALE_AFTER seconds it is marked failed, by a worker while
+it waits for jobs, or by the status view when its importer polls it (which also
+covers inline imports whose web process died).
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import RecipeImportJob
+from .scraping import expand_recipe_urls, extract_urls_from_text, get_structured_meal
+from .ai_helpers import parse_recipe_with_genai, save_parsed_recipe
+from .images import resolve_photo_url
+
+logger = logging.getLogger(__name__)
+
+RECIPE_IMPORT_QUEUE = 'ourmeals:recipe_import_jobs'
+
+def get_redis_client():
+    """Create a redis client from the REDIS_* settings"""
+    import redis
+    return redis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD or None,
+    )
+
+def enqueue_recipe_import(job):
+    """
+    Queue a recipe import job for processing.
+
+    Returns the job, which will already be finished when using the inline backend.
+    """
+    if settings.RECIPE_IMPORT_BACKEND == 'redis':
+        # Only publish once the job row is visible to the worker
+        transaction.on_commit(lambda: get_redis_client().rpush(RECIPE_IMPORT_QUEUE, str(job.id)))
+        return job
+
+    return run_recipe_import_job(job.id)
+
+def fail_stale_recipe_imports(**filters):
+    """Fail running jobs, optionally filtered, whose worker has stopped reporting progress, returning how many"""
+    stale_before = timezone.now() - timedelta(seconds=settings.RECIPE_IMPORT_STALE_AFTER)
+    return RecipeImportJob.objects.filter(
+        status=RecipeImportJob.RUNNING, updated_at__lt=stale_before, **filters
+    ).update(
+        status=RecipeImportJob.FAILED,
+        error='The import was interrupted, please try again',
+        updated_at=timezone.now(),
+    )
+
+def run_recipe_import_job(job_id):
+    """
+    Fetch, parse and save the recipe for a job.
+
+    The job is claimed atomically so a job delivered twice is only processed once.
+    Failures are recorded on the job rather than raised.
+    """
+    claimed = RecipeImportJob.objects.filter(
+        id=job_id, status=RecipeImportJob.PENDING
+    ).update(status=RecipeImportJob.RUNNING, updated_at=timezone.now())
+    job = RecipeImportJob.objects.select_related('collection').get(id=job_id)
+    if not claimed:
+        logger.info(f"Recipe import job {job_id} already {job.status}, skipping")
+        return job
+
+    def report_progress(progress):
+        RecipeImportJob.objects.filter(id=job_id).update(progress=progress, updated_at=timezone.now())
+
+    try:
+        if job.photo_urls:
+            # Uploads may still be converting, wait for the copies prepared for the model
+            report_progress({'stage': 'photos'})
+            job.photo_urls = [resolve_photo_url(url, variant='vision_url') for url in job.photo_urls]
+            RecipeImportJob.objects.filter(id=job_id).update(photo_urls=job.photo_urls)
+
+        if job.raw_text and extract_urls_from_text(job.raw_text):
+            report_progress({'stage': 'fetching'})
+        raw_text = expand_recipe_urls(job.raw_text) if job.raw_text else ''
+
+        # Pages publishing a schema.org recipe don't need the AI
+        recipe_data = get_structured_meal(job.raw_text) if raw_text and not job.photo_urls else None
+        if recipe_data:
+            logger.info(f"Using structured recipe data for job {job_id}")
+        else:
+            # Parse recipe with text and/or photos, streaming progress onto the job
+            report_progress({'stage': 'parsing'})
+            recipe_data = parse_recipe_with_genai(
+                raw_text=raw_text if raw_text else None,
+                photos=job.photo_urls,
+                on_progress=lambda progress: report_progress({'stage': 'parsing', **progress}),
+            )
+        meal, _ = save_parsed_recipe(recipe_data, collection=job.collection)
+    except Exception as e:
+        logger.error(f"Error importing recipe for job {job_id}: {str(e)}", exc_info=True)
+        job.status = RecipeImportJob.FAILED
+        job.error = str(e)
+    else:
+        logger.info(f"Created Meal: {meal.title} (ID: {meal.id}) for job {job_id}")
+        job.status = RecipeImportJob.SUCCEEDED
+        job.meal = meal
+
+    job.save(update_fields=['status', 'error', 'meal', 'updated_at'])
+    return job
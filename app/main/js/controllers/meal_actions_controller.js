@@ -103,6 +103,13 @@ export default class extends Controller {
     .then(data => {
       showToast(data.message, 'success')
       
+      // Let the meal plan page show the updated grocery list
+      if (data.grocery_list !== undefined) {
+        this.dispatch('groceryListChanged', { detail: { groceryList: data.grocery_list } })
+      } else if (data.grocery_list_outdated) {
+        this.dispatch('groceryListOutdated')
+      }
+      
       // If we're on the meal plan page and removing a meal, remove the card
       const onMealPlanPage = window.location.pathname.includes('/meal-plan/')
       const removingFromPlan = data.message.includes('removed from')
@@ -7,12 +7,13 @@ import { showToast } from '../../../static/js/utils/toast'
  * Handles the interactive features of the meal plan detail page:
  * - Auto-saving grocery list
  * - Copying share link
+ * - Refreshing the grocery list when meals are toggled, or flagging an AI or edited list as outdated
  * - Toast notifications
  */
 export default class extends Controller {
     // DOM targets that this controller interacts with
     static get targets() { 
-        return ["groceryList", "saveStatus", "shareLink", "submit", "loading"] 
+        return ["groceryList", "saveStatus", "shareLink", "submit", "loading", "outdatedNotice"] 
     }
     
     // Values passed from the server via data attributes
@@ -20,6 +21,7 @@ export default class extends Controller {
         return {
             saveUrl: String,  // URL for saving grocery list
             generateUrl: String, // URL for generating grocery list with AI
+            refreshUrl: String, // URL for replacing the grocery list with the locally consolidated one
             csrfToken: String // Django CSRF token
         }
     }
@@ -72,6 +74,43 @@ export default class extends Controller {
         }
     }
 
+    // Shows the grocery list after a meal was added or removed
+    updateGroceryList(event) {
+        if (this.hasGroceryListTarget) {
+            this.groceryListTarget.value = event.detail.groceryList
+        }
+    }
+
+    // Shows that meals changed since an AI generated or edited list was made
+    markGroceryListOutdated() {
+        if (this.hasOutdatedNoticeTarget) {
+            this.outdatedNoticeTarget.classList.remove('d-none')
+        }
+    }
+
+    // Replaces an outdated grocery list with the one consolidated from the plan's meals
+    async refreshGroceryList() {
+        try {
+            const response = await fetch(this.refreshUrlValue, {
+                method: 'POST',
+                headers: {
+                    'Accept': 'application/json',
+                    'X-CSRFToken': this.csrfTokenValue
+                }
+            })
+            const data = await response.json()
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to update grocery list')
+            }
+            this.groceryListTarget.value = data.grocery_list
+            this.outdatedNoticeTarget.classList.add('d-none')
+            showToast('Grocery list updated', 'success')
+        } catch (error) {
+            console.error('Failed to update grocery list:', error)
+            showToast('Failed to update grocery list', 'error')
+        }
+    }
+
     // Copies share link to clipboard
     async copyLink() {
         try {
@@ -109,6 +148,9 @@ export default class extends Controller {
             
             if (response.ok) {
                 this.groceryListTarget.value = data.grocery_list
+                if (this.hasOutdatedNoticeTarget) {
+                    this.outdatedNoticeTarget.classList.add('d-none')
+                }
                 showToast('Success', 'Grocery list generated successfully!')
             } else {
                 throw new Error(data.error || 'Failed to generate grocery list')
@@ -2,9 +2,11 @@ import { Controller } from "@hotwired/stimulus"
 import { showToast } from '../../../static/js/utils/toast'
 
 export default class extends Controller {
-  static targets = ["form", "input", "fileInput", "previewContainer", "submit", "loading"]
+  static targets = ["form", "input", "fileInput", "previewContainer", "submit", "loading", "loadingText"]
   static values = {
-    uploadUrl: String
+    uploadUrl: String,
+    pollInterval: { type: Number, default: 1500 },
+    maxWait: { type: Number, default: 10 * 60 * 1000 }
   }
 
   connect() {
@@ -54,21 +56,18 @@ export default class extends Controller {
     )
     
     if (files.length > 0) {
-      for (const file of files) {
-        await this.uploadPhoto(file)
-      }
+      await this.uploadPhotos(files)
       return
     }
     
     // If no files, check for dragged images
     const items = Array.from(event.dataTransfer.items)
-    for (const item of items) {
-      if (item.type.indexOf('image/') !== -1) {
-        const file = item.getAsFile()
-        if (file) {
-          await this.uploadPhoto(file)
-        }
-      }
+    const draggedFiles = items
+      .filter(item => item.type.indexOf('image/') !== -1)
+      .map(item => item.getAsFile())
+      .filter(file => file)
+    if (draggedFiles.length > 0) {
+      await this.uploadPhotos(draggedFiles)
     }
   }
 
@@ -81,7 +80,7 @@ export default class extends Controller {
         event.preventDefault() // Prevent default paste only if we have an image
         hasImage = true
         const file = item.getAsFile()
-        await this.uploadPhoto(file)
+        await this.uploadPhotos([file])
       }
     }
     
@@ -92,19 +91,27 @@ export default class extends Controller {
   }
 
   async handleFileSelect(event) {
-    const files = event.target.files
-    for (let file of files) {
-      await this.uploadPhoto(file)
-    }
+    const files = Array.from(event.target.files)
     this.fileInputTarget.value = '' // Clear the input
+    await this.uploadPhotos(files)
   }
 
   triggerFileInput() {
     this.fileInputTarget.click()
   }
 
-  async uploadPhoto(file) {
-    if (!file.type.startsWith('image/')) {
+  readAsDataURL(file) {
+    return new Promise((resolve, reject) => {
+      const reader = new FileReader()
+      reader.onload = (e) => resolve(e.target.result)
+      reader.onerror = reject
+      reader.readAsDataURL(file)
+    })
+  }
+
+  // Uploads all files in one request so the server processes them in parallel
+  async uploadPhotos(files) {
+    if (files.some(file => !file.type.startsWith('image/'))) {
       showToast("Only image files are allowed", 'error')
       return
     }
@@ -113,21 +120,15 @@ export default class extends Controller {
     const submitButton = this.submitTarget
     submitButton.disabled = true
 
-    // Create temporary preview with data URL
-    const reader = new FileReader()
-    reader.onload = (e) => {
-      // Add temporary preview to uploadedPhotos
-      this.uploadedPhotos.push({
-        url: e.target.result,
-        isLoading: true,
-        tempId: Date.now() // Use this to identify the temp preview
-      })
-      this.updatePhotoPreview()
-    }
-    reader.readAsDataURL(file)
+    // Show local previews straight away; they stay as the preview once uploaded,
+    // because the server's URLs only resolve when its processing has finished
+    const tempId = Date.now()
+    const previews = await Promise.all(files.map(file => this.readAsDataURL(file)))
+    this.uploadedPhotos.push(...previews.map(preview => ({ url: preview, preview, isLoading: true, tempId })))
+    this.updatePhotoPreview()
 
     const formData = new FormData()
-    formData.append('photos', file)
+    files.forEach(file => formData.append('photos', file))
 
     try {
       const response = await fetch(this.uploadUrlValue, {
@@ -144,14 +145,14 @@ export default class extends Controller {
       }
 
       const data = await response.json()
-      // Replace temporary preview with actual URLs
-      this.uploadedPhotos = this.uploadedPhotos.filter(photo => !photo.isLoading)
-      this.uploadedPhotos.push(...data.urls.map(url => ({ url })))
+      // Swap the temporary previews for the uploaded photos
+      this.uploadedPhotos = this.uploadedPhotos.filter(photo => photo.tempId !== tempId)
+      this.uploadedPhotos.push(...data.urls.map((url, index) => ({ url, preview: previews[index] })))
       this.updatePhotoPreview()
     } catch (error) {
       showToast("Failed to upload photo: " + error.message, 'error')
-      // Remove temporary preview
-      this.uploadedPhotos = this.uploadedPhotos.filter(photo => !photo.isLoading)
+      // Remove temporary previews
+      this.uploadedPhotos = this.uploadedPhotos.filter(photo => photo.tempId !== tempId)
       this.updatePhotoPreview()
     } finally {
       // Re-enable form submission
@@ -162,7 +163,7 @@ export default class extends Controller {
   updatePhotoPreview() {
     this.previewContainerTarget.innerHTML = this.uploadedPhotos.map((photo, index) => `
       <div class="photo-preview${photo.isLoading ? ' loading' : ''}">
-        <img src="${photo.url}" alt="Recipe photo ${index + 1}">
+        <img src="${photo.preview || photo.url}" alt="Recipe photo ${index + 1}">
         ${photo.isLoading ? `
           <div class="upload-overlay">
             <div class="spinner-border" role="status">
@@ -187,6 +188,31 @@ export default class extends Controller {
     })
   }
 
+  async pollImportStatus(statusUrl) {
+    const deadline = Date.now() + this.maxWaitValue
+    while (true) {
+      // Stop waiting on an import whose worker may have died
+      if (Date.now() > deadline) {
+        throw new Error('The import is taking too long, please try again')
+      }
+
+      await new Promise(resolve => setTimeout(resolve, this.pollIntervalValue))
+
+      const response = await fetch(statusUrl, {
+        headers: { 'Accept': 'application/json' }
+      })
+      const data = await response.json()
+      if (response.status !== 202) {
+        return { ok: response.ok, data }
+      }
+
+      // Show what the AI has found so far
+      if (data.message) {
+        this.loadingTextTarget.textContent = data.message
+      }
+    }
+  }
+
   async submitForm(event) {
     event.preventDefault()
     if (this.isProcessing) return
@@ -222,13 +248,21 @@ export default class extends Controller {
         }
       })
 
-      const data = await response.json()
+      let data = await response.json()
       console.log(data)
+
+      // Imports run in the background, poll until the job finishes
+      let ok = response.ok
+      if (response.status === 202) {
+        ({ ok, data } = await this.pollImportStatus(data.status_url))
+      }
+
       this.submitTarget.classList.remove('d-none')
       this.loadingTarget.classList.add('d-none')
+      this.loadingTextTarget.textContent = 'Analyzing Recipe'
       this.isProcessing = false
       
-      if (response.ok) {
+      if (ok) {
         window.location.href = data.redirect
       } else {
         throw new Error(data.message || 'Failed to import recipe')
@@ -238,6 +272,7 @@ export default class extends Controller {
       showToast(error.message, 'error')
       this.submitTarget.classList.remove('d-none')
       this.loadingTarget.classList.add('d-none')
+      this.loadingTextTarget.textContent = 'Analyzing Recipe'
       this.isProcessing = false
     }
   }
@@ -0,0 +1,60 @@
+import random
+import time
+from collections import namedtuple
+from django.core.management.base import BaseCommand
+from main.grocery import consolidate_ingredients, normalize_ingredient_name
+
+Row = namedtuple('Row', ['name', 'amount', 'unit', 'recipe_title', 'meal_title', 'recipe__meal_id'])
+
+# Ingredient spellings and the units they tend to come in
+PANTRY = [
+    (['Onion', 'onions', 'Brown onion, diced'], ['', '', 'g']),
+    (['Garlic cloves', 'garlic', 'Garlic, minced'], ['', 'cloves', 'tsp']),
+    (['Tomatoes', 'tomato, chopped', 'Tinned tomatoes'], ['', 'g', 'cans']),
+    (['Butter', 'unsalted butter', 'butter, softened'], ['g', 'tbsp', 'cup']),
+    (['Plain flour', 'all-purpose flour', 'All purpose flour'], ['cups', 'g', 'tbsp']),
+    (['Milk', 'whole milk'], ['ml', 'cups', 'l']),
+    (['Carrots', 'carrot, grated'], ['', 'g']),
+    (['Olive oil', 'olive oil'], ['tbsp', 'tsp', 'ml']),
+    (['Salt', 'sea salt'], ['tsp', 'pinch', 'to taste']),
+    (['Eggs', 'egg'], ['']),
+    (['Chicken thighs', 'chicken thigh fillets'], ['g', 'kg', '']),
+    (['Rice', 'basmati rice'], ['cups', 'g']),
+    (['Spring onions', 'scallions', 'green onion'], ['', 'bunch']),
+    (['Coriander', 'cilantro leaves'], ['bunch', 'cup']),
+    (['Capsicum', 'red bell pepper'], ['', 'g']),
+]
+AMOUNTS = ['1', '2', '1/2', '1 1/2', '2-3', '100', '250', '0.5', None]
+
+class Command(BaseCommand):
+    help = 'Report how long local grocery list consolidation takes and how much it shrinks the list for large plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meals', type=int, nargs='+', default=[7, 14, 28, 100],
+                            help='Plan sizes to benchmark')
+        parser.add_argument('--ingredients', type=int, default=15,
+                            help='Ingredients per meal')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Times to consolidate each plan, the best run is reported')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        self.stdout.write(f"{'meals':>8}{'rows':>8}{'lines':>8}{'in chars':>10}{'out chars':>10}{'time':>12}")
+        for meal_count in options['meals']:
+            rows = [self.random_row(rng, meal) for meal in range(meal_count) for _ in range(options['ingredients'])]
+            best, items = None, None
+            for _ in range(options['repeat']):
+                normalize_ingredient_name.cache_clear()
+                start = time.process_time()
+                items = consolidate_ingredients(rows)
+                elapsed = time.process_time() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            # Characters in the CSV we'd send the AI, as a proxy for tokens
+            in_chars = sum(len(f"{r.name}, {r.amount or ''} {r.unit}, {r.recipe_title}, {r.meal_title}\n") for r in rows)
+            out_chars = sum(len(f"{i['name']}, {i['amount']} {' '.join(i['notes'])}, {'; '.join(i['meals'])}\n") for i in items)
+            self.stdout.write(f"{meal_count:>8}{len(rows):>8}{len(items):>8}{in_chars:>10}{out_chars:>10}{best * 1000:>10.2f}ms")
+
+    def random_row(self, rng, meal):
+        names, units = rng.choice(PANTRY)
+        return Row(rng.choice(names), rng.choice(AMOUNTS), rng.choice(units), f"Recipe {meal}", f"Meal {meal}", meal)
@@ -0,0 +1,71 @@
+import glob
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main.scraping import extract_page, available_html_parser
+
+# The kind of non-content markup ad and analytics heavy recipe sites inline many times over
+PADDING_BLOCK = (
+    '<script>window.dataLayer=window.dataLayer||[];dataLayer.push({"event":"view","id":42});</script>'
+    '<style>.card{display:flex;margin:0 auto}.card>img{width:100%}</style>'
+    '<svg viewBox="0 0 24 24"><g><path d="M12 2L2 7l10 5 10-5-10-5z"/><path d="M2 17l10 5 10-5"/></g></svg>'
+    '<!-- ad slot --><noscript><img src="/pixel.gif"></noscript>'
+)
+
+DEFAULT_CORPUS = os.path.join(settings.BASE_DIR, 'tests', 'fixtures', 'recipe_pages')
+
+# The fixture pages are only a few KB of recipe; ad and analytics heavy sites serve around a megabyte
+DEFAULT_PADDING_KB = 1000
+
+class Command(BaseCommand):
+    help = 'Report per-page CPU time to extract recipe text with each HTML parser backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=DEFAULT_CORPUS,
+                            help='Directory of saved recipe pages (*.html)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Times to parse each page, the best run is reported')
+        parser.add_argument('--pad-scripts', type=int, default=DEFAULT_PADDING_KB, metavar='KB',
+                            help='Inline this many KB of scripts, styles and icons into each page to mimic real sites, '
+                                 '0 to parse saved pages as they are')
+
+    def handle(self, *args, **options):
+        pages = sorted(glob.glob(os.path.join(options['corpus'], '*.html')))
+        if not pages:
+            self.stderr.write(f"No pages found in {options['corpus']}")
+            return
+
+        backends = ['html.parser']
+        if available_html_parser() != 'html.parser':
+            backends.append(available_html_parser())
+        padding = PADDING_BLOCK * (options['pad_scripts'] * 1024 // len(PADDING_BLOCK))
+
+        columns = [f"{backend}{' +strip' if strip else ''}" for backend in backends for strip in (False, True)]
+        self.stdout.write(f"{'page':<32}{'KB':>8}" + ''.join(f"{c:>20}" for c in columns))
+
+        totals = [0.0] * len(columns)
+        for path in pages:
+            with open(path, encoding='utf-8') as f:
+                html = f.read().replace('<body>', f"<body>{padding}", 1)
+
+            timings = []
+            for backend in backends:
+                for strip in (False, True):
+                    timings.append(self.time_parse(html, backend, strip, options['repeat']))
+            totals = [t + timing for t, timing in zip(totals, timings)]
+
+            self.stdout.write(f"{os.path.basename(path)[:31]:<32}{len(html) / 1024:>8.1f}"
+                              + ''.join(f"{timing * 1000:>18.2f}ms" for timing in timings))
+
+        self.stdout.write(f"{'mean':<40}" + ''.join(f"{t / len(pages) * 1000:>18.2f}ms" for t in totals))
+
+    def time_parse(self, html, backend, strip, repeat):
+        """Best CPU time over repeat runs; without strip the raw page goes to the parser"""
+        best = None
+        for _ in range(repeat):
+            start = time.process_time()
+            extract_page(html, parser=backend, strip=strip)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
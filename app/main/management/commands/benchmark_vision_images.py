@@ -0,0 +1,67 @@
+import base64
+import glob
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+from main.images import open_image, encode_jpeg, scaled_to_fit, vision_derivative
+
+class Command(BaseCommand):
+    help = 'Report bytes and encode time of stored photos against the derivatives sent to the vision model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', nargs='+', default=[],
+                            help='Image files or glob patterns to benchmark, e.g. phone photos of recipe cards')
+        parser.add_argument('--size', default='4032x3024',
+                            help='Size of the synthetic photo used when no images are given')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Times to encode each image, the best run is reported')
+
+    def handle(self, *args, **options):
+        images = self.load_images(options)
+        self.stdout.write(
+            f"{'image':<24}{'size':>12}{'photo':>12}{'photo b64':>12}{'encode':>10}"
+            f"{'vision':>12}{'vision b64':>12}{'encode':>10}{'saved':>8}"
+        )
+        for name, img in images:
+            photo, photo_time = self.best_of(options['repeat'], lambda: encode_jpeg(
+                scaled_to_fit(img, settings.PHOTO_MAX_DIMENSION), settings.PHOTO_JPEG_QUALITY))
+            vision, vision_time = self.best_of(options['repeat'], lambda: vision_derivative(img))
+
+            photo_bytes, vision_bytes = len(photo.getvalue()), len(vision.getvalue())
+            photo_b64 = len(base64.b64encode(photo.getvalue()))
+            vision_b64 = len(base64.b64encode(vision.getvalue()))
+            saved = 1 - vision_bytes / photo_bytes
+            self.stdout.write(
+                f"{name[:23]:<24}{f'{img.width}x{img.height}':>12}{photo_bytes:>12}{photo_b64:>12}{photo_time * 1000:>8.1f}ms"
+                f"{vision_bytes:>12}{vision_b64:>12}{vision_time * 1000:>8.1f}ms{saved:>8.0%}"
+            )
+
+    def load_images(self, options):
+        paths = sorted(path for pattern in options['images'] for path in glob.glob(pattern))
+        if options['images'] and not paths:
+            self.stderr.write(f"No images found for {' '.join(options['images'])}")
+        if paths:
+            images = []
+            for path in paths:
+                with open(path, 'rb') as image_file:
+                    content_type = 'image/heic' if path.lower().endswith('.heic') else ''
+                    images.append((os.path.basename(path), open_image(image_file, content_type)))
+            return images
+
+        # Noise over a gradient compresses about as badly as a real photo
+        width, height = (int(edge) for edge in options['size'].split('x'))
+        gradient = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), 20)
+        synthetic = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+        return [('synthetic', synthetic)]
+
+    def best_of(self, repeat, encode):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = encode()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.core.management.base import BaseCommand
+from django.db import connection
+from main.models import Collection, Meal, Recipe
+from main.renditions import generate_renditions, renditions_are_current
+
+PHOTO_MODELS = [Collection, Meal, Recipe]
+
+def _generate(instance):
+    try:
+        generate_renditions(instance)
+    finally:
+        connection.close()
+
+class Command(BaseCommand):
+    help = 'Generate responsive renditions for collection, meal and recipe photos that are missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Photos to process at once')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that are already current, e.g. after changing IMAGE_RENDITION_WIDTHS')
+
+    def handle(self, *args, **options):
+        pending = [
+            instance
+            for model in PHOTO_MODELS
+            for instance in model.objects.exclude(photo='').exclude(photo__isnull=True).only('pk', 'photo', 'photo_renditions')
+            if options['force'] or not renditions_are_current(instance)
+        ]
+        self.stdout.write(f"Generating renditions for {len(pending)} photos with {options['workers']} workers")
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(_generate, instance): instance for instance in pending}
+            for future in as_completed(futures):
+                instance = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{type(instance).__name__} {instance.pk}: {str(e)}")
+
+        self.stdout.write(f"Generated renditions for {len(pending) - failed} photos, {failed} failed")
@@ -0,0 +1,50 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from main.jobs import RECIPE_IMPORT_QUEUE, fail_stale_recipe_imports, get_redis_client, run_recipe_import_job
+from main.models import RecipeImportJob
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Process queued recipe imports from redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-timeout', type=int, default=5,
+                            help='Seconds to block waiting for a job before checking connections again')
+        parser.add_argument('--requeue-pending', action='store_true',
+                            help='Push any pending jobs back onto the queue at startup')
+
+    def handle(self, *args, **options):
+        client = get_redis_client()
+
+        self.fail_stale_jobs()
+
+        if options['requeue_pending']:
+            pending = RecipeImportJob.objects.filter(status=RecipeImportJob.PENDING).values_list('id', flat=True)
+            for job_id in pending:
+                client.rpush(RECIPE_IMPORT_QUEUE, str(job_id))
+            self.stdout.write(f"Requeued {len(pending)} pending recipe imports")
+
+        self.stdout.write(f"Waiting for recipe imports on '{RECIPE_IMPORT_QUEUE}'")
+        while True:
+            item = client.blpop([RECIPE_IMPORT_QUEUE], timeout=options['poll_timeout'])
+            close_old_connections()
+            if not item:
+                # Idle, so look for jobs orphaned by a worker that died since we last checked
+                self.fail_stale_jobs()
+                continue
+
+            _, job_id = item
+            job_id = job_id.decode()
+            try:
+                job = run_recipe_import_job(job_id)
+                self.stdout.write(f"Recipe import {job_id}: {job.status}")
+            except RecipeImportJob.DoesNotExist:
+                logger.warning(f"Recipe import job {job_id} no longer exists")
+
+    def fail_stale_jobs(self):
+        # Jobs a crashed or restarted worker was running will never finish
+        stale = fail_stale_recipe_imports()
+        if stale:
+            self.stdout.write(f"Failed {stale} interrupted recipe imports")
@@ -0,0 +1,95 @@
+"""
+Cached meal cards.
+
+A rendered card is cached under the meal's id, its content version, the plan its
+toggle button posts to, whether the meal is in that plan and whether the buttons
+are shown. Signals bump a meal's version when the meal, its recipes or its plans
+change, so stale cards are never looked up again and simply expire.
+
+Cards are cached with a placeholder for the CSRF token, which is filled in for the
+current request on the way out.
+
+Cards are only cached when the fragments cache is shared by every worker (redis).
+A version bumped in one process's local memory would leave the other workers
+serving the old card, so without one cards are rendered every time.
+"""
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .caches import FRAGMENTS, is_shared
+
+MEAL_CARD_TEMPLATE = 'main/_meal.html'
+CSRF_PLACEHOLDER = '__meal_card_csrf_token__'
+
+def meal_version_key(meal_id):
+    return f"meal_version:{meal_id}"
+
+def bump_meal_versions(*meal_ids):
+    """Give meals a new content version so their cached cards are no longer used"""
+    keys = [meal_version_key(meal_id) for meal_id in meal_ids]
+    caches[FRAGMENTS].delete_many(keys)
+    # A concurrent render may cache a card from pre-commit data under a new version, so drop them again once committed
+    transaction.on_commit(lambda: caches[FRAGMENTS].delete_many(keys))
+
+def meal_versions(meal_ids):
+    """Current content version of each meal, starting a new one where none is cached"""
+    cache = caches[FRAGMENTS]
+    keys = {meal_id: meal_version_key(meal_id) for meal_id in meal_ids}
+    cached = cache.get_many(keys.values())
+    versions = {meal_id: cached.get(key) for meal_id, key in keys.items()}
+
+    new_versions = {meal_id: uuid.uuid4().hex for meal_id, version in versions.items() if version is None}
+    if new_versions:
+        # Kept longer than the cards made with them, so live cards aren't orphaned early
+        cache.set_many({keys[meal_id]: version for meal_id, version in new_versions.items()}, settings.MEAL_CARD_CACHE_TTL * 2)
+        versions.update(new_versions)
+    return versions
+
+def meal_card_key(meal_id, version, current_meal_plan, in_plan, show_buttons):
+    plan = current_meal_plan.shareable_link if current_meal_plan else ''
+    return f"meal_card:{meal_id}:{version}:{plan}:{int(in_plan)}:{int(bool(show_buttons))}"
+
+def render_meal_card(meal, current_meal_plan, meal_plan_recipes, show_buttons, csrf_token):
+    return render_to_string(MEAL_CARD_TEMPLATE, {
+        'meal': meal,
+        'current_meal_plan': current_meal_plan,
+        'meal_plan_recipes': meal_plan_recipes,
+        'show_buttons': show_buttons,
+        'csrf_token': csrf_token,
+    })
+
+def render_meal_cards(meals, request=None, current_meal_plan=None, meal_plan_recipes=(), show_buttons=False):
+    """Render a card for each meal, reusing cached cards and caching the ones rendered"""
+    cache = caches[FRAGMENTS]
+    meals = list(meals)
+    csrf_token = get_token(request) if request is not None else ''
+    if not is_shared(FRAGMENTS):
+        return mark_safe(''.join(
+            render_meal_card(meal, current_meal_plan, meal_plan_recipes, show_buttons, csrf_token)
+            for meal in meals
+        ))
+
+    versions = meal_versions([meal.id for meal in meals])
+    keys = {
+        meal.id: meal_card_key(meal.id, versions[meal.id], current_meal_plan, meal.id in meal_plan_recipes, show_buttons)
+        for meal in meals
+    }
+    cached = cache.get_many(keys.values())
+
+    cards = []
+    rendered = {}
+    for meal in meals:
+        html = cached.get(keys[meal.id])
+        if html is None:
+            html = render_meal_card(meal, current_meal_plan, meal_plan_recipes, show_buttons, CSRF_PLACEHOLDER)
+            rendered[keys[meal.id]] = html
+        cards.append(html)
+
+    if rendered:
+        cache.set_many(rendered, settings.MEAL_CARD_CACHE_TTL)
+
+    return mark_safe(''.join(cards).replace(CSRF_PLACEHOLDER, csrf_token))
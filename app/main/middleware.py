@@ -0,0 +1,29 @@
+from django.utils.functional import SimpleLazyObject
+
+def load_latest_meal_plan(request):
+    """The meal plan the user joined most recently, or None"""
+    if not request.user.is_authenticated:
+        return None
+    membership = request.user.memberships.select_related('meal_plan').order_by('-joined_at').first()
+    return membership.meal_plan if membership else None
+
+def get_latest_meal_plan(request):
+    """
+    The request's latest meal plan as a lazy object, looked up at most once per request.
+
+    Nothing is queried until the plan is used, so pages whose templates never show it
+    skip the query entirely.
+    """
+    if not hasattr(request, 'latest_meal_plan'):
+        request.latest_meal_plan = SimpleLazyObject(lambda: load_latest_meal_plan(request))
+    return request.latest_meal_plan
+
+class LatestMealPlanMiddleware:
+    """Attach a lazy, request-cached latest_meal_plan shared by views and templates"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        get_latest_meal_plan(request)
+        return self.get_response(request)
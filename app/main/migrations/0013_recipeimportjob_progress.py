@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_recipeparsecacheentry_cachecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeimportjob',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
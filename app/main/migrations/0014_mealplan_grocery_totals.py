@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_recipeimportjob_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealplan',
+            name='grocery_contributions',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mealplan',
+            name='grocery_totals',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
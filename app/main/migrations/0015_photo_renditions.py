@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_mealplan_grocery_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='photo_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='photo_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='photo_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_photo_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealplan',
+            name='rendered_grocery_list',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
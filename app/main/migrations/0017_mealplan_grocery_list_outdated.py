@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_mealplan_rendered_grocery_list'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealplan',
+            name='grocery_list_outdated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
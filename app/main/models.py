@@ -1,11 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .utils import convert_to_grams
 from uuid import uuid4
 
 class Collection(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='collections')
     photo = models.ImageField(upload_to='collection_photos/', null=True, blank=True)
+    # Resized copies of photo for srcset, see main.renditions
+    photo_renditions = models.JSONField(default=dict, blank=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
 
@@ -18,6 +21,11 @@ class MealPlan(models.Model):
     shareable_link = models.UUIDField(default=uuid4, unique=True, editable=False)
     grocery_list = models.TextField(blank=True, null=True)
     grocery_list_instruction = models.TextField(blank=True, null=True)
+    # Structured grocery list kept up to date as meals are toggled, see main.grocery
+    grocery_totals = models.JSONField(null=True, blank=True)
+    grocery_contributions = models.JSONField(null=True, blank=True)
+    rendered_grocery_list = models.TextField(blank=True, null=True)
+    grocery_list_outdated = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
@@ -26,6 +34,8 @@ class Meal(models.Model):
     collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='meals')
     url = models.URLField(null=True, blank=True)
     photo = models.ImageField(upload_to='meal_photos/', null=True, blank=True)
+    # Resized copies of photo for srcset, see main.renditions
+    photo_renditions = models.JSONField(default=dict, blank=True)
     title = models.CharField(max_length=255)
     meal_plan = models.ManyToManyField(MealPlan, related_name='meals')
     description = models.TextField()
@@ -42,6 +52,8 @@ class Meal(models.Model):
 class Recipe(models.Model):
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='recipes')
     photo = models.ImageField(upload_to='recipe_photos/', null=True, blank=True)
+    # Resized copies of photo for srcset, see main.renditions
+    photo_renditions = models.JSONField(default=dict, blank=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
 
@@ -78,3 +90,74 @@ class Membership(models.Model):
 
     class Meta:
         unique_together = ('user', 'meal_plan')
+
+class RecipeImportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='recipe_import_jobs', on_delete=models.CASCADE)
+    collection = models.ForeignKey(Collection, related_name='recipe_import_jobs', on_delete=models.CASCADE)
+    meal = models.ForeignKey(Meal, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    raw_text = models.TextField(blank=True)
+    photo_urls = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    progress = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import {self.id} ({self.status})"
+
+    @property
+    def progress_message(self):
+        """Describe how far along a pending import is for the importer UI"""
+        progress = self.progress or {}
+        if progress.get('stage') == 'fetching':
+            return 'Reading recipe pages...'
+        if progress.get('stage') == 'photos':
+            return 'Preparing photos...'
+        if not progress.get('title'):
+            return 'Analyzing recipe...'
+        details = []
+        if progress.get('ingredients'):
+            details.append(f"{progress['ingredients']} ingredients")
+        if progress.get('steps'):
+            details.append(f"{progress['steps']} steps")
+        return f"Found {progress['title']}" + (f": {', '.join(details)}" if details else '')
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+class RecipeParseCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.key
+
+class CacheCounter(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.hits} hits, {self.misses} misses"
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,84 @@
+"""
+Responsive renditions of model photos.
+
+When a Collection, Meal or Recipe is saved with a new photo, smaller copies are
+generated in WebP and JPEG at each of IMAGE_RENDITION_WIDTHS and recorded on the
+row's photo_renditions, which the {% responsive_photo %} tag turns into srcsets.
+Generation runs on the photo pool once the save commits; photos saved before
+renditions existed are filled in with `manage.py generate_renditions`.
+
+photo_renditions looks like:
+
+    {"source": "collection_photos/cake.jpg",
+     "width": 3024, "height": 4032,
+     "webp": {"320": "renditions/collection_photos/cake.320w.webp", ...},
+     "jpeg": {"320": "renditions/collection_photos/cake.320w.jpg", ...}}
+
+Renditions are recorded against the photo they came from, so a replaced photo is
+never shown with its predecessor's renditions.
+"""
+import logging
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+from .images import open_image, get_photo_executor
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+def rendition_name(source_name, width, extension):
+    root, _ = os.path.splitext(source_name)
+    return f"renditions/{root}.{width}w.{extension}"
+
+def renditions_are_current(instance):
+    return bool(instance.photo) and instance.photo_renditions.get('source') == instance.photo.name
+
+def build_renditions(source_name, img):
+    """Store every rendition of an image, returning the photo_renditions record"""
+    record = {'source': source_name, 'width': img.width, 'height': img.height}
+    # Never upscale; a small photo gets a single rendition at its own width
+    widths = sorted({min(width, img.width) for width in settings.IMAGE_RENDITION_WIDTHS})
+    for width in widths:
+        resized = img if width == img.width else img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        for key, (image_format, extension) in RENDITION_FORMATS.items():
+            output = BytesIO()
+            resized.save(output, format=image_format, quality=settings.IMAGE_RENDITION_QUALITY)
+            name = rendition_name(source_name, width, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            record.setdefault(key, {})[str(width)] = default_storage.save(name, ContentFile(output.getvalue()))
+    return record
+
+def generate_renditions(instance):
+    """Generate renditions of an instance's photo and record them if the photo hasn't changed since"""
+    source_name = instance.photo.name
+    with instance.photo.open('rb') as photo:
+        img = open_image(photo)
+    record = build_renditions(source_name, img)
+    type(instance).objects.filter(pk=instance.pk, photo=source_name).update(photo_renditions=record)
+    instance.photo_renditions = record
+    return record
+
+def _generate_in_background(model, pk):
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is not None and instance.photo and not renditions_are_current(instance):
+            generate_renditions(instance)
+    except Exception as e:
+        logger.error(f"Error generating renditions for {model.__name__} {pk}: {str(e)}", exc_info=True)
+    finally:
+        # Pool threads outlive the request, don't leave their connections open
+        connection.close()
+
+def queue_renditions(instance):
+    """Generate renditions on the photo pool once the current transaction commits"""
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: get_photo_executor().submit(_generate_in_background, model, pk))
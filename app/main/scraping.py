@@ -0,0 +1,197 @@
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from .utils import LRUCache
+from .structured_recipes import extract_structured_recipe, meal_from_structured_recipes
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = 10  # seconds to connect and between bytes for a single page
+FETCH_DEADLINE = 30  # seconds for all pages in one import
+FETCH_MAX_BYTES = 5 * 1024 * 1024
+FETCH_MAX_WORKERS = 5
+FETCH_HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; OurMeals recipe importer)'}
+PAGE_CACHE_MAX_SIZE = 20 * 1024 * 1024  # characters of extracted text
+PAGE_CACHE_FRESH_SECONDS = 10 * 60
+
+# Shared session so repeat requests to a host reuse pooled keep-alive connections
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS))
+session.mount('https://', HTTPAdapter(pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS))
+
+# Tags whose content never contributes recipe text; JSON-LD scripts are kept for structured data
+def _block(tag, attrs=r'[^>]*'):
+    # Unrolled loop up to the closing tag, much faster than a lazy .*? on large blocks
+    return rf'<{tag}\b{attrs}>[^<]*(?:<(?!/{tag}\s*>)[^<]*)*</{tag}\s*>'
+
+STRIP_PATTERN = re.compile(
+    '|'.join([
+        _block('script', r'(?![^>]*application/ld\+json)[^>]*'),
+        _block('style'),
+        _block('noscript'),
+        _block('svg'),
+        r'<!--[^-]*(?:-(?!->)[^-]*)*-->',
+    ]),
+    re.IGNORECASE,
+)
+
+def available_html_parser():
+    """Prefer lxml's C parser when it's installed, falling back to the stdlib parser"""
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+HTML_PARSER = available_html_parser()
+
+# Extracted page text by URL, kept by the import worker so retries don't refetch and reparse
+page_cache = LRUCache(PAGE_CACHE_MAX_SIZE, sizeof=lambda page: len(page['text']))
+
+def fetch_url(url, headers=None):
+    """
+    Download a page with a timeout, refusing bodies over FETCH_MAX_BYTES.
+
+    Returns (status_code, html, response_headers); html is None for a 304.
+    """
+    with session.get(url, headers={**FETCH_HEADERS, **(headers or {})}, timeout=FETCH_TIMEOUT, stream=True) as response:
+        if response.status_code == 304:
+            return 304, None, response.headers
+        response.raise_for_status()
+
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body.extend(chunk)
+            if len(body) > FETCH_MAX_BYTES:
+                raise ValueError(f"Page is larger than {FETCH_MAX_BYTES // (1024 * 1024)}MB")
+
+        encoding = response.encoding or response.apparent_encoding or 'utf-8'
+        return response.status_code, bytes(body).decode(encoding, errors='replace'), response.headers
+
+def strip_non_content(html):
+    """Drop scripts, styles and comments in one regex pass so the parser never builds them"""
+    return STRIP_PATTERN.sub('', html)
+
+def extract_page(html, parser=None, strip=True):
+    """
+    Parse a page once for both its main content text and any schema.org recipe.
+
+    Returns a dict with 'text' and 'recipe' (None when the page has no complete
+    structured recipe).
+    """
+    soup = BeautifulSoup(strip_non_content(html) if strip else html, parser or HTML_PARSER)
+    recipe = extract_structured_recipe(soup)
+
+    # Extract main content
+    article = soup.find('article') or soup.find('main') or soup.find('body')
+    if not article:
+        return {'text': html, 'recipe': recipe}
+
+    # Remove unwanted elements
+    for element in article.find_all(['script', 'style', 'nav', 'header', 'footer']):
+        element.decompose()
+
+    return {'text': article.get_text(), 'recipe': recipe}
+
+def get_recipe_text_from_url(url):
+    """
+    Get recipe text from a URL.
+
+    Extracted text, and any structured recipe found on the page, is cached per URL. A cached page is reused outright for
+    PAGE_CACHE_FRESH_SECONDS, after which it is revalidated with a conditional GET
+    when the site gave us an ETag or Last-Modified.
+    """
+    try:
+        cached = page_cache.get(url)
+        if cached and time.monotonic() - cached['fetched_at'] < PAGE_CACHE_FRESH_SECONDS:
+            return cached['text']
+
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        status, html, response_headers = fetch_url(url, headers)
+        if status == 304:
+            page_cache.set(url, {**cached, 'fetched_at': time.monotonic()})
+            return cached['text']
+
+        page = extract_page(html)
+        page_cache.set(url, {
+            **page,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'fetched_at': time.monotonic(),
+        })
+        return page['text']
+
+    except Exception as e:
+        logger.error(f"Error fetching recipe from URL: {str(e)}")
+        raise ValueError(f"Failed to access the recipe URL: {str(e)}")
+
+def get_recipe_texts_from_urls(urls):
+    """
+    Fetch the recipe text for several URLs concurrently.
+
+    Repeated URLs are fetched once. Returns a dict of url -> text in the order the
+    URLs were given. Raises ValueError for the first URL that failed or if all pages
+    aren't back within FETCH_DEADLINE.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=min(FETCH_MAX_WORKERS, len(unique_urls)))
+    try:
+        futures = {url: executor.submit(get_recipe_text_from_url, url) for url in unique_urls}
+        _, not_done = wait(futures.values(), timeout=FETCH_DEADLINE)
+        if not_done:
+            slow = [url for url, future in futures.items() if future in not_done]
+            raise ValueError(f"Failed to access the recipe URL: timed out fetching {', '.join(slow)}")
+        return {url: future.result() for url, future in futures.items()}
+    finally:
+        # Don't hold the import up for stragglers, they are bounded by FETCH_TIMEOUT
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def extract_urls_from_text(text):
+    """Extract URLs from text using regex pattern"""
+    url_pattern = r'https?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F]{2}))+'
+    return re.findall(url_pattern, text)
+
+def expand_recipe_urls(text):
+    """Replace each URL in the text with a Markdown section holding the page's recipe text"""
+    raw_text = text
+    for url, url_text in get_recipe_texts_from_urls(extract_urls_from_text(text)).items():
+        if url_text:
+            # Create the Markdown heading and recipe text
+            markdown_text = f"\n\n## {url}\n\n{url_text}\n\n"
+            # Replace the URL in the original text with the Markdown text
+            raw_text = raw_text.replace(url, markdown_text)
+    return raw_text
+
+def get_structured_meal(text):
+    """
+    Build meal data from the structured recipes on the pages linked in the text.
+
+    Only applies when the text is nothing but URLs whose pages have all been fetched
+    and carry a complete schema.org recipe; otherwise returns None and the AI should
+    parse the text instead. Pages are read from page_cache, so call this after
+    expand_recipe_urls.
+    """
+    urls = list(dict.fromkeys(extract_urls_from_text(text)))
+    leftover = text
+    for url in urls:
+        leftover = leftover.replace(url, '')
+    if not urls or leftover.strip():
+        return None
+
+    recipes = [(page_cache.get(url) or {}).get('recipe') for url in urls]
+    if not all(recipes):
+        return None
+
+    return meal_from_structured_recipes(recipes, url=urls[0] if len(urls) == 1 else None)
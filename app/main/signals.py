@@ -1,11 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
-from .models import MealPlan, Membership
+from .models import MealPlan, Membership, Meal, Recipe, Collection
+from .grocery import refresh_meal_in_grocery_lists
+from .access import invalidate_co_members
+from .meal_cards import bump_meal_versions
+from .renditions import renditions_are_current, queue_renditions
 
 @receiver(post_save, sender=User)
 def create_user_mealplan(sender, instance, created, **kwargs):
@@ -31,4 +35,42 @@ def join_meal_plan_on_login(sender, request, user, **kwargs):
             except:
                 # Messages middleware might not be available in tests
                 pass
-            return redirect('main:meal_plan_detail', shareable_link=shareable_link)
\ No newline at end of file
+            return redirect('main:meal_plan_detail', shareable_link=shareable_link)
+
+@receiver(pre_delete, sender=Meal)
+def remove_meal_from_grocery_lists(sender, instance, **kwargs):
+    refresh_meal_in_grocery_lists(instance, removed=True)
+
+@receiver(post_save, sender=Membership)
+@receiver(pre_delete, sender=Membership)
+def refresh_co_members(sender, instance, **kwargs):
+    # Before a delete the leaving member is still in the plan, so everyone affected is found
+    invalidate_co_members(instance.meal_plan_id, instance.user_id)
+
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+def refresh_meal_card(sender, instance, **kwargs):
+    bump_meal_versions(instance.id)
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def refresh_recipe_meal_card(sender, instance, **kwargs):
+    bump_meal_versions(instance.meal_id)
+
+@receiver(m2m_changed, sender=Meal.meal_plan.through)
+def refresh_planned_meal_cards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_meal_versions(instance.id)
+    elif action == 'pre_clear':
+        bump_meal_versions(*instance.meals.values_list('id', flat=True))
+    else:
+        bump_meal_versions(*pk_set)
+
+@receiver(post_save, sender=Collection)
+@receiver(post_save, sender=Meal)
+@receiver(post_save, sender=Recipe)
+def refresh_photo_renditions(sender, instance, **kwargs):
+    if instance.photo and not renditions_are_current(instance):
+        queue_renditions(instance)
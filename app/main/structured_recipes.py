@@ -0,0 +1,167 @@
+"""
+Read schema.org Recipe data embedded in recipe pages.
+
+Most large recipe sites publish their recipes as JSON-LD or microdata. When a page
+has a complete recipe we can map it straight into the shape save_parsed_recipe
+expects and skip the AI entirely.
+"""
+import html
+import json
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+from .utils import normalize_unit
+
+logger = logging.getLogger(__name__)
+
+UNICODE_FRACTIONS = {
+    '½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅕': '1/5',
+    '⅖': '2/5', '⅗': '3/5', '⅘': '4/5', '⅙': '1/6', '⅚': '5/6', '⅛': '1/8',
+    '⅜': '3/8', '⅝': '5/8', '⅞': '7/8',
+}
+
+NUMBER = r'\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?'
+AMOUNT_PATTERN = re.compile(rf'^\s*(?P<amount>(?:{NUMBER})(?:\s*(?:-|–|to)\s*(?:{NUMBER}))?)\s*(?P<rest>.*)$', re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+def clean_text(value):
+    """Strip markup and entities from a schema.org text value"""
+    if not isinstance(value, str):
+        return ''
+    text = ' '.join(html.unescape(TAG_PATTERN.sub(' ', value)).split())
+    return re.sub(r'\s+([.,;:!?])', r'\1', text)
+
+def to_decimal_string(number):
+    """Convert '1 1/2', '3/4' or '2' to a decimal string like '1.5'"""
+    total = Decimal(0)
+    for part in number.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            total += Decimal(numerator) / Decimal(denominator)
+        else:
+            total += Decimal(part)
+    return f"{total.quantize(Decimal('0.01')).normalize():f}"
+
+def parse_ingredient_line(line):
+    """Split an ingredient line like '2 1/4 cups flour' into name, amount and unit"""
+    text = clean_text(line)
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        text = re.sub(rf'(\d){symbol}', rf'\1 {fraction}', text).replace(symbol, fraction)
+
+    match = AMOUNT_PATTERN.match(text)
+    if not match:
+        return {'name': text, 'amount': None, 'unit': ''}
+
+    try:
+        amount = '-'.join(to_decimal_string(n) for n in re.split(r'\s*(?:-|–|to)\s*', match.group('amount')))
+    except (InvalidOperation, ZeroDivisionError):
+        return {'name': text, 'amount': None, 'unit': ''}
+
+    rest = match.group('rest')
+    first_word, _, remainder = rest.partition(' ')
+    unit = normalize_unit(first_word)
+    if unit:
+        rest = remainder
+    name = re.sub(r'^of\s+', '', rest.strip(' ,')) or text
+    return {'name': name, 'amount': amount, 'unit': unit or ''}
+
+def _instruction_steps(instructions):
+    """Flatten recipeInstructions (text, HowToStep or HowToSection) into step strings"""
+    if isinstance(instructions, str):
+        text = html.unescape(instructions)
+        steps = re.split(r'<(?:li|p|br)[^>]*>|\n+', text) if re.search(r'<(?:li|p|br)|\n', text) else [text]
+        return [step for step in (clean_text(s) for s in steps) if step]
+    if isinstance(instructions, dict):
+        if 'itemListElement' in instructions:
+            return _instruction_steps(instructions['itemListElement'])
+        return _instruction_steps(instructions.get('text') or instructions.get('name') or '')
+    if isinstance(instructions, list):
+        steps = []
+        for item in instructions:
+            steps.extend(_instruction_steps(item))
+        return steps
+    return []
+
+def _is_recipe(node):
+    types = node.get('@type', [])
+    types = types if isinstance(types, list) else [types]
+    return 'Recipe' in types
+
+def _find_recipe_nodes(data):
+    """Walk a JSON-LD document, including @graph and nested lists, for Recipe nodes"""
+    if isinstance(data, list):
+        for item in data:
+            yield from _find_recipe_nodes(item)
+    elif isinstance(data, dict):
+        if _is_recipe(data):
+            yield data
+        for key in ('@graph', 'mainEntity', 'mainEntityOfPage'):
+            if isinstance(data.get(key), (list, dict)):
+                yield from _find_recipe_nodes(data[key])
+
+def recipe_from_schema(node):
+    """
+    Map a schema.org Recipe into our recipe dict.
+
+    Returns None unless the recipe has a name, ingredients and method steps.
+    """
+    ingredients = node.get('recipeIngredient') or node.get('ingredients') or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    recipe = {
+        'title': clean_text(node.get('name')),
+        'description': clean_text(node.get('description')),
+        'ingredients': [parse_ingredient_line(line) for line in ingredients if clean_text(line)],
+        'method': _instruction_steps(node.get('recipeInstructions')),
+    }
+    if not (recipe['title'] and recipe['ingredients'] and recipe['method']):
+        return None
+    return recipe
+
+def _json_ld_recipe(soup):
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string or '')
+        except (TypeError, ValueError):
+            continue
+        for node in _find_recipe_nodes(data):
+            recipe = recipe_from_schema(node)
+            if recipe:
+                return recipe
+    return None
+
+def _itemprop_values(scope, prop):
+    values = []
+    for element in scope.find_all(attrs={'itemprop': prop}):
+        values.append(element.get('content') or element.get_text(' ', strip=True))
+    return values
+
+def _microdata_recipe(soup):
+    for scope in soup.find_all(attrs={'itemtype': re.compile(r'schema\.org/Recipe$')}):
+        node = {
+            'name': next(iter(_itemprop_values(scope, 'name')), ''),
+            'description': next(iter(_itemprop_values(scope, 'description')), ''),
+            'recipeIngredient': _itemprop_values(scope, 'recipeIngredient') or _itemprop_values(scope, 'ingredients'),
+            'recipeInstructions': _itemprop_values(scope, 'recipeInstructions'),
+        }
+        recipe = recipe_from_schema(node)
+        if recipe:
+            return recipe
+    return None
+
+def extract_structured_recipe(soup):
+    """Find a complete schema.org Recipe in a parsed page, preferring JSON-LD over microdata"""
+    try:
+        return _json_ld_recipe(soup) or _microdata_recipe(soup)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable structured recipe data: {str(e)}")
+        return None
+
+def meal_from_structured_recipes(recipes, url=None):
+    """Build meal data for save_parsed_recipe from one or more structured recipes"""
+    return {
+        'title': recipes[0]['title'],
+        'description': recipes[0]['description'],
+        'url': url or '',
+        'recipes': recipes,
+    }
@@ -0,0 +1,15 @@
+from django import template
+from ..meal_cards import render_meal_cards
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def meal_cards(context, meals):
+    """Render meal cards from the fragment cache, using the plan and buttons in context"""
+    return render_meal_cards(
+        meals,
+        request=context.get('request'),
+        current_meal_plan=context.get('current_meal_plan'),
+        meal_plan_recipes=context.get('meal_plan_recipes') or (),
+        show_buttons=context.get('show_buttons'),
+    )
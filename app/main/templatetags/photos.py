@@ -0,0 +1,41 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from ..renditions import renditions_are_current
+
+register = template.Library()
+
+def srcset(renditions):
+    return ', '.join(
+        f"{default_storage.url(name)} {width}w"
+        for width, name in sorted(renditions.items(), key=lambda item: int(item[0]))
+    )
+
+@register.simple_tag
+def responsive_photo(obj, sizes='100vw', **attrs):
+    """
+    Render obj.photo as a <picture> offering its WebP and JPEG renditions.
+
+    sizes describes how wide the image is displayed so the browser can pick the
+    smallest rendition that fits. Extra keyword arguments become attributes of the
+    <img>, e.g. {% responsive_photo collection sizes="33vw" class="card-img-top" alt=collection.title %}.
+    Photos without renditions yet are rendered as a plain lazy-loaded <img>.
+    """
+    if not obj.photo:
+        return ''
+    attributes = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+
+    if not renditions_are_current(obj):
+        return format_html('<img src="{}" {} loading="lazy" decoding="async">', obj.photo.url, attributes)
+
+    renditions = obj.photo_renditions
+    largest = max(renditions['jpeg'], key=int)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" {} loading="lazy" decoding="async">'
+        '</picture>',
+        srcset(renditions['webp']), sizes,
+        default_storage.url(renditions['jpeg'][largest]), srcset(renditions['jpeg']), sizes,
+        renditions['width'], renditions['height'], attributes,
+    )
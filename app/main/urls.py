@@ -13,6 +13,8 @@ urlpatterns = [
     # Meals
     path('collections/<int:collection_id>/meals/create/', views.scrape_recipe, name='scrape'),
     path('upload-photos/', views.upload_photos, name='upload_photos'),
+    path('photos/<uuid:photo_id>/', views.uploaded_photo, name='uploaded_photo'),
+    path('import-jobs/<uuid:job_id>/', views.recipe_import_status, name='recipe_import_status'),
     path('meals/<int:pk>/', views.meal_detail, name='meal_detail'),  
     path('meals/<int:pk>/edit/', views.meal_edit, name='meal_edit'),  
     path('meals/<int:pk>/edit/save/', views.meal_edit_post, name='meal_edit_post'),  
@@ -29,4 +31,5 @@ urlpatterns = [
     # Grocery Lists
     path('meal-plans/<uuid:shareable_link>/create-grocery-list/', views.create_grocery_list, name='create_grocery_list'),
     path('meal-plans/<uuid:shareable_link>/save-grocery-list/', views.save_grocery_list, name='save_grocery_list'),
+    path('meal-plans/<uuid:shareable_link>/refresh-grocery-list/', views.refresh_grocery_list, name='refresh_grocery_list'),
 ]
\ No newline at end of file
@@ -1,21 +1,116 @@
+import threading
+from collections import OrderedDict
+
 def convert_to_grams(amount, unit, region='US'):
     try:
         amount = float(amount)
     except (ValueError, TypeError):
         return None
-        
-    conversion_factors = {
-        'US': {
-            'cup': 240,  # grams per cup
-            'tablespoon': 15,
-        },
-        'AU': {
-            'cup': 250,
-            'tablespoon': 20,
-        }
-    }
-    factors = conversion_factors.get(region, {})
-    factor = factors.get(unit.lower())
-    if factor:
-        return amount * factor
-    return amount  # Return original amount if unit not found
\ No newline at end of file
+
+    # Volumes are weighed as water
+    base_amount, base_unit = to_base_unit(amount, unit, region)
+    if base_unit in ('g', 'ml'):
+        return base_amount
+    return amount  # Return original amount if unit not found
+
+# Spellings of common units mapped to the abbreviations our recipes use
+UNIT_ALIASES = {
+    'cup': 'cup', 'cups': 'cup', 'c': 'cup',
+    'tablespoon': 'tbsp', 'tablespoons': 'tbsp', 'tbsp': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp', 'tbsps': 'tbsp',
+    'teaspoon': 'tsp', 'teaspoons': 'tsp', 'tsp': 'tsp', 'tsps': 'tsp',
+    'gram': 'g', 'grams': 'g', 'g': 'g', 'gr': 'g',
+    'kilogram': 'kg', 'kilograms': 'kg', 'kg': 'kg', 'kgs': 'kg',
+    'milliliter': 'ml', 'milliliters': 'ml', 'millilitre': 'ml', 'millilitres': 'ml', 'ml': 'ml',
+    'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l', 'l': 'l',
+    'ounce': 'oz', 'ounces': 'oz', 'oz': 'oz',
+    'pound': 'lb', 'pounds': 'lb', 'lb': 'lb', 'lbs': 'lb',
+    'pinch': 'pinch', 'pinches': 'pinch',
+    'clove': 'clove', 'cloves': 'clove',
+    'can': 'can', 'cans': 'can', 'tin': 'can', 'tins': 'can',
+    'slice': 'slice', 'slices': 'slice',
+    'bunch': 'bunch', 'bunches': 'bunch',
+}
+
+def normalize_unit(unit):
+    """Return the standard abbreviation for a unit, or None if it isn't one we know"""
+    return UNIT_ALIASES.get((unit or '').lower().rstrip('.'))
+
+# Size of each standard unit in grams (mass) or millilitres (volume)
+UNIT_CONVERSIONS = {
+    'g': ('g', 1),
+    'kg': ('g', 1000),
+    'oz': ('g', 28.35),
+    'lb': ('g', 453.59),
+    'ml': ('ml', 1),
+    'l': ('ml', 1000),
+    'tsp': ('ml', 5),
+    'tbsp': ('ml', 15),
+    'cup': ('ml', 240),
+}
+
+# Spoons and cups are bigger in some places
+REGIONAL_UNIT_CONVERSIONS = {
+    'AU': {'tbsp': ('ml', 20), 'cup': ('ml', 250)},
+}
+
+def to_base_unit(amount, unit, region='US'):
+    """
+    Convert an amount to grams or millilitres.
+
+    Returns (amount, base_unit). Units we can't convert, like cloves or cans, come
+    back unchanged apart from normalizing the unit's spelling.
+    """
+    normalized = normalize_unit(unit)
+    conversion = REGIONAL_UNIT_CONVERSIONS.get(region, {}).get(normalized) or UNIT_CONVERSIONS.get(normalized)
+    if conversion is None:
+        return amount, normalized or (unit or '').strip().lower()
+    base_unit, factor = conversion
+    return amount * factor, base_unit
+
+class LRUCache:
+    """
+    Thread-safe in-process cache bounded by the total size of its values.
+
+    The least recently used entries are evicted once max_size is exceeded. Sizes are
+    measured with sizeof, which defaults to len.
+    """
+
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_size:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -1,16 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Count
+from django.db.models import Count, Prefetch
 from django.contrib import messages
 from django.http import JsonResponse, Http404, HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.middleware.csrf import get_token
-from .models import Collection, Recipe, Meal, Ingredient, MethodStep, MealPlan, Membership
+from .models import Collection, Recipe, Meal, Ingredient, MethodStep, MealPlan, Membership, RecipeImportJob
 from .forms import CollectionForm
-import requests
-from bs4 import BeautifulSoup
 from .ai_helpers import summarize_grocery_list_with_genai, parse_recipe_with_genai, save_parsed_recipe, format_meal_as_markdown, _create_or_update_meal_from_data
+from .jobs import enqueue_recipe_import, fail_stale_recipe_imports
+from .grocery import gather_ingredients, rebuild_grocery_totals, apply_meal_toggle, grocery_list_is_rendered, render_grocery_list
+from .access import co_member_ids, can_access_user
+from .middleware import get_latest_meal_plan
+from .meal_cards import render_meal_cards
+from .images import queue_photo, get_photo_status, PHOTO_READY, PHOTO_FAILED
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from decimal import Decimal, InvalidOperation
@@ -21,15 +25,8 @@ from django.http import HttpResponse, HttpResponseForbidden
 from django.urls import reverse
 from django.template.loader import render_to_string
 from django.db.models import Count, Q
-import uuid
-from django.core.files.storage import default_storage
 import os
 from django.conf import settings
-import base64
-from PIL import Image
-import pillow_heif
-from io import BytesIO
-from django.core.files.base import ContentFile
 import re
 
 # Configure logger
@@ -41,69 +38,55 @@ def get_possessive_name(name):
         return f"{name}'"
     return f"{name}'s"
 
-def get_recipe_text_from_url(url):
-    """Get recipe text from a URL"""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract main content
-        article = soup.find('article') or soup.find('main') or soup.find('body')
-        if not article:
-            return response.text
-            
-        # Remove unwanted elements
-        for element in article.find_all(['script', 'style', 'nav', 'header', 'footer']):
-            element.decompose()
-            
-        return article.get_text()
-        
-    except Exception as e:
-        logger.error(f"Error fetching recipe from URL: {str(e)}")
-        raise ValueError(f"Failed to access the recipe URL: {str(e)}")
-
-def extract_urls_from_text(text):
-    """Extract URLs from text using regex pattern"""
-    url_pattern = r'https?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F]{2}))+'
-    return re.findall(url_pattern, text)
-
 # @login_required
 # def collection_list(request):
 #     collections = Collection.objects.filter(user=request.user)
 #     return render(request, 'main/collection_list copy.html', {'collections': collections})
 
 def latest_meal_plan(request):
-    latest_membership = request.user.memberships.order_by('-joined_at').first()
-    latest_meal_plan = latest_membership.meal_plan if latest_membership else None
-    return latest_meal_plan
+    # Shared with the base template through the request, so it is only queried once
+    meal_plan = get_latest_meal_plan(request)
+    return meal_plan if meal_plan else None
+
+def meal_plan_meal_ids(meal_plan):
+    """IDs of the meals in a plan as a set, for cheap membership checks on every meal card"""
+    return set(meal_plan.meals.values_list('id', flat=True)) if meal_plan else set()
+
+# Prefetch plans so templates never load related rows one at a time
+def meal_cards_prefetch(lookup='meals'):
+    return Prefetch(lookup, queryset=Meal.objects.order_by('id'))
+
+def recipes_prefetch(lookup='recipes'):
+    return Prefetch(lookup, queryset=Recipe.objects.order_by('id').prefetch_related(
+        Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+        Prefetch('method_steps', queryset=MethodStep.objects.order_by('id')),
+    ))
 
 @login_required
 def collection_list(request):
-    # Get all meal plans where the user is a member
-    user_meal_plans = MealPlan.objects.filter(memberships__user=request.user)
-    
-    # Get all users who share any meal plan with the current user
-    shared_users = User.objects.filter(
-        memberships__meal_plan__in=user_meal_plans
-    ).distinct().exclude(id=request.user.id)
+    # Everyone who shares any meal plan with the current user
+    shared_users = list(User.objects.filter(id__in=co_member_ids(request.user)).order_by('username'))
     
     # Get the latest meal plan for member removal context
     meal_plan = latest_meal_plan(request)
     
-    # Group collections by owner with additional member info
-    grouped_collections = {}
+    # Load every visible collection at once and group them by owner
+    collections_by_owner = {}
+    owner_ids = [request.user.id] + [shared_user.id for shared_user in shared_users]
+    for collection in Collection.objects.filter(user_id__in=owner_ids).order_by('id'):
+        collections_by_owner.setdefault(collection.user_id, []).append(collection)
     
-    # Add user's own collections first
+    # Group collections by owner with additional member info, user's own collections first
+    grouped_collections = {}
     grouped_collections['Your Cook Books'] = {
-        'collections': Collection.objects.filter(user=request.user),
+        'collections': collections_by_owner.get(request.user.id, []),
         'member_id': None
     }
     
     # Add collections from users who share any meal plan
     for shared_user in shared_users:
         grouped_collections[f"{get_possessive_name(shared_user.username.title())} Cook Books"] = {
-            'collections': Collection.objects.filter(user=shared_user),
+            'collections': collections_by_owner.get(shared_user.id, []),
             'member_id': shared_user.id
         }
     
@@ -150,15 +133,37 @@ def collection_edit(request, pk):
         'collection': collection,
     })
 
+def recipe_import_job_response(job):
+    """Build the JSON payload and HTTP status describing a recipe import job"""
+    if job.status == RecipeImportJob.SUCCEEDED:
+        return {
+            'message': 'Recipe successfully imported!',
+            'status': 'success',
+            'redirect': reverse('main:meal_detail', args=[job.meal_id])
+        }, 200
+    if job.status == RecipeImportJob.FAILED:
+        return {
+            'message': job.error,
+            'status': 'error'
+        }, 400
+    return {
+        'message': job.progress_message,
+        'status': 'pending',
+        'progress': job.progress,
+        'job_id': str(job.id),
+        'status_url': reverse('main:recipe_import_status', args=[job.id])
+    }, 202
+
 @require_POST
 @login_required
-@transaction.atomic
 def scrape_recipe(request, collection_id):
-    """Scrape and parse a recipe from text, URLs, or photos"""
+    """Queue a recipe import from text, URLs, or photos"""
     try:
 
         #collection = get_object_or_404(Collection, id=collection_id, user=request.user)
-        collection = get_object_or_404(Collection, id=collection_id, user__in=User.objects.filter(memberships__meal_plan__in=request.user.memberships.values('meal_plan')))
+        collection = get_object_or_404(Collection, id=collection_id)
+        if not can_access_user(request.user, collection.user_id):
+            raise Http404("Collection not found")
         
         # Get recipe text/URLs and photos
         recipe_text_and_urls = request.POST.get('recipe_text_and_urls', '').strip()
@@ -174,34 +179,29 @@ def scrape_recipe(request, collection_id):
         if not recipe_text_and_urls and not photo_urls:
             raise ValueError("Please provide recipe text, URLs, or photos")
 
-        # Extract URLs from text and get their content
-        raw_text = recipe_text_and_urls
-        if recipe_text_and_urls:
-            urls = extract_urls_from_text(recipe_text_and_urls)
-            for url in urls:
-                url_text = get_recipe_text_from_url(url)
-                if url_text:
-                    # Create the Markdown heading and recipe text
-                    markdown_text = f"\n\n## {url}\n\n{url_text}\n\n"
-                    # Replace the URL in the original text with the Markdown text
-                    raw_text = raw_text.replace(url, markdown_text)
-        
-        # Parse recipe with text and/or photos and save it
-        recipe_data = parse_recipe_with_genai(raw_text=raw_text if raw_text else None, photos=photo_urls)
-        meal, created = save_parsed_recipe(recipe_data, collection=collection)
-        
-        logger.info(f"Created Meal: {meal.title} (ID: {meal.id})")
-        messages.success(request, "Recipe successfully imported!")
-        redirect_url = reverse('main:meal_detail', args=[meal.id])
+        # Fetching and parsing happen in the import worker (or inline without redis)
+        job = RecipeImportJob.objects.create(
+            user=request.user,
+            collection=collection,
+            raw_text=recipe_text_and_urls,
+            photo_urls=photo_urls,
+        )
+        job = enqueue_recipe_import(job)
+
+        payload, status = recipe_import_job_response(job)
+        if job.status == RecipeImportJob.SUCCEEDED:
+            messages.success(request, payload['message'])
+        elif job.status == RecipeImportJob.FAILED:
+            raise ValueError(job.error)
 
         if request.headers.get('Accept') == 'application/json':
-            return JsonResponse({
-                'message': 'Recipe successfully imported!',
-                'status': 'success',
-                'redirect': redirect_url
-            })
+            return JsonResponse(payload, status=status)
+
         # Regular form submission
-        return redirect(redirect_url)
+        if job.status == RecipeImportJob.SUCCEEDED:
+            return redirect(payload['redirect'])
+        messages.info(request, "Your recipe is being imported and will appear in this collection shortly.")
+        return redirect('main:collection_detail', pk=collection.id)
         
     except Http404:
         if request.headers.get('Accept') == 'application/json':
@@ -222,24 +222,30 @@ def scrape_recipe(request, collection_id):
         messages.error(request, str(e))
         return redirect('main:collection_detail', pk=collection.id)
 
+@login_required
+def recipe_import_status(request, job_id):
+    """Report the progress of a queued recipe import for polling clients"""
+    job = get_object_or_404(RecipeImportJob, id=job_id, user=request.user)
+    if job.status == RecipeImportJob.RUNNING and fail_stale_recipe_imports(id=job.id):
+        job.refresh_from_db()
+    payload, status = recipe_import_job_response(job)
+    if job.status == RecipeImportJob.SUCCEEDED:
+        messages.success(request, payload['message'])
+    return JsonResponse(payload, status=status)
+
 @login_required
 def collection_detail(request, pk):
-    collection = get_object_or_404(Collection, pk=pk)
+    collection = get_object_or_404(
+        Collection.objects.select_related('user').prefetch_related(meal_cards_prefetch()),
+        pk=pk,
+    )
     
     # Check if user owns the collection or shares any meal plan with the collection owner
-    if collection.user != request.user:
-        # Get all meal plans where both users are members
-        shared_meal_plans = MealPlan.objects.filter(
-            memberships__user__in=[request.user, collection.user]
-        ).annotate(
-            member_count=Count('memberships__user', distinct=True)
-        ).filter(member_count=2).exists()
-        
-        if not shared_meal_plans:
-            raise Http404("Collection not found")
+    if not can_access_user(request.user, collection.user_id):
+        raise Http404("Collection not found")
     
     meal_plan = latest_meal_plan(request)
-    meal_plan_recipes = meal_plan.meals.values_list('id', flat=True) if meal_plan else []
+    meal_plan_recipes = meal_plan_meal_ids(meal_plan)
 
     context = {
         'collection': collection,
@@ -254,12 +260,12 @@ def meal_detail(request, pk):
     """
     Display the details of a specific Meal, including its Recipes.
     """
-    meal = get_object_or_404(Meal, pk=pk)
+    meal = get_object_or_404(Meal.objects.prefetch_related(recipes_prefetch()), pk=pk)
     recipes = meal.recipes.all()
     
     # Get meal plan info
     meal_plan = latest_meal_plan(request)
-    meal_plan_recipes = meal_plan.meals.values_list('id', flat=True) if meal_plan else []
+    meal_plan_recipes = meal_plan_meal_ids(meal_plan)
     
     context = {
         'meal': meal,
@@ -323,20 +329,27 @@ def meal_plan_detail(request, shareable_link):
     """
     Display a meal plan based on the shareable link. Accessible to both authenticated members and unauthenticated users.
     """
-    meal_plan = get_object_or_404(MealPlan, shareable_link=shareable_link)
+    meal_plan = get_object_or_404(
+        MealPlan.objects.select_related('owner').prefetch_related(
+            meal_cards_prefetch(),
+            Prefetch('memberships', queryset=Membership.objects.select_related('user').order_by('joined_at')),
+        ),
+        shareable_link=shareable_link,
+    )
     
     # Get all members except the owner
-    other_members = meal_plan.memberships.exclude(user=meal_plan.owner)
-    all_members = [m.user for m in meal_plan.memberships.all()]
+    memberships = meal_plan.memberships.all()
+    other_members = [m for m in memberships if m.user_id != meal_plan.owner_id]
+    all_members = [m.user for m in memberships]
     
 
     context = {
         'meal_plan': meal_plan,
         'is_member': request.user.is_authenticated and (
-            meal_plan.owner == request.user or 
-            meal_plan.memberships.filter(user=request.user).exists()
+            meal_plan.owner_id == request.user.id or 
+            any(m.user_id == request.user.id for m in memberships)
         ),
-        'meal_plan_recipes': [meal.id for meal in meal_plan.meals.all()],
+        'meal_plan_recipes': {meal.id for meal in meal_plan.meals.all()},
         'current_meal_plan': meal_plan,
         'other_members': other_members,
         'all_members': all_members,
@@ -388,47 +401,51 @@ def toggle_meal_in_meal_plan(request, shareable_link, meal_id):
     Add or remove a meal from a meal plan.
     """
     meal_plan = get_object_or_404(MealPlan, shareable_link=shareable_link)
-    meal = get_object_or_404(Meal, id=meal_id)
+    meal = get_object_or_404(Meal.objects.select_related('collection'), id=meal_id)
     
     # Check if user is a member of the meal plan
     if not meal_plan.memberships.filter(user=request.user).exists():
         raise Http404("Meal plan not found")
     
     # Check if user has access to the meal through shared meal plans
-    if meal.collection.user != request.user:
-        shared_meal_plans = MealPlan.objects.filter(
-            memberships__user__in=[request.user, meal.collection.user]
-        ).annotate(
-            member_count=Count('memberships__user', distinct=True)
-        ).filter(member_count=2).exists()
-        
-        if not shared_meal_plans:
-            raise Http404("Meal not found")
+    if not can_access_user(request.user, meal.collection.user_id):
+        raise Http404("Meal not found")
     
     # Toggle meal in meal plan
     if meal in meal_plan.meals.all():
         meal_plan.meals.remove(meal)
         message = f"{meal.title} removed from meal plan!"
         status = 'success'
+        added = False
     else:
         meal_plan.meals.add(meal)
         message = f"{meal.title} added to meal plan!"
         status = 'success'
+        added = True
+    
+    # Apply just this meal's ingredients to the grocery list
+    meal_plan = apply_meal_toggle(meal_plan, meal, added)
     
     # Handle AJAX requests
     if request.headers.get('Accept') == 'application/json':
-        context = { 
-            'meal': meal,
-            'meal_plan_recipes': meal_plan.meals.values_list('id', flat=True),
-            'current_meal_plan': meal_plan,
-            'show_buttons': True,
-        }
-        html = render_to_string('main/_meal.html', context, request)
-        return JsonResponse({
+        html = render_meal_cards(
+            [meal],
+            request=request,
+            current_meal_plan=meal_plan,
+            meal_plan_recipes={meal.id} if added else set(),
+            show_buttons=True,
+        )
+        data = {
             'message': message,
             'status': status,
-            'html': html
-        })
+            'html': html,
+        }
+        # Only send the list if it changed, an AI or hand edited list is left as it is and flagged
+        if grocery_list_is_rendered(meal_plan):
+            data['grocery_list'] = meal_plan.grocery_list
+        else:
+            data['grocery_list_outdated'] = meal_plan.grocery_list_outdated
+        return JsonResponse(data)
     
     # Handle regular form submissions
     messages.success(request, message)
@@ -474,10 +491,12 @@ def create_grocery_list(request, shareable_link):
         raise Http404("Meal plan not found")
     
     ingredients = gather_ingredients(meal_plan)
+    render_grocery_list(rebuild_grocery_totals(meal_plan, ingredients))
     grocery_list_instruction = request.POST.get('grocery_list_instruction', '') or ''
     formatted_list = summarize_grocery_list_with_genai(ingredients, grocery_list_instruction)
     meal_plan.grocery_list = formatted_list
     meal_plan.grocery_list_instruction = grocery_list_instruction
+    meal_plan.grocery_list_outdated = False
     meal_plan.save()
     
     messages.success(request, "Grocery list generated successfully!")
@@ -490,6 +509,24 @@ def create_grocery_list(request, shareable_link):
         })
     return redirect('main:meal_plan_detail', shareable_link=shareable_link)
 
+@require_POST
+@login_required
+def refresh_grocery_list(request, shareable_link):
+    """Replace an outdated grocery list with the one consolidated locally from the plan's meals"""
+    meal_plan = get_object_or_404(MealPlan, shareable_link=shareable_link)
+
+    # Check if user is a member
+    if not meal_plan.memberships.filter(user=request.user).exists():
+        raise Http404("Meal plan not found")
+
+    if meal_plan.grocery_totals is None:
+        rebuild_grocery_totals(meal_plan)
+    render_grocery_list(meal_plan)
+    meal_plan.grocery_list = meal_plan.rendered_grocery_list
+    meal_plan.grocery_list_outdated = False
+    meal_plan.save()
+    return JsonResponse({'status': 'success', 'grocery_list': meal_plan.grocery_list})
+
 @require_POST
 @login_required
 def save_grocery_list(request, shareable_link):
@@ -498,13 +535,6 @@ def save_grocery_list(request, shareable_link):
     meal_plan.save()
     return JsonResponse({'status': 'success'})
 
-def gather_ingredients(meal_plan):
-    ingredients = []
-    for meal in meal_plan.meals.all():
-        for recipe in meal.recipes.all():
-            ingredients.extend(recipe.ingredients.all())
-    return ingredients
-
 @login_required
 def meal_plan_edit(request, shareable_link):
     meal_plan = get_object_or_404(MealPlan, shareable_link=shareable_link)
@@ -538,70 +568,32 @@ def remove_member(request, shareable_link, member_id):
     messages.success(request, f"Removed {member.username} from your meal plan")
     return redirect('main:collection_list')
 
-def convert_to_jpeg(image_file):
-    """Convert any image to JPEG format"""
-    try:
-        content_type = getattr(image_file, 'content_type', '')
-        
-        if content_type == 'image/heic':
-            # Handle HEIC format
-            heif_file = pillow_heif.read_heif(image_file)
-            img = Image.frombytes(
-                heif_file.mode,
-                heif_file.size,
-                heif_file.data,
-                "raw",
-                heif_file.mode,
-                heif_file.stride,
-            )
-        else:
-            # Handle other formats
-            img = Image.open(image_file)
-        
-        # Convert to RGB if necessary (handles PNG with alpha channel)
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            bg = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            bg.paste(img, mask=img.split()[-1])  # Use alpha channel as mask
-            img = bg
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Save as JPEG to BytesIO
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=95)
-        output.seek(0)
-        return output
-    except Exception as e:
-        logger.error(f"Error converting image: {str(e)}")
-        raise
-
-def encode_image_file(file):
-    """Convert an uploaded file to base64"""
-    return base64.b64encode(file.read()).decode('utf-8')
-
 @require_POST
 @login_required
 def upload_photos(request):
-    """Handle photo uploads and return their URLs"""
+    """Accept photo uploads and return placeholder URLs while they're processed in the background"""
     if not request.FILES:
         return JsonResponse({'error': 'No files provided'}, status=400)
     
-    uploaded_urls = []
-    for file in request.FILES.getlist('photos'):
-        if not file.content_type.startswith('image/'):
-            return JsonResponse({'error': 'Only image files are allowed'}, status=400)
-            
-        # Convert to JPEG
-        jpeg_file = convert_to_jpeg(file)
+    files = request.FILES.getlist('photos')
+    if any(not file.content_type.startswith('image/') for file in files):
+        return JsonResponse({'error': 'Only image files are allowed'}, status=400)
     
-        # In production, store in S3
-        file_uuid = str(uuid.uuid4())
-        file_name = f"recipe_photos/{file_uuid}.jpg"
-        saved_name = default_storage.save(file_name, ContentFile(jpeg_file.read()))
-        url = default_storage.url(saved_name)
-
-        uploaded_urls.append(url)
+    # Conversion and storage happen on the photo pool, all files at once
+    uploaded_urls = [queue_photo(file) for file in files]
     
     return JsonResponse({'urls': uploaded_urls})
+
+def uploaded_photo(request, photo_id):
+    """Redirect to an uploaded photo once it's processed, or report that it's still pending"""
+    status = get_photo_status(photo_id)
+    if status is None:
+        raise Http404("Photo not found")
+    if status['status'] == PHOTO_READY:
+        return redirect(status['url'])
+    if status['status'] == PHOTO_FAILED:
+        return JsonResponse({'status': 'error', 'message': status['error']}, status=422)
+    
+    response = JsonResponse({'status': 'pending'}, status=202)
+    response['Retry-After'] = '1'
+    return response
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
+from urllib.parse import quote
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -58,6 +60,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     #'verbose_csrf_middleware.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.LatestMealPlanMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -143,6 +146,27 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_NUMBER_FILES = 10
 
+# Uploaded photos are spooled locally and converted and stored by a pool of threads (main/images.py)
+PHOTO_PROCESSING_WORKERS = int(os.environ.get('PHOTO_PROCESSING_WORKERS', DATA_UPLOAD_MAX_NUMBER_FILES))
+PHOTO_SPOOL_DIR = os.environ.get('PHOTO_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'ourmeals-photo-uploads'))
+PHOTO_MAX_DIMENSION = int(os.environ.get('PHOTO_MAX_DIMENSION', 4096))  # pixels, larger photos are scaled down
+PHOTO_JPEG_QUALITY = int(os.environ.get('PHOTO_JPEG_QUALITY', 95))
+
+# Each photo also gets a smaller copy for the vision model. High detail images are scaled to fit
+# 2048px and then to 768px on the short side by the model anyway. Grayscale and a contrast boost
+# suit printed recipe cards; benchmark with `manage.py benchmark_vision_images`.
+VISION_IMAGE_MAX_LONG_EDGE = int(os.environ.get('VISION_IMAGE_MAX_LONG_EDGE', 2048))
+VISION_IMAGE_MAX_SHORT_EDGE = int(os.environ.get('VISION_IMAGE_MAX_SHORT_EDGE', 768))
+VISION_IMAGE_QUALITY = int(os.environ.get('VISION_IMAGE_QUALITY', 80))
+VISION_IMAGE_GRAYSCALE = os.environ.get('VISION_IMAGE_GRAYSCALE', '0').lower() in ('1', 'true')
+VISION_IMAGE_CONTRAST = float(os.environ.get('VISION_IMAGE_CONTRAST', 1.0))  # 1.0 leaves contrast alone
+
+# Collection, meal and recipe photos are served from resized WebP and JPEG copies at these widths
+IMAGE_RENDITION_WIDTHS = [int(width) for width in os.environ.get('IMAGE_RENDITION_WIDTHS', '320,640,1280').split(',')]
+IMAGE_RENDITION_QUALITY = int(os.environ.get('IMAGE_RENDITION_QUALITY', 80))
+PHOTO_PROCESSING_TIMEOUT = int(os.environ.get('PHOTO_PROCESSING_TIMEOUT', 60))  # seconds an import waits for its photos
+PHOTO_STATUS_TTL = 60 * 60 * 24  # how long placeholder URLs keep resolving
+
 # Configure storage
 if DEBUG:
     print("In DEBUG mode, using FileSystemStorage with whitenoise for static files.")
@@ -244,4 +268,79 @@ LOGGING = {
 #     }
 # }
 
-ACCOUNT_ADAPTER = 'ourmeals.account_adapter.InviteOnlyAccountAdapter'
\ No newline at end of file
+ACCOUNT_ADAPTER = 'ourmeals.account_adapter.InviteOnlyAccountAdapter'
+
+# Redis
+REDIS_HOST = os.environ.get('REDIS_HOST', '')
+REDIS_PORT = int(os.environ.get('REDIS_PORT_NUMBER', '6379'))
+REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', '')
+
+# Caches are shared by all workers through redis when it's available, otherwise each process
+# keeps its own in memory. Each alias gets its own redis database because clearing a cache
+# flushes its whole database; database 0 is left to the recipe import queue.
+# See main/caches.py for what each alias holds.
+CACHE_ALIASES = {'default': 1, 'sessions': 2, 'fragments': 3, 'ai': 4}
+if REDIS_HOST:
+    CACHES = {
+        alias: {
+            'BACKEND': 'main.caches.InstrumentedRedisCache',
+            'LOCATION': f"redis://:{quote(REDIS_PASSWORD, safe='')}@{REDIS_HOST}:{REDIS_PORT}/{db}",
+            'KEY_PREFIX': 'ourmeals',
+            'STATS_NAME': alias,
+        }
+        for alias, db in CACHE_ALIASES.items()
+    }
+    # Sessions are still written to the database, so they survive a redis restart
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = 'sessions'
+else:
+    CACHES = {
+        alias: {
+            'BACKEND': 'main.caches.InstrumentedLocMemCache',
+            'LOCATION': f"ourmeals-{alias}",
+            'STATS_NAME': alias,
+        }
+        for alias in CACHE_ALIASES
+    }
+
+# Cache hits and misses are saved to CacheCounter rows after this many lookups per process
+CACHE_STATS_FLUSH_EVERY = int(os.environ.get('CACHE_STATS_FLUSH_EVERY', 100))
+
+# Recipe imports are queued on redis for `manage.py recipe_import_worker` when it's available,
+# otherwise they run inline in the web process (tests and local dev)
+RECIPE_IMPORT_BACKEND = os.environ.get('RECIPE_IMPORT_BACKEND', 'redis' if REDIS_HOST else 'inline')
+# Running imports with no progress for this long are failed when a worker starts, as their worker has died
+RECIPE_IMPORT_STALE_AFTER = int(os.environ.get('RECIPE_IMPORT_STALE_AFTER', 60 * 10))  # seconds
+
+# AI parse results are cached in the database, keyed on the recipe text, photos and prompt version
+AI_PARSE_CACHE_TTL = int(os.environ.get('AI_PARSE_CACHE_TTL', 60 * 60 * 24 * 30))  # 30 days
+AI_PARSE_CACHE_MAX_ENTRIES = int(os.environ.get('AI_PARSE_CACHE_MAX_ENTRIES', 5000))
+
+# AI backend. One pooled client is shared per process (main/ai_client.py); set AI_BACKEND=fake
+# to answer locally without network, e.g. for benchmarks and offline development
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+AI_BACKEND = os.environ.get('AI_BACKEND', 'openai')
+AI_TIMEOUT = float(os.environ.get('AI_TIMEOUT', 120))  # seconds per request
+AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES', 3))  # retried with exponential backoff
+AI_FAKE_LATENCY = float(os.environ.get('AI_FAKE_LATENCY', 0))  # seconds the fake backend waits per call
+
+# Photos reach the AI as presigned S3 URLs the model fetches itself ('presigned'), or inlined as base64
+# data URLs ('data_url', needed when media is served locally). Encoded data URLs are cached per process.
+AI_IMAGE_DELIVERY = os.environ.get('AI_IMAGE_DELIVERY', 'data_url' if DEBUG else 'presigned')
+AI_IMAGE_URL_EXPIRY = int(os.environ.get('AI_IMAGE_URL_EXPIRY', 60 * 60))  # seconds presigned photo URLs stay valid
+AI_IMAGE_FETCH_TIMEOUT = float(os.environ.get('AI_IMAGE_FETCH_TIMEOUT', 30))  # seconds to download a remote photo
+IMAGE_DATA_URL_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_DATA_URL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Grocery lists are consolidated locally; the AI then groups them into supermarket sections.
+# Turn off to skip the AI call and use the consolidated list directly.
+GROCERY_LIST_USE_AI = os.environ.get('GROCERY_LIST_USE_AI', '1').lower() in ('1', 'true')
+
+# Generated grocery lists are memoized on the plan's ingredients and instruction
+GROCERY_LIST_CACHE_TTL = int(os.environ.get('GROCERY_LIST_CACHE_TTL', 60 * 60 * 24 * 7))  # 7 days
+GROCERY_LIST_LOCK_TIMEOUT = int(os.environ.get('GROCERY_LIST_LOCK_TIMEOUT', 120))  # seconds one request may spend generating
+
+# With a shared cache, each user's set of meal plan co-members is cached for access checks; membership changes invalidate it
+CO_MEMBER_CACHE_TTL = int(os.environ.get('CO_MEMBER_CACHE_TTL', 60 * 60 * 24))  # 1 day
+
+# With a shared cache, rendered meal cards are cached per meal version; edits start a new version rather than deleting cards
+MEAL_CARD_CACHE_TTL = int(os.environ.get('MEAL_CARD_CACHE_TTL', 60 * 60 * 24))  # 1 day
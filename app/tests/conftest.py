@@ -1,7 +1,13 @@
 # tests/conftest.py
 import pytest
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from playwright.sync_api import sync_playwright
 
+# Most queries any page may run, however much data it shows
+PAGE_QUERY_BUDGET = 10
+
 
 @pytest.fixture(scope="session")
 def django_db_setup(django_db_setup, django_db_blocker):
@@ -9,6 +15,27 @@ def django_db_setup(django_db_setup, django_db_blocker):
         # Optional: Load initial data or perform setup
         pass
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Don't let memoized results leak between tests"""
+    from django.core.cache import caches
+    from main.caches import clear_cache_stats
+    for cache in caches.all():
+        cache.clear()
+    clear_cache_stats()
+
+@pytest.fixture
+def query_budget():
+    """Fail the test if the wrapped block runs more than budget queries"""
+    @contextmanager
+    def check(budget=PAGE_QUERY_BUDGET):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            pytest.fail(f"{len(context)} queries exceeded the budget of {budget}:\n{queries}")
+    return check
+
 # Remove pytest_addoption to avoid conflict
 @pytest.fixture(scope="session")
 def browser_context(request):
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .test_base import MealPlanTestCase, with_shared_cache
+from .factories import MembershipFactory
+from main.access import co_member_ids, can_access_user
+from main.models import Membership
+
+pytestmark = pytest.mark.django_db
+
+@with_shared_cache('main.access')
+class TestCoMembers(MealPlanTestCase):
+    def test_co_members_are_users_sharing_a_plan(self):
+        assert co_member_ids(self.user) == {self.shared_user.id}
+        assert co_member_ids(self.other_user) == set()
+
+    def test_access_to_own_and_co_member_content(self):
+        assert can_access_user(self.user, self.user.id)
+        assert can_access_user(self.user, self.shared_user.id)
+        assert not can_access_user(self.user, self.other_user.id)
+
+    def test_co_members_are_cached(self):
+        co_member_ids(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            assert can_access_user(self.user, self.shared_user.id)
+        assert len(queries) == 0
+
+    def test_joining_a_plan_invalidates_members(self):
+        co_member_ids(self.user)
+        co_member_ids(self.other_user)
+
+        MembershipFactory(user=self.other_user, meal_plan=self.meal_plan)
+
+        assert co_member_ids(self.user) == {self.shared_user.id, self.other_user.id}
+        assert co_member_ids(self.other_user) == {self.user.id, self.shared_user.id}
+
+    def test_leaving_a_plan_invalidates_members(self):
+        co_member_ids(self.user)
+        co_member_ids(self.shared_user)
+
+        Membership.objects.get(user=self.shared_user, meal_plan=self.meal_plan).delete()
+
+        assert co_member_ids(self.user) == set()
+        assert co_member_ids(self.shared_user) == set()
+
+    def test_deleting_a_plan_invalidates_members(self):
+        co_member_ids(self.user)
+
+        self.meal_plan.delete()
+
+        assert co_member_ids(self.user) == set()
+
+    def test_collection_access_follows_leaving_a_plan(self):
+        self.login_user(self.user)
+        url = reverse('main:collection_detail', kwargs={'pk': self.shared_collection.pk})
+        assert self.client.get(url).status_code == 200
+
+        self.login_user(self.shared_user)
+        self.client.post(reverse('main:leave_meal_plan', kwargs={'shareable_link': self.meal_plan.shareable_link}))
+
+        self.login_user(self.user)
+        assert self.client.get(url).status_code == 404
+
+class TestMembershipChangesOnOtherWorkers(MealPlanTestCase):
+    def test_membership_changes_on_other_workers_apply_at_once(self):
+        """Test that access follows a membership change whose invalidation never reached this process"""
+        assert can_access_user(self.user, self.shared_user.id)
+
+        with patch('main.signals.invalidate_co_members'):
+            Membership.objects.get(user=self.shared_user, meal_plan=self.meal_plan).delete()
+            MembershipFactory(user=self.other_user, meal_plan=self.meal_plan)
+
+        assert not can_access_user(self.user, self.shared_user.id)
+        assert can_access_user(self.user, self.other_user.id)
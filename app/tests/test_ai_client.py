@@ -0,0 +1,63 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+from .test_base import BaseTestCase
+from .factories import UserFactory, CollectionFactory
+from .test_recipe_fixtures import get_mock_recipe_text
+
+pytestmark = pytest.mark.django_db
+
+class TestOpenAIClient:
+    def test_client_is_shared(self):
+        """Test that the client is built once per process rather than per call"""
+        from main.ai_client import get_openai_client
+
+        with override_settings(OPENAI_API_KEY='test-key'):
+            client = get_openai_client()
+            assert get_openai_client() is client
+            assert client.max_retries >= 0
+
+    def test_settings_change_rebuilds_client(self):
+        """Test that changing the AI settings swaps the backend"""
+        from main.ai_client import get_openai_client, FakeOpenAI
+
+        with override_settings(OPENAI_API_KEY='test-key'):
+            real = get_openai_client()
+            with override_settings(AI_BACKEND='fake'):
+                assert isinstance(get_openai_client(), FakeOpenAI)
+            assert get_openai_client() is not real
+
+class TestFakeBackend(BaseTestCase):
+    @pytest.fixture(autouse=True)
+    def setup_fake_backend(self, base_setup, settings):
+        settings.AI_BACKEND = 'fake'
+        self.user = UserFactory()
+        self.collection = CollectionFactory(user=self.user)
+
+    def test_import_runs_offline(self):
+        """Test that a recipe import completes end to end with the fake backend"""
+        from main.models import Meal
+
+        self.login_user(self.user)
+        response = self.client.post(
+            reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
+            {'recipe_text_and_urls': get_mock_recipe_text()},
+            HTTP_ACCEPT='application/json',
+        )
+
+        assert response.status_code == 200
+        meal = Meal.objects.get(collection=self.collection)
+        assert meal.title == 'Classic Chocolate Chip Cookies'
+        recipe = meal.recipes.get()
+        assert recipe.ingredients.count() == 4
+        assert recipe.ingredients.get(name='all-purpose flour').unit == 'cup'
+        assert recipe.method_steps.count() == 4
+
+    def test_streamed_parse(self):
+        """Test that the fake backend streams like the real one"""
+        from main.ai_helpers import parse_recipe_with_genai
+
+        progress = []
+        result = parse_recipe_with_genai(raw_text=get_mock_recipe_text(), on_progress=progress.append)
+        assert result['title'] == 'Classic Chocolate Chip Cookies'
+        assert progress
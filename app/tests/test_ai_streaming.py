@@ -0,0 +1,78 @@
+import json
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.urls import reverse
+from .test_base import BaseTestCase
+from .factories import UserFactory, CollectionFactory
+from .test_recipe_fixtures import get_mock_parsed_recipe
+
+pytestmark = pytest.mark.django_db
+
+def stream_chunks(text, size=7):
+    """Fake a streamed chat completion delivering text a few characters at a time"""
+    for i in range(0, len(text), size):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + size]))])
+
+class TestPartialJson:
+    def test_truncated_object_is_closed(self):
+        from main.ai_helpers import parse_partial_json
+
+        partial = '```json\n{"title": "Soup", "recipes": [{"title": "Stock", "ingredients": [{"name": "water", "amo'
+        assert parse_partial_json(partial) == {
+            'title': 'Soup',
+            'recipes': [{'title': 'Stock', 'ingredients': [{'name': 'water'}]}],
+        }
+
+    def test_open_string_is_closed(self):
+        from main.ai_helpers import parse_partial_json
+
+        assert parse_partial_json('{"title": "Lemon Chi') == {'title': 'Lemon Chi'}
+
+    def test_nothing_yet(self):
+        from main.ai_helpers import parse_partial_json
+
+        assert parse_partial_json('Sure! Here is the recipe') is None
+
+    def test_complete_object_ignores_trailing_text(self):
+        from main.ai_helpers import parse_partial_json
+
+        assert parse_partial_json('{"title": "Soup"}\n```\nEnjoy!') == {'title': 'Soup'}
+
+class TestStreamingParse(BaseTestCase):
+    def test_progress_reported_while_streaming(self):
+        """Test that the partial recipe is summarized as the completion streams in"""
+        from main.ai_helpers import parse_recipe_with_genai
+        text = f"```json\n{json.dumps(get_mock_parsed_recipe())}\n```"
+        progress = []
+
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            mock_openai.return_value.chat.completions.create.return_value = stream_chunks(text)
+            with patch('main.ai_helpers.PROGRESS_INTERVAL', 0):
+                result = parse_recipe_with_genai(raw_text='Cookies', on_progress=progress.append)
+
+        assert mock_openai.return_value.chat.completions.create.call_args.kwargs['stream'] is True
+        assert result['title'] == 'Classic Chocolate Chip Cookies'
+        assert progress[-1] == {'title': 'Classic Chocolate Chip Cookies', 'recipes': 1, 'ingredients': 4, 'steps': 4}
+        ingredient_counts = [p['ingredients'] for p in progress]
+        assert ingredient_counts == sorted(ingredient_counts)
+        assert len(set(ingredient_counts)) > 2
+
+    def test_job_progress_visible_when_polling(self):
+        """Test that progress written by the worker is reported by the status endpoint"""
+        from main.models import RecipeImportJob
+        user = UserFactory()
+        job = RecipeImportJob.objects.create(
+            user=user,
+            collection=CollectionFactory(user=user),
+            raw_text='Cookies',
+            progress={'stage': 'parsing', 'title': 'Cookies', 'recipes': 1, 'ingredients': 3, 'steps': 0},
+        )
+        self.login_user(user)
+
+        response = self.client.get(reverse('main:recipe_import_status', args=[job.id]))
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data['message'] == 'Found Cookies: 3 ingredients'
+        assert data['progress']['ingredients'] == 3
@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import Mock, patch
 from django.test import Client, TestCase
 from django.contrib.messages import get_messages
 from django.urls import reverse
@@ -6,6 +7,10 @@ from .factories import UserFactory, CollectionFactory, MealFactory, MealPlanFact
 
 pytestmark = pytest.mark.django_db
 
+def with_shared_cache(module):
+    """Run a test class as if module's cache were shared by every worker, with local memory standing in for redis"""
+    return patch(f"{module}.is_shared", new=Mock(return_value=True))
+
 class BaseTestCase(TestCase):
     """Base test class with common authentication and setup methods."""
     
@@ -0,0 +1,61 @@
+import pytest
+from django.core.cache import caches
+from main.caches import (
+    FRAGMENTS, AI_RESULTS, SESSIONS, InstrumentedRedisCache, flush_cache_stats, is_shared, record_lookups,
+)
+from main.models import CacheCounter
+
+pytestmark = pytest.mark.django_db
+
+def cache_counter(alias):
+    return CacheCounter.objects.filter(name=f"cache:{alias}").first()
+
+class TestCacheAliases:
+    def test_aliases_are_separate_caches(self):
+        caches[FRAGMENTS].set('key', 'fragment')
+
+        assert caches[FRAGMENTS].get('key') == 'fragment'
+        for alias in ['default', SESSIONS, AI_RESULTS]:
+            assert caches[alias].get('key') is None
+
+    def test_redis_backend_accepts_stats_name(self):
+        cache = InstrumentedRedisCache('redis://localhost:6379/3', {'STATS_NAME': FRAGMENTS})
+        assert cache.stats_name == FRAGMENTS
+
+    def test_only_redis_is_shared(self, settings):
+        assert not is_shared()
+        settings.CACHES = {**settings.CACHES, 'default': {'BACKEND': 'main.caches.InstrumentedRedisCache', 'LOCATION': 'redis://localhost:6379/1'}}
+        assert is_shared()
+
+class TestCacheStats:
+    def test_get_counts_hits_and_misses(self):
+        cache = caches[FRAGMENTS]
+        cache.set('present', 1)
+
+        assert cache.get('present') == 1
+        assert cache.get('absent', 'fallback') == 'fallback'
+        flush_cache_stats()
+
+        counter = cache_counter(FRAGMENTS)
+        assert (counter.hits, counter.misses) == (1, 1)
+
+    def test_get_many_counts_each_key_once(self):
+        cache = caches[AI_RESULTS]
+        cache.set_many({'a': 1, 'b': 2})
+
+        assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+        flush_cache_stats()
+
+        counter = cache_counter(AI_RESULTS)
+        assert (counter.hits, counter.misses) == (2, 1)
+        assert counter.hit_ratio == pytest.approx(2 / 3)
+
+    def test_stats_are_saved_in_batches(self, settings):
+        settings.CACHE_STATS_FLUSH_EVERY = 3
+
+        record_lookups('cache:default', 1, 1)
+        assert cache_counter('default') is None
+
+        record_lookups('cache:default', 1, 0)
+        counter = cache_counter('default')
+        assert (counter.hits, counter.misses) == (2, 1)
@@ -115,6 +115,33 @@ class TestCollectionList(BaseTestCase):
         assert response.status_code == 200
         assert other_collection.title not in response.content.decode()
     
+    def add_members(self, meal_plan, count):
+        for _ in range(count):
+            member = UserFactory()
+            MembershipFactory(user=member, meal_plan=meal_plan)
+            CollectionFactory.create_batch(2, user=member)
+
+    def test_query_count_does_not_grow_with_members(self):
+        """Test that the page costs the same number of queries with 1 or 50 people sharing plans"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        meal_plan = MealPlanFactory(owner=self.user)
+        MembershipFactory(user=self.user, meal_plan=meal_plan)
+        self.add_members(meal_plan, 1)
+        self.login_user(self.user)
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('main:collection_list'))
+
+        self.add_members(meal_plan, 49)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('main:collection_list'))
+
+        assert len(response.context['grouped_collections']) == 51
+        assert len(many.captured_queries) == len(few.captured_queries)
+        assert len(many.captured_queries) <= 10
+
     def test_list_collections_unauthenticated_redirects_to_login(self):
         # Act
         response = self.client.get(reverse('main:collection_list'))
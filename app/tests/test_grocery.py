@@ -0,0 +1,317 @@
+import pytest
+from collections import namedtuple
+from unittest.mock import patch
+from django.test import override_settings
+from django.urls import reverse
+from .test_base import MealPlanTestCase
+
+Row = namedtuple('Row', ['name', 'amount', 'unit', 'recipe_title', 'meal_title', 'recipe__meal_id'])
+
+def row(name, amount, unit='', meal='Dinner'):
+    return Row(name, amount, unit, 'Recipe', meal, meal)
+
+class TestNormalizeIngredientName:
+    @pytest.mark.parametrize('name, expected', [
+        ('Tomatoes, diced', 'tomato'),
+        ('Cherry tomatoes (halved)', 'cherry tomato'),
+        ('Berries', 'berry'),
+        ('Bay leaves', 'bay leaf'),
+        ('Peaches', 'peach'),
+        ('Couscous', 'couscous'),
+        ('Scallions', 'spring onion'),
+        ('All-purpose flour', 'plain flour'),
+        ('Rolled oats', 'rolled oats'),
+    ])
+    def test_names(self, name, expected):
+        from main.grocery import normalize_ingredient_name
+
+        assert normalize_ingredient_name(name) == expected
+
+class TestConsolidateIngredients:
+    def test_same_unit_is_summed(self):
+        """Test that rows in the same unit keep it when summed"""
+        from main.grocery import consolidate_ingredients
+
+        items = consolidate_ingredients([
+            row('Plain flour', '1 1/2', 'cups', meal='Pancakes'),
+            row('all-purpose flour', '1', 'cup', meal='Scones'),
+        ])
+        assert items == [{'name': 'plain flour', 'amount': '2.5 cup', 'notes': [], 'meals': ['Pancakes', 'Scones']}]
+
+    def test_mixed_units_convert_through_base_unit(self):
+        """Test that mixed weights are summed in grams and scaled up to kg"""
+        from main.grocery import consolidate_ingredients
+
+        items = consolidate_ingredients([row('Potatoes', '600', 'g'), row('potato', '0.5', 'kg')])
+        assert [(i['name'], i['amount']) for i in items] == [('potato', '1.1 kg')]
+
+    def test_region_changes_spoon_size(self):
+        from main.grocery import consolidate_ingredients
+
+        rows = [row('Olive oil', '1', 'tbsp'), row('olive oil', '10', 'ml')]
+        assert consolidate_ingredients(rows)[0]['amount'] == '25 ml'
+        assert consolidate_ingredients(rows, region='AU')[0]['amount'] == '30 ml'
+
+    def test_weight_and_volume_stay_apart(self):
+        from main.grocery import consolidate_ingredients
+
+        items = consolidate_ingredients([row('Butter', '100', 'g'), row('butter', '2', 'tbsp')])
+        assert [i['amount'] for i in items] == ['100 g', '2 tbsp']
+
+    def test_unit_in_name_and_ranges(self):
+        """Test that '3 garlic cloves' matches '2 cloves garlic' and ranges take the top"""
+        from main.grocery import consolidate_ingredients
+
+        items = consolidate_ingredients([
+            row('Garlic cloves', '3'),
+            row('garlic', '2', 'cloves'),
+            row('Eggs', '2-3'),
+        ])
+        assert [(i['name'], i['amount']) for i in items] == [('egg', '3'), ('garlic', '5 clove')]
+
+    def test_unmeasured_rows_become_notes(self):
+        from main.grocery import consolidate_ingredients, format_grocery_list
+
+        items = consolidate_ingredients([
+            row('Salt', '1', 'tsp', meal='Soup'),
+            row('salt', None, 'to taste', meal='Stew'),
+            row('Pepper', None),
+        ])
+        assert items == [
+            {'name': 'pepper', 'amount': '', 'notes': [], 'meals': ['Dinner']},
+            {'name': 'salt', 'amount': '1 tsp', 'notes': ['to taste'], 'meals': ['Soup', 'Stew']},
+        ]
+        assert format_grocery_list(items) == "- pepper\n- salt (1 tsp, to taste)"
+
+    def test_blank_amounts_become_notes(self):
+        """Test that '' and whitespace amounts are treated like missing ones rather than zero"""
+        from main.grocery import consolidate_ingredients, format_grocery_list
+
+        items = consolidate_ingredients([
+            row('Salt', '1', 'tsp', meal='Soup'),
+            row('salt', '', '', meal='Stew'),
+            row('Pepper', ' ', 'to taste'),
+        ])
+        assert format_grocery_list(items) == "- pepper (to taste)\n- salt (1 tsp)"
+
+@pytest.mark.django_db
+class TestSummarizeGroceryList:
+    def test_ai_sees_consolidated_list(self):
+        """Test that the AI is sent one line per ingredient"""
+        from main.ai_helpers import summarize_grocery_list_with_genai
+
+        rows = [row('Tomatoes', '2', meal='Salad'), row('tomato', '1', meal='Pasta'), row('Basil', '1', 'bunch', meal='Pasta')]
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            mock_chat = mock_openai.return_value.chat.completions
+            mock_chat.create.return_value.choices[0].message.content = 'list'
+            assert summarize_grocery_list_with_genai(rows, '') == 'list'
+
+        sent = mock_chat.create.call_args.kwargs['messages'][1]['content']
+        assert sent == "Ingredient, Amount, Meals\nbasil, 1 bunch, Pasta\ntomato, 3, Salad; Pasta"
+
+    @override_settings(GROCERY_LIST_USE_AI=False)
+    def test_without_ai(self):
+        from main.ai_helpers import summarize_grocery_list_with_genai
+
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            result = summarize_grocery_list_with_genai([row('Tomatoes', '2'), row('tomato', '1')], '')
+
+        mock_openai.assert_not_called()
+        assert result == "- tomato (3)"
+
+class TestMergeTotals:
+    def test_add_then_remove_is_exact(self):
+        """Test that removing a meal's totals leaves the rest untouched"""
+        from main.grocery import ingredient_totals, merge_totals
+
+        soup = ingredient_totals([row('Carrots', '1/3', 'cup', meal='Soup'), row('Salt', None, 'to taste', meal='Soup')])
+        stew = ingredient_totals([row('carrot', '0.1', 'cup', meal='Stew')])
+        totals = merge_totals(merge_totals({}, stew), soup)
+        assert totals['carrot|ml']['amounts'] == {'cup': 0.43}
+
+        assert merge_totals(totals, soup, sign=-1) == stew
+        assert merge_totals(totals, stew, sign=-1) == {}
+
+@pytest.mark.django_db
+class TestIncrementalGroceryList(MealPlanTestCase):
+    @pytest.fixture(autouse=True)
+    def setup_meals(self, meal_plan_setup):
+        from .factories import RecipeFactory, IngredientFactory, MealFactory
+
+        IngredientFactory(recipe=RecipeFactory(meal=self.meal), name='Tomatoes', amount='2', unit='')
+        self.other_meal = MealFactory(collection=self.collection, title='Pasta')
+        recipe = RecipeFactory(meal=self.other_meal)
+        IngredientFactory(recipe=recipe, name='tomato', amount='3', unit='')
+        IngredientFactory(recipe=recipe, name='Spaghetti', amount='500', unit='g')
+
+    def toggle(self, meal):
+        self.login_user(self.user)
+        url = reverse('main:toggle_meal_in_meal_plan', kwargs={'shareable_link': self.meal_plan.shareable_link, 'meal_id': meal.id})
+        return self.client.post(url, HTTP_ACCEPT='application/json')
+
+    def test_toggling_updates_list_without_ai(self):
+        """Test that adding and removing meals applies just their ingredients"""
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            self.toggle(self.meal)
+            response = self.toggle(self.other_meal)
+            assert response.json()['grocery_list'] == "- spaghetti (500 g)\n- tomato (5)"
+
+            response = self.toggle(self.meal)
+            assert response.json()['grocery_list'] == "- spaghetti (500 g)\n- tomato (3)"
+
+        mock_openai.assert_not_called()
+        self.meal_plan.refresh_from_db()
+        assert list(self.meal_plan.grocery_contributions) == [str(self.other_meal.id)]
+
+    def test_toggle_reads_only_the_toggled_meal(self):
+        """Test that the toggle's grocery work doesn't grow with the plan"""
+        from main.grocery import apply_meal_toggle
+
+        self.meal_plan.meals.add(self.meal)
+        meal_plan = apply_meal_toggle(self.meal_plan, self.meal, added=True)
+        self.meal_plan.meals.add(self.other_meal)
+        with patch('main.grocery.gather_ingredients') as mock_gather:
+            meal_plan = apply_meal_toggle(meal_plan, self.other_meal, added=True)
+        mock_gather.assert_not_called()
+        assert meal_plan.grocery_totals['tomato|']['amounts'] == {'': 5}
+
+    def test_editing_meal_updates_list(self):
+        from main.ai_helpers import save_parsed_recipe
+
+        self.toggle(self.other_meal)
+        save_parsed_recipe({'title': 'Pasta', 'recipes': [{'title': 'Sauce', 'ingredients': [{'name': 'Tomatoes', 'amount': '4', 'unit': ''}], 'method': []}]}, meal=self.other_meal)
+
+        self.meal_plan.refresh_from_db()
+        assert self.meal_plan.grocery_list == "- tomato (4)"
+
+    def test_deleting_meal_updates_list(self):
+        self.toggle(self.meal)
+        self.toggle(self.other_meal)
+        self.other_meal.delete()
+
+        self.meal_plan.refresh_from_db()
+        assert self.meal_plan.grocery_list == "- tomato (2)"
+
+    def test_ai_list_survives_toggles(self):
+        """Test that toggling a meal doesn't replace a list the AI grouped into sections"""
+        self.meal_plan.meals.add(self.meal)
+        self.login_user(self.user)
+        with patch('main.views.summarize_grocery_list_with_genai', return_value="## Produce\n- tomato (2)"):
+            self.client.post(reverse('main:create_grocery_list', kwargs={'shareable_link': self.meal_plan.shareable_link}))
+
+        response = self.toggle(self.other_meal)
+        assert 'grocery_list' not in response.json()
+        assert response.json()['grocery_list_outdated']
+
+        self.meal_plan.refresh_from_db()
+        assert self.meal_plan.grocery_list == "## Produce\n- tomato (2)"
+        assert self.meal_plan.grocery_list_outdated
+        assert 'Meals have changed since this list was made' in self.client.get(
+            reverse('main:meal_plan_detail', kwargs={'shareable_link': self.meal_plan.shareable_link})
+        ).content.decode()
+
+    def test_outdated_list_refreshes_from_meals(self):
+        """Test that one click swaps an outdated list for the locally consolidated one"""
+        self.toggle(self.meal)
+        self.client.post(reverse('main:save_grocery_list', kwargs={'shareable_link': self.meal_plan.shareable_link}), {'grocery_list': 'tomatoes'})
+        self.toggle(self.other_meal)
+
+        response = self.client.post(reverse('main:refresh_grocery_list', kwargs={'shareable_link': self.meal_plan.shareable_link}))
+        assert response.json()['grocery_list'] == "- spaghetti (500 g)\n- tomato (5)"
+
+        self.meal_plan.refresh_from_db()
+        assert not self.meal_plan.grocery_list_outdated
+        assert self.toggle(self.meal).json()['grocery_list'] == "- spaghetti (500 g)\n- tomato (3)"
+
+    def test_edited_list_survives_meal_changes(self):
+        """Test that a hand edited list is kept when meals are toggled or edited"""
+        from main.ai_helpers import save_parsed_recipe
+
+        self.toggle(self.other_meal)
+        self.client.post(reverse('main:save_grocery_list', kwargs={'shareable_link': self.meal_plan.shareable_link}), {'grocery_list': 'tomatoes and bread'})
+        self.toggle(self.meal)
+        save_parsed_recipe({'title': 'Pasta', 'recipes': [{'title': 'Sauce', 'ingredients': [{'name': 'Tomatoes', 'amount': '4', 'unit': ''}], 'method': []}]}, meal=self.other_meal)
+
+        self.meal_plan.refresh_from_db()
+        assert self.meal_plan.grocery_list == 'tomatoes and bread'
+        assert self.meal_plan.rendered_grocery_list == "- tomato (6)"
+
+    @override_settings(GROCERY_LIST_USE_AI=False)
+    def test_full_regenerate_rebuilds_totals(self):
+        self.meal_plan.meals.add(self.meal, self.other_meal)
+        self.login_user(self.user)
+        self.client.post(reverse('main:create_grocery_list', kwargs={'shareable_link': self.meal_plan.shareable_link}))
+
+        self.meal_plan.refresh_from_db()
+        assert self.meal_plan.grocery_list == "- spaghetti (500 g)\n- tomato (5)"
+        assert set(self.meal_plan.grocery_contributions) == {str(self.meal.id), str(self.other_meal.id)}
+
+@pytest.mark.django_db
+class TestGroceryListMemo:
+    def mock_ai(self, mock_openai, content='list'):
+        mock_chat = mock_openai.return_value.chat.completions
+        mock_chat.create.return_value.choices[0].message.content = content
+        return mock_chat
+
+    def test_repeat_generation_is_memoized(self):
+        """Test that the same meals and instruction only call the AI once"""
+        from main.ai_helpers import summarize_grocery_list_with_genai
+        from main.caches import flush_cache_stats
+        from main.models import CacheCounter
+
+        rows = [row('Tomatoes', '2', meal='Salad'), row('Basil', '1', 'bunch', meal='Pasta')]
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            mock_chat = self.mock_ai(mock_openai)
+            assert summarize_grocery_list_with_genai(rows, 'By aisle') == 'list'
+            assert summarize_grocery_list_with_genai(list(reversed(rows)), ' By  aisle ') == 'list'
+            assert mock_chat.create.call_count == 1
+
+            summarize_grocery_list_with_genai(rows, 'Alphabetical')
+            summarize_grocery_list_with_genai(rows[:1], 'By aisle')
+            summarize_grocery_list_with_genai([row('Tomatoes', '3', meal='Salad'), rows[1]], 'By aisle')
+            assert mock_chat.create.call_count == 4
+
+        flush_cache_stats()
+        counter = CacheCounter.objects.get(name='grocery_list')
+        assert (counter.hits, counter.misses) == (1, 4)
+
+    def test_concurrent_requests_share_one_call(self):
+        """Test that a request arriving mid-generation waits for the first one's result"""
+        import threading
+        from main.ai_cache import single_flight
+
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'list'
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(single_flight('key', slow_compute, 'test', 60, 10)))
+        with patch('main.ai_cache.record_hit'), patch('main.ai_cache.record_miss'), \
+             patch('main.ai_cache.SINGLE_FLIGHT_POLL_INTERVAL', 0.01):
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=lambda: results.append(single_flight('key', slow_compute, 'test', 60, 10)))
+            second.start()
+            release.set()
+            first.join(5)
+            second.join(5)
+
+        assert results == ['list', 'list']
+        assert len(calls) == 1
+
+    def test_failed_generation_is_not_cached(self):
+        from main.ai_helpers import summarize_grocery_list_with_genai
+
+        rows = [row('Tomatoes', '2')]
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            mock_chat = self.mock_ai(mock_openai)
+            mock_chat.create.side_effect = [Exception('AI service error'), mock_chat.create.return_value]
+            with pytest.raises(Exception, match='AI service error'):
+                summarize_grocery_list_with_genai(rows, '')
+            assert summarize_grocery_list_with_genai(rows, '') == 'list'
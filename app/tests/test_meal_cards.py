@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import patch
+from django.test import RequestFactory
+from django.urls import reverse
+from .test_base import MealPlanTestCase, with_shared_cache
+from .factories import MealFactory, RecipeFactory
+from main.meal_cards import render_meal_cards, meal_versions, CSRF_PLACEHOLDER
+
+pytestmark = pytest.mark.django_db
+
+@with_shared_cache('main.meal_cards')
+class TestMealCards(MealPlanTestCase):
+    def render(self, meals, meal_plan_recipes=()):
+        request = RequestFactory().get('/')
+        return render_meal_cards(meals, request=request, current_meal_plan=self.meal_plan,
+                                 meal_plan_recipes=meal_plan_recipes, show_buttons=True)
+
+    def test_cards_are_rendered_once(self):
+        meals = MealFactory.create_batch(5, collection=self.collection)
+        first = self.render(meals)
+
+        with patch('main.meal_cards.render_to_string') as render_to_string:
+            second = self.render(meals)
+        render_to_string.assert_not_called()
+        assert second.count('meal-card') == first.count('meal-card') == 5
+
+    def test_csrf_token_is_filled_in_per_request(self):
+        html = self.render([self.meal])
+        assert CSRF_PLACEHOLDER not in html
+        assert 'name="csrfmiddlewaretoken" value="' in html
+
+    def test_in_plan_flag_selects_the_card(self):
+        assert 'bi-plus-circle' in self.render([self.meal])
+        assert 'bi-check-circle-fill' in self.render([self.meal], meal_plan_recipes={self.meal.id})
+
+    def test_editing_a_meal_invalidates_its_card(self):
+        self.render([self.meal])
+        self.meal.title = 'Renamed meal'
+        self.meal.save()
+        assert 'Renamed meal' in self.render([self.meal])
+
+    def test_cards_rendered_before_commit_are_dropped(self):
+        """Test that a card cached from pre-commit data during an edit isn't served afterwards"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meal.title = 'Renamed meal'
+            self.meal.save()
+            # A concurrent request still seeing the old row caches its card under a fresh version
+            stale = MealFactory.build(id=self.meal.id, collection=self.collection, title='Old title')
+            self.render([stale])
+
+        assert 'Renamed meal' in self.render([self.meal])
+
+    def test_recipe_and_plan_changes_start_a_new_version(self):
+        version = meal_versions([self.meal.id])[self.meal.id]
+
+        RecipeFactory(meal=self.meal)
+        recipe_version = meal_versions([self.meal.id])[self.meal.id]
+        assert recipe_version != version
+
+        self.meal_plan.meals.add(self.meal)
+        assert meal_versions([self.meal.id])[self.meal.id] != recipe_version
+
+    def test_toggle_returns_the_updated_card(self):
+        self.login_user(self.user)
+        url = reverse('main:toggle_meal_in_meal_plan', kwargs={
+            'shareable_link': self.meal_plan.shareable_link,
+            'meal_id': self.meal.id,
+        })
+
+        added = self.client.post(url, HTTP_ACCEPT='application/json').json()
+        removed = self.client.post(url, HTTP_ACCEPT='application/json').json()
+
+        assert 'bi-check-circle-fill' in added['html']
+        assert 'bi-plus-circle' in removed['html']
+        assert CSRF_PLACEHOLDER not in removed['html']
+
+class TestUncachedMealCards(MealPlanTestCase):
+    def test_edits_on_other_workers_show_at_once(self):
+        """Test that a card reflects an edit whose version bump never reached this process"""
+        render_meal_cards([self.meal], request=RequestFactory().get('/'))
+
+        with patch('main.signals.bump_meal_versions'):
+            self.meal.title = 'Renamed meal'
+            self.meal.save()
+
+        assert 'Renamed meal' in render_meal_cards([self.meal], request=RequestFactory().get('/'))
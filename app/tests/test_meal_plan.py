@@ -302,7 +302,7 @@ Dairy:
 Spices:
 - Cinnamon (2 tbsp) - Test Recipe from Test Meal
 ```"""
-        with patch('main.ai_helpers.OpenAI') as mock_openai:
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
             # Mock the chat completion
             mock_chat = mock_openai.return_value.chat.completions
             mock_chat.create.return_value.choices[0].message.content = mock_response
@@ -335,7 +335,7 @@ Dairy:
 Spices:
 - Cinnamon (2 tbsp) - Test Recipe from Test Meal
 ```"""
-        with patch('main.ai_helpers.OpenAI') as mock_openai:
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
             mock_chat = mock_openai.return_value.chat.completions
             mock_chat.create.return_value.choices[0].message.content = mock_response
             
@@ -367,7 +367,7 @@ Dairy:
 Spices:
 - Cinnamon (2 tbsp) - Test Recipe from Test Meal
 ```"""
-        with patch('main.ai_helpers.OpenAI') as mock_openai:
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
             mock_chat = mock_openai.return_value.chat.completions
             mock_chat.create.return_value.choices[0].message.content = mock_response
             
@@ -378,3 +378,42 @@ Spices:
         self.meal_plan.refresh_from_db()
         self.assertEqual(self.meal_plan.grocery_list_instruction, 'Group by type')
         self.assertEqual(self.meal_plan.grocery_list, mock_response)
+
+
+class TestGatherIngredients(MealPlanTestCase):
+    def add_meals(self, count, ingredients_per_recipe=5):
+        for _ in range(count):
+            meal = MealFactory(collection=self.collection)
+            for recipe in RecipeFactory.create_batch(2, meal=meal):
+                IngredientFactory.create_batch(ingredients_per_recipe, recipe=recipe)
+            self.meal_plan.meals.add(meal)
+
+    def test_rows_carry_recipe_and_meal_titles(self):
+        """Test that gathered rows include the titles needed for the grocery list"""
+        from main.grocery import gather_ingredients
+
+        recipe = RecipeFactory(meal=self.meal, title='Porridge')
+        IngredientFactory(recipe=recipe, name='Oats', amount='1', unit='cup')
+        self.meal_plan.meals.add(self.meal)
+        RecipeFactory(meal=self.shared_meal)  # Not in the plan
+
+        rows = gather_ingredients(self.meal_plan)
+        assert [(r.name, r.amount, r.unit, r.recipe_title, r.meal_title) for r in rows] == [
+            ('Oats', '1', 'cup', 'Porridge', self.meal.title)
+        ]
+
+    def test_query_count_is_constant(self):
+        """Test that gathering takes one query however large the plan is"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main.grocery import gather_ingredients
+
+        self.add_meals(2)
+        with CaptureQueriesContext(connection) as small:
+            assert len(gather_ingredients(self.meal_plan)) == 20
+
+        self.add_meals(12)
+        with CaptureQueriesContext(connection) as large:
+            assert len(gather_ingredients(self.meal_plan)) == 140
+
+        assert len(small.captured_queries) == len(large.captured_queries) == 1
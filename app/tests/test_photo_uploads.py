@@ -0,0 +1,256 @@
+import base64
+import os
+import pytest
+from io import BytesIO
+from unittest.mock import Mock, patch
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.urls import reverse
+from PIL import Image
+from .test_base import BaseTestCase
+from .factories import UserFactory, CollectionFactory
+from .test_recipe_fixtures import get_mock_parsed_recipe
+from main.ai_helpers import get_image_as_base64, image_data_url_cache, image_url_for_ai
+from main.images import (
+    convert_to_jpeg, open_image, vision_derivative, resolve_photo_url, set_photo_status, spool_upload, photo_status_path,
+    encode_data_url, file_chunks, PHOTO_PENDING, PHOTO_FAILED, EXIF_GPS_IFD,
+)
+
+pytestmark = pytest.mark.django_db
+
+def image_upload(name='photo.png', size=(64, 48), mode='RGB', format='PNG', **save_options):
+    output = BytesIO()
+    Image.new(mode, size, 'red').save(output, format=format, **save_options)
+    return SimpleUploadedFile(name, output.getvalue(), content_type=f"image/{format.lower()}")
+
+def gps_exif():
+    exif = Image.Exif()
+    exif[EXIF_GPS_IFD] = {1: 'S', 2: (33.0, 52.0, 4.0)}
+    return exif
+
+def set_photo_status_file(photo_id):
+    set_photo_status(photo_id, PHOTO_PENDING)
+    return photo_status_path(photo_id)
+
+class TestPhotoUploads(BaseTestCase):
+    @pytest.fixture(autouse=True)
+    def setup_uploads(self, base_setup, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path / 'media')
+        settings.PHOTO_SPOOL_DIR = str(tmp_path / 'spool')
+        self.user = UserFactory()
+        self.collection = CollectionFactory(user=self.user)
+        self.upload_url = reverse('main:upload_photos')
+        self.spool_dir = settings.PHOTO_SPOOL_DIR
+        self.media_root = settings.MEDIA_ROOT
+
+    def upload(self, *files):
+        self.login_user(self.user)
+        return self.client.post(self.upload_url, {'photos': list(files)})
+
+    def test_upload_returns_placeholders_that_resolve(self):
+        response = self.upload(image_upload('a.png'), image_upload('b.png'), image_upload('c.png'))
+        assert response.status_code == 200
+
+        urls = response.json()['urls']
+        assert len(urls) == 3
+        stored = [resolve_photo_url(url, timeout=10) for url in urls]
+        assert all('recipe_photos/' in url and url.endswith('.jpg') for url in stored)
+        assert len(os.listdir(os.path.join(self.media_root, 'recipe_photos'))) == 6
+        assert not [name for name in os.listdir(self.spool_dir) if name.endswith('.upload')]
+
+    def test_placeholder_redirects_once_ready(self):
+        url = self.upload(image_upload()).json()['urls'][0]
+        stored = resolve_photo_url(url, timeout=10)
+
+        response = self.client.get(url)
+        assert response.status_code == 302
+        assert response['Location'] == stored
+
+    def test_other_workers_see_uploaded_photos(self):
+        """Test that a placeholder resolves in a process with none of the uploading worker's cache"""
+        url = self.upload(image_upload()).json()['urls'][0]
+        cache.clear()
+
+        assert resolve_photo_url(url, timeout=10).endswith('.jpg')
+        assert self.client.get(url).status_code == 302
+
+    def test_unpolled_statuses_are_swept(self):
+        """Test that status files nobody read are removed once they expire"""
+        abandoned = set_photo_status_file('6f1b7ed6-0c1f-4a53-9a52-5f3a1c0b0f51')
+        os.utime(abandoned, (0, 0))
+        recent = set_photo_status_file('0b5e3f9c-2a47-4d1e-8f6b-7c9d0e1a2b3c')
+
+        self.upload(image_upload())
+
+        assert not os.path.exists(abandoned)
+        assert os.path.exists(recent)
+
+    def test_placeholder_reports_pending_and_failed_photos(self):
+        photo_id = '6f1b7ed6-0c1f-4a53-9a52-5f3a1c0b0f51'
+        url = reverse('main:uploaded_photo', kwargs={'photo_id': photo_id})
+        assert self.client.get(url).status_code == 404
+
+        set_photo_status(photo_id, PHOTO_PENDING)
+        assert self.client.get(url).status_code == 202
+
+        set_photo_status(photo_id, PHOTO_FAILED, error='cannot identify image file')
+        assert self.client.get(url).status_code == 422
+        with pytest.raises(ValueError, match='could not be processed'):
+            resolve_photo_url(url)
+
+    def test_unreadable_image_fails_processing(self):
+        broken = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        url = self.upload(broken).json()['urls'][0]
+
+        with pytest.raises(ValueError, match='could not be processed'):
+            resolve_photo_url(url, timeout=10)
+
+    def test_rejects_non_images(self):
+        text = SimpleUploadedFile('notes.txt', b'hello', content_type='text/plain')
+        response = self.upload(image_upload(), text)
+        assert response.status_code == 400
+
+    def test_other_urls_are_left_alone(self):
+        assert resolve_photo_url('https://example.com/photo.jpg') == 'https://example.com/photo.jpg'
+
+    def test_import_waits_for_uploaded_photos(self):
+        url = self.upload(image_upload()).json()['urls'][0]
+
+        with patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()) as parse:
+            response = self.client.post(
+                reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
+                {'photo_0': url},
+                HTTP_ACCEPT='application/json',
+            )
+
+        assert response.status_code == 200
+        photos = parse.call_args.kwargs['photos']
+        assert photos == [resolve_photo_url(url, variant='vision_url')]
+        assert photos[0].endswith('.vision.jpg')
+
+    def stored_bytes(self, upload):
+        url = self.upload(upload).json()['urls'][0]
+        stored = resolve_photo_url(url, timeout=10)
+        with open(os.path.join(self.media_root, stored.split('/media/', 1)[1]), 'rb') as stored_file:
+            return stored_file.read()
+
+    def test_servable_jpegs_are_stored_as_uploaded(self):
+        upload = image_upload('photo.jpg', format='JPEG')
+        assert self.stored_bytes(upload) == upload.file.getvalue()
+
+    def test_other_images_are_reencoded(self):
+        png = image_upload('photo.png')
+        assert Image.open(BytesIO(self.stored_bytes(png))).format == 'JPEG'
+
+        located = image_upload('located.jpg', format='JPEG', exif=gps_exif())
+        stored = self.stored_bytes(located)
+        assert stored != located.file.getvalue()
+        assert EXIF_GPS_IFD not in Image.open(BytesIO(stored)).getexif()
+
+    def test_large_uploads_are_moved_into_the_spool(self):
+        upload = TemporaryUploadedFile('big.jpg', 'image/jpeg', 0, None)
+        upload.write(b'jpeg bytes')
+        upload.flush()
+        temporary_path = upload.temporary_file_path()
+
+        path = spool_upload(upload)
+        upload.close()
+
+        assert not os.path.exists(temporary_path)
+        with open(path, 'rb') as spooled:
+            assert spooled.read() == b'jpeg bytes'
+
+    def test_local_photos_are_encoded_as_data_urls(self):
+        os.makedirs(os.path.join(self.media_root, 'meal_photos'))
+        with open(os.path.join(self.media_root, 'meal_photos', 'cake.jpg'), 'wb') as photo:
+            photo.write(b'cake' * 1000)
+
+        data_url = get_image_as_base64('/media/meal_photos/cake.jpg')
+        assert data_url == 'data:image/jpeg;base64,' + base64.b64encode(b'cake' * 1000).decode()
+
+class TestImageDataUrlCache:
+    @pytest.fixture(autouse=True)
+    def setup_cache(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        self.path = tmp_path / 'cake.jpg'
+        self.path.write_bytes(b'cake')
+        image_data_url_cache.clear()
+        yield
+        image_data_url_cache.clear()
+
+    def test_local_photos_are_encoded_once(self):
+        with patch('main.ai_helpers.file_chunks', wraps=file_chunks) as chunks:
+            first = get_image_as_base64('/media/cake.jpg')
+            assert get_image_as_base64('/media/cake.jpg') == first
+        assert chunks.call_count == 1
+
+    def test_changed_photos_are_reencoded(self):
+        get_image_as_base64('/media/cake.jpg')
+        self.path.write_bytes(b'more cake')
+        assert get_image_as_base64('/media/cake.jpg') == 'data:image/jpeg;base64,' + base64.b64encode(b'more cake').decode()
+
+    def test_remote_photos_are_revalidated(self):
+        fetched = Mock(status_code=200, headers={'Content-Type': 'image/png', 'ETag': '"v1"'})
+        fetched.iter_content.return_value = [b'cake']
+        not_modified = Mock(status_code=304, headers={})
+        with patch('main.ai_helpers.requests.get') as get:
+            get.return_value.__enter__.side_effect = [fetched, not_modified]
+            first = get_image_as_base64('https://example.com/cake.png')
+            assert get_image_as_base64('https://example.com/cake.png') == first == 'data:image/png;base64,Y2FrZQ=='
+        assert get.call_args.kwargs['headers'] == {'If-None-Match': '"v1"'}
+
+class FakeS3Storage:
+    bucket_name = 'our-meals'
+    custom_domain = None
+    location = 'media'
+
+    def url(self, name, expire=None):
+        return f"https://our-meals.s3.amazonaws.com/media/{name}?X-Amz-Expires={expire}"
+
+class TestImageUrlForAi:
+    def test_s3_photos_are_presigned(self, settings):
+        settings.AI_IMAGE_DELIVERY = 'presigned'
+        settings.AI_IMAGE_URL_EXPIRY = 600
+        with patch('main.images.default_storage', FakeS3Storage()):
+            signed = image_url_for_ai('https://our-meals.s3.amazonaws.com/media/recipe_photos/cake.vision.jpg')
+            other = image_url_for_ai('https://example.com/cake.jpg')
+        assert signed == 'https://our-meals.s3.amazonaws.com/media/recipe_photos/cake.vision.jpg?X-Amz-Expires=600'
+        assert other == 'https://example.com/cake.jpg'
+
+    def test_data_url_mode_inlines_photos(self, settings):
+        settings.AI_IMAGE_DELIVERY = 'data_url'
+        with patch('main.ai_helpers.get_image_as_base64', return_value='data:image/jpeg;base64,') as encode:
+            assert image_url_for_ai('https://example.com/cake.jpg') == 'data:image/jpeg;base64,'
+        encode.assert_called_once_with('https://example.com/cake.jpg')
+
+class TestEncodeDataUrl:
+    def test_matches_encoding_in_one_go(self):
+        data = bytes(range(256)) * 40
+        chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+        assert encode_data_url(chunks, 'image/png') == 'data:image/png;base64,' + base64.b64encode(data).decode()
+
+class TestConvertToJpeg:
+    def test_flattens_transparency(self):
+        jpeg = Image.open(convert_to_jpeg(image_upload(mode='RGBA')))
+        assert (jpeg.format, jpeg.mode) == ('JPEG', 'RGB')
+
+    def test_caps_dimensions(self, settings):
+        settings.PHOTO_MAX_DIMENSION = 100
+        jpeg = Image.open(convert_to_jpeg(image_upload(size=(400, 200))))
+        assert jpeg.size == (100, 50)
+
+class TestVisionDerivative:
+    def test_fits_what_the_model_looks_at(self):
+        img = open_image(image_upload(size=(4032, 3024)))
+        derivative = Image.open(vision_derivative(img))
+        assert derivative.size == (1024, 768)
+
+    def test_small_images_keep_their_size(self):
+        img = open_image(image_upload(size=(300, 200)))
+        assert Image.open(vision_derivative(img)).size == (300, 200)
+
+    def test_grayscale_for_printed_cards(self, settings):
+        settings.VISION_IMAGE_GRAYSCALE = True
+        settings.VISION_IMAGE_CONTRAST = 1.5
+        derivative = Image.open(vision_derivative(open_image(image_upload())))
+        assert derivative.mode == 'L'
@@ -0,0 +1,78 @@
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from main.context_processors import latest_meal_plan
+from .test_base import MealPlanTestCase
+from .factories import MealFactory, RecipeFactory, IngredientFactory, MembershipFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+class TestPageQueryBudgets(MealPlanTestCase):
+    """Pages should cost a fixed number of queries no matter how many meals, recipes or members they show"""
+
+    @pytest.fixture(autouse=True)
+    def setup_large_plan(self, meal_plan_setup, query_budget):
+        self.query_budget = query_budget
+        for _ in range(20):
+            meal = MealFactory(collection=self.collection)
+            for recipe in RecipeFactory.create_batch(3, meal=meal):
+                IngredientFactory.create_batch(10, recipe=recipe)
+            self.meal_plan.meals.add(meal)
+        for _ in range(10):
+            MembershipFactory(user=UserFactory(), meal_plan=self.meal_plan)
+
+        self.big_meal = MealFactory(collection=self.collection)
+        for recipe in RecipeFactory.create_batch(5, meal=self.big_meal):
+            IngredientFactory.create_batch(20, recipe=recipe)
+
+    def get_within_budget(self, url):
+        self.login_user(self.user)
+        with self.query_budget():
+            response = self.client.get(url)
+        assert response.status_code == 200
+        return response
+
+    def test_collection_detail(self):
+        response = self.get_within_budget(reverse('main:collection_detail', kwargs={'pk': self.collection.pk}))
+        assert response.content.decode().count('bi-check-circle-fill') == 20
+
+    def test_meal_detail(self):
+        response = self.get_within_budget(reverse('main:meal_detail', kwargs={'pk': self.big_meal.pk}))
+        assert response.content.decode().count('list-group-item d-flex') == 100
+
+    def test_meal_plan_detail(self):
+        response = self.get_within_budget(reverse('main:meal_plan_detail', kwargs={'shareable_link': self.meal_plan.shareable_link}))
+        assert len(response.context['other_members']) == 11
+
+    def test_collection_list(self):
+        self.get_within_budget(reverse('main:collection_list'))
+
+class TestLatestMealPlanLookup(MealPlanTestCase):
+    """The latest meal plan is looked up once per request and only when something uses it"""
+
+    def latest_plan_queries(self, context):
+        return [query for query in context.captured_queries if '"joined_at" DESC' in query['sql']]
+
+    def test_looked_up_once_per_page(self):
+        self.login_user(self.user)
+        for url in [
+            reverse('main:collection_list'),
+            reverse('main:collection_detail', kwargs={'pk': self.collection.pk}),
+            reverse('main:meal_detail', kwargs={'pk': self.meal.pk}),
+        ]:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            assert response.status_code == 200
+            assert len(self.latest_plan_queries(context)) == 1, url
+
+    def test_not_looked_up_until_used(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with CaptureQueriesContext(connection) as context:
+            plan = latest_meal_plan(request)['latest_meal_plan']
+        assert len(context) == 0
+
+        assert plan.shareable_link == self.meal_plan.shareable_link
+        assert latest_meal_plan(request)['latest_meal_plan'] is plan
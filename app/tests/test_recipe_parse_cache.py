@@ -0,0 +1,83 @@
+import json
+import pytest
+from datetime import timedelta
+from unittest.mock import patch
+from django.utils import timezone
+from .test_base import BaseTestCase
+from .test_recipe_fixtures import get_mock_recipe_text, get_mock_parsed_recipe
+
+pytestmark = pytest.mark.django_db
+
+class TestRecipeParseCache(BaseTestCase):
+    def mock_openai(self, mock_openai):
+        mock_chat = mock_openai.return_value.chat.completions
+        mock_chat.create.return_value.choices[0].message.content = json.dumps(get_mock_parsed_recipe())
+        return mock_chat
+
+    def test_repeat_parse_hits_cache(self):
+        """Test that parsing the same text twice only calls the AI once"""
+        from main.ai_helpers import parse_recipe_with_genai
+        from main.caches import flush_cache_stats
+        from main.models import CacheCounter
+
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            mock_chat = self.mock_openai(mock_openai)
+            first = parse_recipe_with_genai(raw_text=get_mock_recipe_text())
+            second = parse_recipe_with_genai(raw_text=get_mock_recipe_text())
+
+        assert mock_chat.create.call_count == 1
+        assert first == second
+        flush_cache_stats()
+        counter = CacheCounter.objects.get(name='recipe_parse')
+        assert counter.hits == 1
+        assert counter.misses == 1
+
+    def test_whitespace_changes_share_key(self):
+        """Test that reformatted text maps to the same cache key"""
+        from main.ai_cache import recipe_parse_cache_key
+
+        key = recipe_parse_cache_key("Pancakes\n\n  2 cups flour", [], 'v1')
+        assert key == recipe_parse_cache_key("Pancakes 2 cups   flour\n", [], 'v1')
+        assert key != recipe_parse_cache_key("Pancakes 3 cups flour", [], 'v1')
+        assert key != recipe_parse_cache_key("Pancakes 2 cups flour", [], 'v2')
+        assert key != recipe_parse_cache_key("Pancakes 2 cups flour", ['https://example.com/a.jpg'], 'v1')
+
+    def test_signed_photo_urls_share_key(self):
+        """Test that re-signing an S3 photo URL doesn't change its key"""
+        from main.ai_cache import recipe_parse_cache_key
+
+        storage = type('S3Storage', (), {'bucket_name': 'our-meals', 'custom_domain': None, 'location': ''})()
+        url = 'https://our-meals.s3.amazonaws.com/recipe_photos/cake.jpg?X-Amz-Signature='
+        with patch('main.images.default_storage', storage):
+            key = recipe_parse_cache_key('', [url + 'abc'], 'v1')
+            assert key == recipe_parse_cache_key('', [url + 'def'], 'v1')
+            assert key != recipe_parse_cache_key('', [url.replace('cake', 'pie') + 'abc'], 'v1')
+
+    def test_expired_entries_are_not_used(self):
+        """Test that entries older than the TTL are treated as misses"""
+        from main.ai_helpers import parse_recipe_with_genai
+        from main.models import RecipeParseCacheEntry
+
+        with patch('main.ai_helpers.get_openai_client') as mock_openai:
+            mock_chat = self.mock_openai(mock_openai)
+            parse_recipe_with_genai(raw_text=get_mock_recipe_text())
+            RecipeParseCacheEntry.objects.update(created_at=timezone.now() - timedelta(days=365))
+            parse_recipe_with_genai(raw_text=get_mock_recipe_text())
+
+        assert mock_chat.create.call_count == 2
+        assert RecipeParseCacheEntry.objects.count() == 1
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache is trimmed to its maximum size by last use"""
+        from main.ai_cache import store_parse, get_cached_parse
+        from main.models import RecipeParseCacheEntry
+
+        with self.settings(AI_PARSE_CACHE_MAX_ENTRIES=2):
+            store_parse('a', {'title': 'A'})
+            store_parse('b', {'title': 'B'})
+            RecipeParseCacheEntry.objects.filter(key='a').update(last_used_at=timezone.now() + timedelta(minutes=1))
+            store_parse('c', {'title': 'C'})
+
+        assert set(RecipeParseCacheEntry.objects.values_list('key', flat=True)) == {'a', 'c'}
+        assert get_cached_parse('b') is None
+        assert get_cached_parse('a') == {'title': 'A'}
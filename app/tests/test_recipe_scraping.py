@@ -4,6 +4,7 @@ from django.urls import reverse
 from .test_base import BaseTestCase
 from .factories import UserFactory, CollectionFactory
 from .test_recipe_fixtures import get_mock_recipe_text, get_mock_parsed_recipe
+from main.models import Ingredient, MethodStep
 
 pytestmark = pytest.mark.django_db
 
@@ -19,8 +20,8 @@ class TestRecipeScraping(BaseTestCase):
         """Test successful recipe scraping"""
         self.login_user(self.user)
         
-        with patch('main.views.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
-             patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.scraping.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             response = self.client.post(
                 reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
                 {'recipe_text_and_urls': self.url}
@@ -34,8 +35,8 @@ class TestRecipeScraping(BaseTestCase):
         self.login_user(self.user)
         recipe_text = "My favorite recipe:\n\n" + self.url + "\n\nNotes: Cook for 30 mins"
         
-        with patch('main.views.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
-             patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.scraping.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             response = self.client.post(
                 reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
                 {'recipe_text_and_urls': recipe_text}
@@ -48,8 +49,8 @@ class TestRecipeScraping(BaseTestCase):
         """Test recipe scraping via AJAX"""
         self.login_user(self.user)
         
-        with patch('main.views.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
-             patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.scraping.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             response = self.client.post(
                 reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
                 {'recipe_text_and_urls': self.url},
@@ -66,7 +67,7 @@ class TestRecipeScraping(BaseTestCase):
         """Test scraping with invalid URL"""
         self.login_user(self.user)
         
-        with patch('main.views.get_recipe_text_from_url', side_effect=ValueError('Failed to access the recipe URL: Invalid URL')):
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=ValueError('Failed to access the recipe URL: Invalid URL')):
             response = self.client.post(
                 reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
                 {'recipe_text_and_urls': 'https://notarealwebsite.com/recipe'},
@@ -82,7 +83,7 @@ class TestRecipeScraping(BaseTestCase):
         """Test scraping with server error"""
         self.login_user(self.user)
         
-        with patch('main.views.get_recipe_text_from_url', side_effect=Exception('Server error')):
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=Exception('Server error')):
             response = self.client.post(
                 reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
                 {'recipe_text_and_urls': self.url},
@@ -101,8 +102,8 @@ class TestRecipeScraping(BaseTestCase):
         allowed_user.memberships.create(meal_plan=self.collection.user.memberships.first().meal_plan)
         self.login_user(allowed_user)
 
-        with patch('main.views.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
-             patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.scraping.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             response = self.client.post(
                 reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
                 {'recipe_text_and_urls': self.url}
@@ -261,3 +262,395 @@ class TestRecipeDataSaving(BaseTestCase):
         assert recipe.description == ''
         assert recipe.ingredients.count() == 0
         assert recipe.method_steps.count() == 0
+
+    def large_meal_data(self, recipe_count, ingredient_count):
+        return {
+            'title': 'Feast',
+            'recipes': [
+                {
+                    'title': f'Part {r}',
+                    'ingredients': [{'name': f'ingredient {r}-{i}', 'amount': str(i), 'unit': 'g'} for i in range(ingredient_count)],
+                    'method': [f'Step {r}-{i}' for i in range(ingredient_count)],
+                }
+                for r in range(recipe_count)
+            ]
+        }
+
+    def test_save_recipe_query_count_is_constant(self):
+        """Test that saving a meal takes the same number of queries however many ingredients it has"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main.ai_helpers import save_parsed_recipe
+
+        with CaptureQueriesContext(connection) as small:
+            save_parsed_recipe(self.large_meal_data(1, 2), collection=self.collection)
+        with CaptureQueriesContext(connection) as large:
+            meal, _ = save_parsed_recipe(self.large_meal_data(3, 40), collection=self.collection)
+
+        # Savepoint, meal, recipes, ingredients, steps, release
+        assert len(large.captured_queries) == len(small.captured_queries) == 6
+        assert [r.title for r in meal.recipes.order_by('id')] == ['Part 0', 'Part 1', 'Part 2']
+        recipe = meal.recipes.get(title='Part 2')
+        assert list(recipe.ingredients.order_by('id').values_list('name', flat=True)[:2]) == ['ingredient 2-0', 'ingredient 2-1']
+        assert recipe.method_steps.count() == 40
+
+    def test_update_only_writes_changed_rows(self):
+        """Test that fixing one ingredient updates just that row and keeps every PK"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main.ai_helpers import save_parsed_recipe
+
+        data = self.large_meal_data(2, 20)
+        meal, _ = save_parsed_recipe(data, collection=self.collection)
+        recipe_ids = list(meal.recipes.order_by('id').values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.filter(recipe__meal=meal).order_by('id').values_list('id', flat=True))
+        step_ids = list(MethodStep.objects.filter(recipe__meal=meal).order_by('id').values_list('id', flat=True))
+
+        data['recipes'][1]['ingredients'][5]['name'] = 'fixed typo'
+        with CaptureQueriesContext(connection) as queries:
+            save_parsed_recipe(data, meal=meal)
+
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'DELETE'))]
+        assert len(updates) == 2  # The meal and the one ingredient
+        assert writes == []
+        assert list(meal.recipes.order_by('id').values_list('id', flat=True)) == recipe_ids
+        assert list(Ingredient.objects.filter(recipe__meal=meal).order_by('id').values_list('id', flat=True)) == ingredient_ids
+        assert list(MethodStep.objects.filter(recipe__meal=meal).order_by('id').values_list('id', flat=True)) == step_ids
+        assert Ingredient.objects.get(pk=ingredient_ids[25]).name == 'fixed typo'
+
+    def test_update_adds_and_removes_rows(self):
+        """Test that added and removed recipes, ingredients and steps are reconciled"""
+        from main.ai_helpers import save_parsed_recipe
+
+        data = self.large_meal_data(2, 3)
+        meal, _ = save_parsed_recipe(data, collection=self.collection)
+        first_recipe = meal.recipes.order_by('id').first()
+
+        data['recipes'] = data['recipes'][:1] + self.large_meal_data(2, 1)['recipes'][1:] + self.large_meal_data(3, 2)['recipes'][2:]
+        data['recipes'][0]['ingredients'].pop()
+        data['recipes'][0]['method'].append('Serve')
+        save_parsed_recipe(data, meal=meal)
+
+        recipes = list(meal.recipes.order_by('id'))
+        assert [r.title for r in recipes] == ['Part 0', 'Part 1', 'Part 2']
+        assert recipes[0].pk == first_recipe.pk
+        assert [i.name for i in recipes[0].ingredients.order_by('id')] == ['ingredient 0-0', 'ingredient 0-1']
+        assert [s.description for s in recipes[0].method_steps.order_by('id')] == ['Step 0-0', 'Step 0-1', 'Step 0-2', 'Serve']
+        assert [i.name for i in recipes[1].ingredients.order_by('id')] == ['ingredient 1-0']
+        assert [i.name for i in recipes[2].ingredients.order_by('id')] == ['ingredient 2-0', 'ingredient 2-1']
+
+        save_parsed_recipe({'title': 'Empty', 'recipes': []}, meal=meal)
+        assert not meal.recipes.exists()
+        assert not Ingredient.objects.filter(recipe__meal=meal).exists()
+
+
+class TestRecipeImportJobs(BaseTestCase):
+    @pytest.fixture(autouse=True)
+    def setup_jobs(self, base_setup):
+        """Set up test data for each test."""
+        self.user = UserFactory()
+        self.collection = CollectionFactory(user=self.user)
+        self.url = 'https://example.com/recipe'
+
+    def test_scrape_recipe_queues_job_with_redis(self):
+        """Test that the scrape view returns 202 and pushes the job id onto redis"""
+        from main.jobs import RECIPE_IMPORT_QUEUE
+        from main.models import RecipeImportJob
+        self.login_user(self.user)
+
+        with self.settings(RECIPE_IMPORT_BACKEND='redis'), \
+             patch('main.jobs.get_redis_client') as mock_redis, \
+             patch('main.jobs.parse_recipe_with_genai') as mock_parse, \
+             self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('main:scrape', kwargs={'collection_id': self.collection.id}),
+                {'recipe_text_and_urls': self.url},
+                HTTP_ACCEPT='application/json'
+            )
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data['status'] == 'pending'
+        job = RecipeImportJob.objects.get(id=data['job_id'])
+        assert job.status == RecipeImportJob.PENDING
+        assert job.raw_text == self.url
+        assert data['status_url'] == reverse('main:recipe_import_status', args=[job.id])
+        mock_redis.return_value.rpush.assert_called_once_with(RECIPE_IMPORT_QUEUE, str(job.id))
+        mock_parse.assert_not_called()
+
+    def test_run_job_then_poll_status(self):
+        """Test that a worker-run job reports success through the status endpoint"""
+        from main.jobs import run_recipe_import_job
+        from main.models import RecipeImportJob
+        self.login_user(self.user)
+        job = RecipeImportJob.objects.create(user=self.user, collection=self.collection, raw_text=self.url)
+        status_url = reverse('main:recipe_import_status', args=[job.id])
+
+        response = self.client.get(status_url)
+        assert response.status_code == 202
+        assert response.json()['status'] == 'pending'
+
+        with patch('main.scraping.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+            job = run_recipe_import_job(job.id)
+
+        assert job.status == RecipeImportJob.SUCCEEDED
+        assert job.meal.collection == self.collection
+
+        response = self.client.get(status_url)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == 'success'
+        assert data['redirect'] == reverse('main:meal_detail', args=[job.meal.id])
+
+    def test_run_job_records_failure(self):
+        """Test that scraping errors are stored on the job and reported when polled"""
+        from main.jobs import run_recipe_import_job
+        from main.models import RecipeImportJob
+        self.login_user(self.user)
+        job = RecipeImportJob.objects.create(user=self.user, collection=self.collection, raw_text=self.url)
+
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=ValueError('Failed to access the recipe URL: 404')):
+            job = run_recipe_import_job(job.id)
+
+        assert job.status == RecipeImportJob.FAILED
+        response = self.client.get(reverse('main:recipe_import_status', args=[job.id]))
+        assert response.status_code == 400
+        assert 'Failed to access the recipe URL' in response.json()['message']
+
+    def test_run_job_only_once(self):
+        """Test that a job delivered twice is only processed once"""
+        from main.jobs import run_recipe_import_job
+        from main.models import RecipeImportJob
+        job = RecipeImportJob.objects.create(user=self.user, collection=self.collection, raw_text='Some recipe')
+
+        with patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()) as mock_parse:
+            run_recipe_import_job(job.id)
+            run_recipe_import_job(job.id)
+
+        assert mock_parse.call_count == 1
+        assert self.collection.meals.count() == 1
+
+    def test_interrupted_jobs_are_failed(self):
+        """Test that running jobs whose worker stopped reporting are failed, but live ones aren't"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from main.jobs import fail_stale_recipe_imports
+        from main.models import RecipeImportJob
+        stale = RecipeImportJob.objects.create(user=self.user, collection=self.collection, status=RecipeImportJob.RUNNING)
+        live = RecipeImportJob.objects.create(user=self.user, collection=self.collection, status=RecipeImportJob.RUNNING)
+        RecipeImportJob.objects.filter(id=stale.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        assert fail_stale_recipe_imports() == 1
+
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        assert stale.status == RecipeImportJob.FAILED
+        assert 'interrupted' in stale.error
+        assert live.status == RecipeImportJob.RUNNING
+
+    def test_worker_fails_jobs_that_go_stale_while_it_waits(self):
+        """Test that a job orphaned just before the worker restarted is failed once it passes the threshold"""
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from main.models import RecipeImportJob
+        job = RecipeImportJob.objects.create(user=self.user, collection=self.collection, status=RecipeImportJob.RUNNING)
+
+        def blpop(*args, **kwargs):
+            job.refresh_from_db()
+            if job.status != RecipeImportJob.RUNNING:
+                raise KeyboardInterrupt
+            # Still fresh when the worker started, stale by its first idle poll
+            RecipeImportJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+            return None
+
+        with patch('main.management.commands.recipe_import_worker.get_redis_client') as mock_redis, \
+                patch('main.management.commands.recipe_import_worker.close_old_connections'):
+            mock_redis.return_value.blpop.side_effect = blpop
+            with pytest.raises(KeyboardInterrupt):
+                call_command('recipe_import_worker')
+
+        assert job.status == RecipeImportJob.FAILED
+
+    def test_polling_fails_a_stale_job(self):
+        """Test that the importer hears about an inline job whose web process died"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from main.models import RecipeImportJob
+        job = RecipeImportJob.objects.create(user=self.user, collection=self.collection, status=RecipeImportJob.RUNNING)
+        RecipeImportJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.login_user(self.user)
+        response = self.client.get(reverse('main:recipe_import_status', kwargs={'job_id': job.id}), HTTP_ACCEPT='application/json')
+
+        assert 'interrupted' in response.json()['message']
+
+    def test_status_only_visible_to_job_owner(self):
+        """Test that other users cannot poll someone else's import"""
+        from main.models import RecipeImportJob
+        job = RecipeImportJob.objects.create(user=self.user, collection=self.collection, raw_text=self.url)
+        self.create_and_login_user()
+
+        response = self.client.get(reverse('main:recipe_import_status', args=[job.id]))
+        assert response.status_code == 404
+
+
+class TestConcurrentFetching(BaseTestCase):
+    def test_urls_fetched_once_in_original_order(self):
+        """Test that repeated URLs are fetched once and results keep the pasted order"""
+        from main.scraping import get_recipe_texts_from_urls
+        urls = ['https://a.example.com/1', 'https://b.example.com/2', 'https://a.example.com/1', 'https://c.example.com/3']
+
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=lambda url: f"text for {url}") as mock_get:
+            results = get_recipe_texts_from_urls(urls)
+
+        assert mock_get.call_count == 3
+        assert list(results) == ['https://a.example.com/1', 'https://b.example.com/2', 'https://c.example.com/3']
+        assert results['https://b.example.com/2'] == 'text for https://b.example.com/2'
+
+    def test_expand_recipe_urls_substitutes_each_url(self):
+        """Test that each URL in the text is replaced with its page text"""
+        from main.scraping import expand_recipe_urls
+        text = "Main: https://a.example.com/main\nSide: https://b.example.com/side"
+
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=lambda url: f"recipe from {url[8:]}"):
+            expanded = expand_recipe_urls(text)
+
+        assert "## https://a.example.com/main\n\nrecipe from a.example.com/main" in expanded
+        assert "## https://b.example.com/side\n\nrecipe from b.example.com/side" in expanded
+
+    def test_overall_deadline(self):
+        """Test that a slow page fails the import once the deadline passes"""
+        import threading
+        from main.scraping import get_recipe_texts_from_urls
+        release = threading.Event()
+
+        def slow_get(url):
+            if 'slow' in url:
+                release.wait(5)
+            return url
+
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=slow_get), \
+             patch('main.scraping.FETCH_DEADLINE', 0.1):
+            with pytest.raises(ValueError, match='timed out fetching https://slow.example.com'):
+                get_recipe_texts_from_urls(['https://fast.example.com', 'https://slow.example.com'])
+        release.set()
+
+    def test_response_size_cap(self):
+        """Test that pages over the size cap are refused"""
+        from main.scraping import get_recipe_text_from_url
+
+        with patch('main.scraping.session.get') as mock_get, \
+             patch('main.scraping.FETCH_MAX_BYTES', 1024):
+            response = mock_get.return_value.__enter__.return_value
+            response.iter_content.return_value = [b'x' * 512] * 4
+            with pytest.raises(ValueError, match='Failed to access the recipe URL: Page is larger than'):
+                get_recipe_text_from_url('https://example.com/huge')
+
+        assert mock_get.call_args.kwargs['timeout']
+
+
+class TestPageCache(BaseTestCase):
+    url = 'https://example.com/cached-recipe'
+    html = '<html><body><nav>Menu</nav><article><h1>Soup</h1><script>x()</script><p>Boil water</p></article></body></html>'
+
+    @pytest.fixture(autouse=True)
+    def clear_page_cache(self, base_setup):
+        from main.scraping import page_cache
+        page_cache.clear()
+        yield
+        page_cache.clear()
+
+    def test_fresh_page_served_from_cache(self):
+        """Test that a recently fetched page isn't requested again"""
+        from main.scraping import get_recipe_text_from_url
+
+        with patch('main.scraping.fetch_url', return_value=(200, self.html, {'ETag': '"v1"'})) as mock_fetch:
+            first = get_recipe_text_from_url(self.url)
+            second = get_recipe_text_from_url(self.url)
+
+        assert 'Boil water' in first
+        assert 'x()' not in first
+        assert first == second
+        assert mock_fetch.call_count == 1
+
+    def test_stale_page_revalidated_with_conditional_get(self):
+        """Test that a stale page sends its validators and reuses the text on a 304"""
+        from main.scraping import get_recipe_text_from_url
+
+        with patch('main.scraping.fetch_url', return_value=(200, self.html, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})):
+            first = get_recipe_text_from_url(self.url)
+
+        with patch('main.scraping.PAGE_CACHE_FRESH_SECONDS', 0), \
+             patch('main.scraping.fetch_url', return_value=(304, None, {})) as mock_fetch, \
+             patch('main.scraping.extract_page') as mock_extract:
+            second = get_recipe_text_from_url(self.url)
+
+        assert second == first
+        mock_extract.assert_not_called()
+        headers = mock_fetch.call_args.args[1]
+        assert headers['If-None-Match'] == '"v1"'
+        assert headers['If-Modified-Since'] == 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+    def test_stale_page_replaced_when_changed(self):
+        """Test that a changed page replaces the cached text"""
+        from main.scraping import get_recipe_text_from_url
+
+        with patch('main.scraping.fetch_url', return_value=(200, self.html, {'ETag': '"v1"'})):
+            get_recipe_text_from_url(self.url)
+
+        updated = self.html.replace('Boil water', 'Simmer stock')
+        with patch('main.scraping.PAGE_CACHE_FRESH_SECONDS', 0), \
+             patch('main.scraping.fetch_url', return_value=(200, updated, {'ETag': '"v2"'})):
+            assert 'Simmer stock' in get_recipe_text_from_url(self.url)
+
+    def test_lru_cache_bounded_by_size(self):
+        """Test that the least recently used entries are evicted past the size limit"""
+        from main.utils import LRUCache
+
+        cache = LRUCache(10)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        cache.get('a')
+        cache.set('c', 'cccc')
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 'aaaa'
+        assert cache.get('c') == 'cccc'
+        assert cache.size == 8
+
+        cache.set('huge', 'x' * 11)
+        assert cache.get('huge') is None
+
+
+class TestHtmlParsing(BaseTestCase):
+    def test_strip_non_content_keeps_json_ld(self):
+        """Test that scripts, styles and comments are removed but JSON-LD survives"""
+        from main.scraping import strip_non_content
+        html = (
+            '<head><script>track()</script><SCRIPT type="text/javascript">a < b</SCRIPT>'
+            '<script type="application/ld+json">{"@type": "Recipe"}</script>'
+            '<style>p { color: red }</style></head>'
+            '<body><!-- ad -- slot --><svg><path d="M0"/></svg><p>Boil water</p><noscript>Enable JS</noscript></body>'
+        )
+
+        stripped = strip_non_content(html)
+
+        assert stripped == '<head><script type="application/ld+json">{"@type": "Recipe"}</script></head><body><p>Boil water</p></body>'
+
+    def test_parser_backends_agree(self):
+        """Test that every available backend extracts the same recipe from the fixture pages"""
+        import glob
+        import os
+        from main.scraping import extract_page, available_html_parser
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', 'recipe_pages', '*.html'))
+
+        for path in pages:
+            with open(path, encoding='utf-8') as f:
+                html = f.read()
+            results = [extract_page(html, parser=backend) for backend in {'html.parser', available_html_parser()}]
+            assert all(' '.join(r['text'].split()) == ' '.join(results[0]['text'].split()) for r in results)
+            assert all(r['recipe'] == results[0]['recipe'] for r in results)
+            assert 'renderAd' not in results[0]['text']
@@ -23,8 +23,8 @@ class TestRecipeUI(UITestBase, StaticLiveServerTestCase):
         self.setup_user_session(self.page, user)
 
         # Mock the scraping to take a moment to simulate loading
-        with patch('main.views.get_recipe_text_from_url', side_effect=get_mock_delayed_response), \
-             patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=get_mock_delayed_response), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             
             # Act - Go to collection detail page
             self.page.goto(f"{self.live_server.url}{reverse('main:collection_detail', args=[collection.id])}")
@@ -49,7 +49,7 @@ class TestRecipeUI(UITestBase, StaticLiveServerTestCase):
         self.setup_user_session(self.page, user)
         
         # Mock scraping to fail
-        with patch('main.views.get_recipe_text_from_url', side_effect=ValueError("Failed to fetch: Invalid URL")):
+        with patch('main.scraping.get_recipe_text_from_url', side_effect=ValueError("Failed to fetch: Invalid URL")):
             # Act - Go to collection detail page
             self.page.goto(f"{self.live_server.url}{reverse('main:collection_detail', args=[collection.id])}")
             self.wait_for_page_load(self.page)
@@ -77,8 +77,8 @@ class TestRecipeUI(UITestBase, StaticLiveServerTestCase):
         self.setup_user_session(self.page, user)
         
         # Mock the OpenAI call
-        with patch('main.views.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
-             patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.scraping.get_recipe_text_from_url', return_value=get_mock_recipe_text()), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             
             # Act - Go to collection detail page
             self.page.goto(f"{self.live_server.url}{reverse('main:collection_detail', args=[collection.id])}")
@@ -122,7 +122,7 @@ class TestRecipeUI(UITestBase, StaticLiveServerTestCase):
         self.setup_user_session(self.page, user)
         
         # Mock the OpenAI call
-        with patch('main.views.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
+        with patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()):
             # Act - Go to collection detail page
             self.page.goto(f"{self.live_server.url}{reverse('main:collection_detail', args=[collection.id])}")
             self.wait_for_page_load(self.page)
@@ -0,0 +1,84 @@
+import os
+import pytest
+from io import BytesIO
+from unittest.mock import patch
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from PIL import Image
+from .factories import UserFactory, CollectionFactory
+from main.renditions import generate_renditions, renditions_are_current
+
+def photo_file(size=(1600, 1200)):
+    output = BytesIO()
+    Image.new('RGB', size, 'orange').save(output, format='JPEG')
+    return SimpleUploadedFile('cover.jpg', output.getvalue(), content_type='image/jpeg')
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.IMAGE_RENDITION_WIDTHS = [320, 640, 1280]
+    return tmp_path
+
+def collection_with_photo(size=(1600, 1200)):
+    with patch('main.signals.queue_renditions') as queue_renditions:
+        collection = CollectionFactory(user=UserFactory(), photo=photo_file(size))
+    return collection, queue_renditions
+
+def render_photo(collection):
+    template = Template('{% load photos %}{% responsive_photo collection sizes="33vw" class="card-img-top" alt=collection.title %}')
+    return template.render(Context({'collection': collection}))
+
+@pytest.mark.django_db
+class TestRenditions:
+    def test_saving_a_photo_queues_renditions(self, media_root):
+        collection, queue_renditions = collection_with_photo()
+        queue_renditions.assert_called_once_with(collection)
+
+    def test_generates_each_width_in_webp_and_jpeg(self, media_root):
+        collection, _ = collection_with_photo()
+        generate_renditions(collection)
+
+        collection.refresh_from_db()
+        renditions = collection.photo_renditions
+        assert renditions_are_current(collection)
+        assert sorted(renditions['webp'], key=int) == ['320', '640', '1280']
+        assert Image.open(os.path.join(media_root, renditions['jpeg']['320'])).size == (320, 240)
+        assert Image.open(os.path.join(media_root, renditions['webp']['640'])).format == 'WEBP'
+
+    def test_small_photos_are_not_upscaled(self, media_root):
+        collection, _ = collection_with_photo(size=(400, 300))
+        renditions = generate_renditions(collection)
+        assert sorted(renditions['jpeg'], key=int) == ['320', '400']
+
+    def test_tag_renders_srcsets(self, media_root):
+        collection, _ = collection_with_photo()
+        generate_renditions(collection)
+
+        html = render_photo(collection)
+        assert '<source type="image/webp" srcset="' in html
+        assert '.320w.webp 320w' in html and '.1280w.jpg 1280w' in html
+        assert 'sizes="33vw"' in html and 'class="card-img-top"' in html
+        assert 'loading="lazy"' in html
+
+    def test_tag_falls_back_to_the_photo_until_renditions_exist(self, media_root):
+        collection, _ = collection_with_photo()
+        generate_renditions(collection)
+
+        with patch('main.signals.queue_renditions'):
+            collection.photo = photo_file()
+            collection.save()
+
+        html = render_photo(collection)
+        assert '<picture>' not in html
+        assert f'src="{collection.photo.url}"' in html
+
+@pytest.mark.django_db(transaction=True)
+def test_generate_renditions_command(media_root):
+    collections = [collection_with_photo()[0] for _ in range(3)]
+
+    call_command('generate_renditions', '--workers', '2')
+
+    for collection in collections:
+        collection.refresh_from_db()
+        assert renditions_are_current(collection)
@@ -0,0 +1,125 @@
+import os
+import pytest
+from unittest.mock import patch
+from bs4 import BeautifulSoup
+from .test_base import BaseTestCase
+from .factories import UserFactory, CollectionFactory
+
+pytestmark = pytest.mark.django_db
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'recipe_pages')
+
+def load_page(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+class TestIngredientParsing:
+    @pytest.mark.parametrize('line, expected', [
+        ('2 1/4 cups all-purpose flour', {'name': 'all-purpose flour', 'amount': '2.25', 'unit': 'cup'}),
+        ('1½ lbs boneless chicken thighs', {'name': 'boneless chicken thighs', 'amount': '1.5', 'unit': 'lb'}),
+        ('2 tablespoons olive oil', {'name': 'olive oil', 'amount': '2', 'unit': 'tbsp'}),
+        ('2-3 cloves garlic', {'name': 'garlic', 'amount': '2-3', 'unit': 'clove'}),
+        ('200g of butter', {'name': 'butter', 'amount': '200', 'unit': 'g'}),
+        ('1 (400g) can tomatoes', {'name': '(400g) can tomatoes', 'amount': '1', 'unit': ''}),
+        ('2 eggs', {'name': 'eggs', 'amount': '2', 'unit': ''}),
+        ('Salt &amp; pepper to taste', {'name': 'Salt & pepper to taste', 'amount': None, 'unit': ''}),
+    ])
+    def test_parse_ingredient_line(self, line, expected):
+        from main.structured_recipes import parse_ingredient_line
+        assert parse_ingredient_line(line) == expected
+
+class TestStructuredRecipeExtraction:
+    def test_json_ld_graph(self):
+        """Test that a Recipe nested in an @graph with sections is mapped to our shape"""
+        from main.structured_recipes import extract_structured_recipe
+
+        recipe = extract_structured_recipe(BeautifulSoup(load_page('jsonld_recipe.html'), 'html.parser'))
+
+        assert recipe['title'] == 'Weeknight Lemon Chicken'
+        assert recipe['description'] == 'Juicy chicken thighs with a bright lemon & garlic pan sauce.'
+        assert len(recipe['ingredients']) == 6
+        assert recipe['ingredients'][0] == {'name': 'boneless chicken thighs', 'amount': '1.5', 'unit': 'lb'}
+        assert recipe['method'] == [
+            'Season the chicken with salt and pepper.',
+            'Brown the chicken in olive oil, 5 minutes per side.',
+            'Add garlic, stock and lemon juice and simmer until thickened.',
+        ]
+
+    def test_microdata(self):
+        """Test that microdata recipes are found when there's no JSON-LD"""
+        from main.structured_recipes import extract_structured_recipe
+
+        recipe = extract_structured_recipe(BeautifulSoup(load_page('microdata_recipe.html'), 'html.parser'))
+
+        assert recipe['title'] == 'Fluffy Pancakes'
+        assert recipe['ingredients'][2] == {'name': 'milk', 'amount': '1.75', 'unit': 'cup'}
+        assert len(recipe['method']) == 3
+
+    def test_incomplete_recipe_ignored(self):
+        """Test that a Recipe without a method isn't used"""
+        from main.structured_recipes import recipe_from_schema
+
+        assert recipe_from_schema({'@type': 'Recipe', 'name': 'Toast', 'recipeIngredient': ['1 slice bread']}) is None
+
+    def test_plain_page_has_no_recipe(self):
+        from main.structured_recipes import extract_structured_recipe
+
+        assert extract_structured_recipe(BeautifulSoup(load_page('plain_recipe.html'), 'html.parser')) is None
+
+class TestStructuredImport(BaseTestCase):
+    @pytest.fixture(autouse=True)
+    def setup_import(self, base_setup):
+        from main.scraping import page_cache
+        page_cache.clear()
+        self.user = UserFactory()
+        self.collection = CollectionFactory(user=self.user)
+        yield
+        page_cache.clear()
+
+    def create_job(self, raw_text, photo_urls=None):
+        from main.models import RecipeImportJob
+        return RecipeImportJob.objects.create(
+            user=self.user, collection=self.collection, raw_text=raw_text, photo_urls=photo_urls or []
+        )
+
+    def test_structured_page_skips_ai(self):
+        """Test that a URL with a schema.org recipe is imported without calling the AI"""
+        from main.jobs import run_recipe_import_job
+        job = self.create_job('https://kitchen.example.com/lemon-chicken')
+
+        with patch('main.scraping.fetch_url', return_value=(200, load_page('jsonld_recipe.html'), {})), \
+             patch('main.jobs.parse_recipe_with_genai') as mock_parse:
+            job = run_recipe_import_job(job.id)
+
+        mock_parse.assert_not_called()
+        assert job.status == job.SUCCEEDED
+        assert job.meal.title == 'Weeknight Lemon Chicken'
+        assert job.meal.url == 'https://kitchen.example.com/lemon-chicken'
+        recipe = job.meal.recipes.get()
+        assert recipe.ingredients.count() == 6
+        assert recipe.method_steps.count() == 3
+
+    def test_page_without_structured_data_uses_ai(self):
+        """Test that pages without structured data fall back to the AI"""
+        from main.jobs import run_recipe_import_job
+        from .test_recipe_fixtures import get_mock_parsed_recipe
+        job = self.create_job('https://example.com/soup')
+
+        with patch('main.scraping.fetch_url', return_value=(200, load_page('plain_recipe.html'), {})), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()) as mock_parse:
+            run_recipe_import_job(job.id)
+
+        mock_parse.assert_called_once()
+        assert '2 litres of stock' in mock_parse.call_args.kwargs['raw_text']
+
+    def test_extra_text_uses_ai(self):
+        """Test that notes alongside the URL go to the AI so they aren't lost"""
+        from main.jobs import run_recipe_import_job
+        from .test_recipe_fixtures import get_mock_parsed_recipe
+        job = self.create_job('Double the garlic https://kitchen.example.com/lemon-chicken')
+
+        with patch('main.scraping.fetch_url', return_value=(200, load_page('jsonld_recipe.html'), {})), \
+             patch('main.jobs.parse_recipe_with_genai', return_value=get_mock_parsed_recipe()) as mock_parse:
+            run_recipe_import_job(job.id)
+
+        mock_parse.assert_called_once()